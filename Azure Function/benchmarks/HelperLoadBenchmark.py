@@ -0,0 +1,142 @@
+"""Measures throughput and p50/p99 latency of the Identification and Verification helpers
+under increasing concurrency against the local MockRecognitionServer.
+
+Every level runs a fixed number of identify_file and verify_file calls from a thread pool
+of that size, and the per-phase histograms of the helpers are reported at the end. The
+subscription quota is raised so the client rate limiter does not cap the results, and
+operations are polled with a short policy matching the processing time of the mock.
+
+Usage: python benchmarks/HelperLoadBenchmark.py [<requests_per_level>] [<latency_seconds>]
+                                                [<processing_seconds>] [<throttle_rate>]
+                                                [<error_rate>]
+"""
+
+import concurrent.futures
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from engine.Identification.IdentificationServiceHttpClientHelper import \
+    IdentificationServiceHttpClientHelper
+from engine.Verification.VerificationServiceHttpClientHelper import \
+    VerificationServiceHttpClientHelper
+from engine.Recognition import ConnectionPool
+from engine.Recognition import Metrics
+from engine.Recognition import OperationPoller
+from engine.Recognition import RateLimiter
+from MockRecognitionServer import MockRecognitionServer, MockRecognitionService
+
+_SUBSCRIPTION_KEY = 'benchmark'
+_CONCURRENCY_LEVELS = (1, 2, 4, 8, 16, 32)
+_CANDIDATE_PROFILES = 10
+_AUDIO_SECONDS = 3
+
+
+def make_audio(seed):
+    """Returns a distinct 16 kHz 16-bit mono WAV clip of noise."""
+    generator = random.Random(seed)
+    pcm = bytes(generator.getrandbits(8) for _ in range(_AUDIO_SECONDS * 32000))
+    header = b'RIFF' + (36 + len(pcm)).to_bytes(4, 'little') + b'WAVEfmt ' + bytes.fromhex(
+        '1000000001000100803e0000007d00000200100064617461') + len(pcm).to_bytes(4, 'little')
+    return header + pcm
+
+
+def percentile(values, fraction):
+    """Returns the given percentile of a sorted list of values."""
+    index = min(int(round(fraction * (len(values) - 1))), len(values) - 1)
+    return values[index]
+
+
+def measure(call, clips, concurrency):
+    """Runs a call on every clip from a pool of threads.
+
+    Returns the elapsed seconds, the sorted latencies of the successful calls and the
+    number of failed calls.
+
+    Arguments:
+    call -- callable taking a clip
+    clips -- the clips to run the call on
+    concurrency -- the number of threads
+    """
+    def timed(clip):
+        started = time.monotonic()
+        try:
+            call(clip)
+        except Exception:
+            return None
+        return time.monotonic() - started
+
+    started = time.monotonic()
+    with concurrent.futures.ThreadPoolExecutor(concurrency) as executor:
+        results = list(executor.map(timed, clips))
+    elapsed = time.monotonic() - started
+    latencies = sorted(latency for latency in results if latency is not None)
+    return elapsed, latencies, len(results) - len(latencies)
+
+
+def run(requests_per_level, service):
+    server = MockRecognitionServer(service).start()
+    base_uri = server.get_base_uri()
+    RateLimiter.configure_rate_limit(_SUBSCRIPTION_KEY, 100000)
+    pool = ConnectionPool.ConnectionPool(max_connections_per_host=max(_CONCURRENCY_LEVELS))
+    polling_policy = OperationPoller.PollingPolicy(
+        initial_delay=service.processing_time, multiplier=1.5,
+        max_delay=max(0.05, service.processing_time), jitter=0.1)
+
+    identification_metrics = Metrics.HistogramMetricsSink()
+    verification_metrics = Metrics.HistogramMetricsSink()
+    identification = IdentificationServiceHttpClientHelper(
+        _SUBSCRIPTION_KEY, connection_pool=pool, polling_policy=polling_policy,
+        base_uri=base_uri, metrics_sink=identification_metrics)
+    verification = VerificationServiceHttpClientHelper(
+        _SUBSCRIPTION_KEY, base_uri=base_uri, metrics_sink=verification_metrics,
+        connection_pool=pool)
+
+    profile_ids = [identification.create_profile('en-us').get_profile_id()
+                   for _ in range(_CANDIDATE_PROFILES)]
+    verification_profile_id = verification.create_profile('en-us').get_profile_id()
+    clips = [make_audio(seed) for seed in range(requests_per_level)]
+
+    calls = [
+        ('identify_file', lambda clip: identification.identify_file(clip, profile_ids)),
+        ('verify_file', lambda clip: verification.verify_file(clip, verification_profile_id))]
+
+    print('{0} requests per level, latency {1:.3f}s, processing {2:.3f}s, '
+          '429 rate {3:.2f}, 500 rate {4:.2f}'.format(
+              requests_per_level, service.latency, service.processing_time,
+              service.throttle_rate, service.error_rate))
+    print('{0:<15}{1:>6}{2:>10}{3:>9}{4:>9}{5:>8}'.format(
+        'call', 'conc', 'req/s', 'p50', 'p99', 'failed'))
+    for name, call in calls:
+        for concurrency in _CONCURRENCY_LEVELS:
+            elapsed, latencies, failed = measure(call, clips, concurrency)
+            print('{0:<15}{1:>6}{2:>10.1f}{3:>9.3f}{4:>9.3f}{5:>8}'.format(
+                name,
+                concurrency,
+                len(clips) / elapsed,
+                percentile(latencies, 0.5) if latencies else float('nan'),
+                percentile(latencies, 0.99) if latencies else float('nan'),
+                failed))
+
+    for name, metrics_sink in (('identification', identification_metrics),
+                               ('verification', verification_metrics)):
+        print('{0} phases{1:>17}{2:>12}{3:>12}{4:>12}'.format(
+            name, 'count', 'p50', 'p99', 'max'))
+        for metric, summary in sorted(metrics_sink.get_summaries().items()):
+            print('  {0:<24}{1:>10}{2:>12.4g}{3:>12.4g}{4:>12.4g}'.format(
+                metric, summary['count'], summary['p50'], summary['p99'], summary['max']))
+    print('pool: {0}'.format(pool.get_stats()))
+    print('responses by status: {0}'.format(service.get_counts()))
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 200, MockRecognitionService(
+        latency=float(sys.argv[2]) if len(sys.argv) > 2 else 0.02,
+        processing_time=float(sys.argv[3]) if len(sys.argv) > 3 else 0.2,
+        throttle_rate=float(sys.argv[4]) if len(sys.argv) > 4 else 0.0,
+        error_rate=float(sys.argv[5]) if len(sys.argv) > 5 else 0.0,
+        seed=42))
@@ -0,0 +1,417 @@
+"""Local stand-in for the Speaker Recognition service, for load tests that must not spend
+subscription quota.
+
+Implements the identificationProfiles, identify, operations, verificationProfiles and
+verify routes of /spid/v1.0 over plain HTTP/1.1 with keep-alive. Enrollments and
+identifications answer 202 with an Operation-Location that reports running until the
+configured processing time has elapsed. Every request can be delayed by a latency with
+jitter and can be failed with 429 (with Retry-After) or 500 at configurable rates. Audio
+that is not a WAV file is rejected with 400.
+
+Point the helpers at it with base_uri='http://127.0.0.1:<port>'.
+
+Usage: python benchmarks/MockRecognitionServer.py [<port>] [<latency_seconds>]
+                                                  [<processing_seconds>] [<throttle_rate>]
+                                                  [<error_rate>]
+"""
+
+import datetime
+import hashlib
+import http.server
+import json
+import random
+import sys
+import threading
+import time
+import urllib.parse
+import uuid
+
+_API_PREFIX = '/spid/v1.0'
+_NO_MATCH_PROFILE_ID = '00000000-0000-0000-0000-000000000000'
+
+
+class MockRecognitionService:
+    """In-memory state and behaviour of the mock service."""
+
+    def __init__(self, latency=0.02, jitter=0.01, processing_time=0.2, throttle_rate=0.0,
+                 error_rate=0.0, retry_after=1, seed=None, processing_spread=0.0):
+        """Constructor of the MockRecognitionService class.
+
+        Arguments:
+        latency -- seconds every request is delayed
+        jitter -- maximum seconds added at random to the latency
+        processing_time -- seconds an operation reports running before it succeeds
+        throttle_rate -- fraction of requests answered 429
+        error_rate -- fraction of requests answered 500
+        retry_after -- the Retry-After seconds sent with 429 responses
+        seed -- the seed of the random generator, for reproducible runs
+        processing_spread -- the sigma of the log-normal distribution of the processing
+                             times around processing_time, 0 makes every operation take
+                             processing_time
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.processing_time = processing_time
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.processing_spread = processing_spread
+        self._random = random.Random(seed)
+        self._lock = threading.RLock()
+        self._identification_profiles = {}
+        self._verification_profiles = {}
+        self._operations = {}
+        self._counts = {}
+
+    def get_counts(self):
+        """Returns a dictionary of the number of responses sent per status code."""
+        with self._lock:
+            return dict(self._counts)
+
+    def handle(self, method, path, query, body):
+        """Returns the status, headers and JSON-serializable body of a request.
+
+        Arguments:
+        method -- the HTTP method
+        path -- the path of the request url
+        query -- the dictionary of query parameters
+        body -- the request body bytes
+        """
+        with self._lock:
+            delay = self.latency + self._random.random() * self.jitter
+            failure = self._random.random()
+        time.sleep(delay)
+
+        if failure < self.throttle_rate:
+            status, headers, payload = 429, {'Retry-After': str(self.retry_after)}, {
+                'error': {'code': 'RateLimitExceeded', 'message': 'Rate limit is exceeded.'}}
+        elif failure < self.throttle_rate + self.error_rate:
+            status, headers, payload = 500, {}, {
+                'error': {'code': 'InternalServerError', 'message': 'Injected failure.'}}
+        else:
+            status, headers, payload = self._route(method, path, query, body)
+
+        with self._lock:
+            self._counts[status] = self._counts.get(status, 0) + 1
+        return status, headers, payload
+
+    def _route(self, method, path, query, body):
+        """Dispatches a request to the handler of its route."""
+        if not path.startswith(_API_PREFIX):
+            return self._not_found()
+        parts = [part for part in path[len(_API_PREFIX):].split('/') if part]
+
+        if parts[:1] == ['identificationProfiles']:
+            return self._identification_profiles_route(method, parts[1:], body)
+        if parts == ['identify'] and method == 'POST':
+            return self._identify(query, body)
+        if parts[:1] == ['operations'] and len(parts) == 2 and method == 'GET':
+            return self._operation(parts[1])
+        if parts[:1] == ['verificationProfiles']:
+            return self._verification_profiles_route(method, parts[1:], body)
+        if parts == ['verify'] and method == 'POST':
+            return self._verify(query, body)
+        return self._not_found()
+
+    def _identification_profiles_route(self, method, parts, body):
+        profiles = self._identification_profiles
+        if not parts and method == 'GET':
+            with self._lock:
+                return 200, {}, list(profiles.values())
+        if not parts and method == 'POST':
+            profile_id = str(uuid.uuid4())
+            with self._lock:
+                profiles[profile_id] = {
+                    'identificationProfileId': profile_id,
+                    'locale': self._get_locale(body),
+                    'enrollmentSpeechTime': 0.0,
+                    'remainingEnrollmentSpeechTime': 30.0,
+                    'createdDateTime': _now(),
+                    'lastActionDateTime': _now(),
+                    'enrollmentStatus': 'Enrolling'}
+            return 200, {}, {'identificationProfileId': profile_id}
+
+        profile = profiles.get(parts[0])
+        if profile is None:
+            return self._not_found()
+        if len(parts) == 1 and method == 'GET':
+            return 200, {}, profile
+        if len(parts) == 1 and method == 'DELETE':
+            with self._lock:
+                profiles.pop(parts[0], None)
+            return 200, {}, None
+        if parts[1:] == ['reset'] and method == 'POST':
+            with self._lock:
+                profile.update({
+                    'enrollmentSpeechTime': 0.0,
+                    'remainingEnrollmentSpeechTime': 30.0,
+                    'lastActionDateTime': _now(),
+                    'enrollmentStatus': 'Enrolling'})
+            return 200, {}, None
+        if parts[1:] == ['enroll'] and method == 'POST':
+            if not _is_wav(body):
+                return self._invalid_audio()
+            speech_time = _get_speech_time(body)
+
+            def enroll():
+                with self._lock:
+                    profile['enrollmentSpeechTime'] += speech_time
+                    profile['remainingEnrollmentSpeechTime'] = max(
+                        0.0, 30.0 - profile['enrollmentSpeechTime'])
+                    profile['lastActionDateTime'] = _now()
+                    profile['enrollmentStatus'] = 'Enrolled'
+                    return {
+                        'enrollmentStatus': profile['enrollmentStatus'],
+                        'enrollmentSpeechTime': profile['enrollmentSpeechTime'],
+                        'remainingEnrollmentSpeechTime':
+                            profile['remainingEnrollmentSpeechTime'],
+                        'speechTime': speech_time}
+            return self._start_operation(enroll)
+        return self._not_found()
+
+    def _identify(self, query, body):
+        candidates = [profile_id for profile_id in
+                      query.get('identificationProfileIds', '').split(',') if profile_id]
+        if not candidates or len(candidates) > 10:
+            return 400, {}, {'error': {
+                'code': 'BadRequest', 'message': 'Between 1 and 10 profiles are required.'}}
+        if not _is_wav(body):
+            return self._invalid_audio()
+
+        # The identified speaker is derived from the audio so repeated clips agree
+        digest = hashlib.sha256(body).digest()
+        choice = digest[0] % (len(candidates) + 1)
+        identified = candidates[choice] if choice < len(candidates) else _NO_MATCH_PROFILE_ID
+        confidence = ('Low', 'Normal', 'High')[digest[1] % 3]
+        return self._start_operation(lambda: {
+            'identifiedProfileId': identified, 'confidence': confidence})
+
+    def _verification_profiles_route(self, method, parts, body):
+        profiles = self._verification_profiles
+        if not parts and method == 'GET':
+            with self._lock:
+                return 200, {}, list(profiles.values())
+        if not parts and method == 'POST':
+            profile_id = str(uuid.uuid4())
+            with self._lock:
+                profiles[profile_id] = {
+                    'verificationProfileId': profile_id,
+                    'locale': self._get_locale(body),
+                    'enrollmentsCount': 0,
+                    'remainingEnrollmentsCount': 3,
+                    'createdDateTime': _now(),
+                    'lastActionDateTime': _now(),
+                    'enrollmentStatus': 'Enrolling'}
+            return 200, {}, {'verificationProfileId': profile_id}
+
+        profile = profiles.get(parts[0])
+        if profile is None:
+            return self._not_found()
+        if len(parts) == 1 and method == 'GET':
+            return 200, {}, profile
+        if len(parts) == 1 and method == 'DELETE':
+            with self._lock:
+                profiles.pop(parts[0], None)
+            return 200, {}, None
+        if parts[1:] == ['reset'] and method == 'POST':
+            with self._lock:
+                profile.update({
+                    'enrollmentsCount': 0,
+                    'remainingEnrollmentsCount': 3,
+                    'lastActionDateTime': _now(),
+                    'enrollmentStatus': 'Enrolling'})
+            return 200, {}, None
+        if parts[1:] == ['enroll'] and method == 'POST':
+            if not _is_wav(body):
+                return self._invalid_audio()
+            with self._lock:
+                profile['enrollmentsCount'] += 1
+                profile['remainingEnrollmentsCount'] = max(
+                    0, profile['remainingEnrollmentsCount'] - 1)
+                if profile['remainingEnrollmentsCount'] == 0:
+                    profile['enrollmentStatus'] = 'Enrolled'
+                profile['lastActionDateTime'] = _now()
+                return 200, {}, {
+                    'enrollmentStatus': profile['enrollmentStatus'],
+                    'enrollmentsCount': profile['enrollmentsCount'],
+                    'remainingEnrollments': profile['remainingEnrollmentsCount'],
+                    'phrase': 'my voice is my passport verify me'}
+        return self._not_found()
+
+    def _verify(self, query, body):
+        if query.get('verificationProfileId') not in self._verification_profiles:
+            return self._not_found()
+        if not _is_wav(body):
+            return self._invalid_audio()
+        digest = hashlib.sha256(body).digest()
+        return 200, {}, {
+            'result': 'Accept' if digest[0] % 2 else 'Reject',
+            'confidence': ('Low', 'Normal', 'High')[digest[1] % 3],
+            'phrase': 'my voice is my passport verify me'}
+
+    def _start_operation(self, complete):
+        """Registers an operation finishing after the processing time and returns the 202
+        response pointing at it.
+
+        Arguments:
+        complete -- callable returning the processing result, called once when the
+                    operation is first observed as finished
+        """
+        operation_id = str(uuid.uuid4())
+        with self._lock:
+            processing_time = self.processing_time
+            if self.processing_spread:
+                processing_time *= self._random.lognormvariate(0, self.processing_spread)
+            self._operations[operation_id] = {
+                'due': time.monotonic() + processing_time,
+                'complete': complete,
+                'result': None,
+                'created': _now()}
+        return 202, {'Operation-Location': _API_PREFIX + '/operations/' + operation_id}, None
+
+    def _operation(self, operation_id):
+        operation = self._operations.get(operation_id)
+        if operation is None:
+            return self._not_found()
+        if time.monotonic() < operation['due']:
+            return 200, {}, {
+                'status': 'running',
+                'createdDateTime': operation['created'],
+                'lastActionDateTime': _now()}
+        with self._lock:
+            if operation['result'] is None:
+                operation['result'] = operation['complete']()
+        return 200, {}, {
+            'status': 'succeeded',
+            'createdDateTime': operation['created'],
+            'lastActionDateTime': _now(),
+            'processingResult': operation['result']}
+
+    @staticmethod
+    def _get_locale(body):
+        try:
+            return json.loads(body.decode('utf-8')).get('locale', 'en-us')
+        except ValueError:
+            return 'en-us'
+
+    @staticmethod
+    def _invalid_audio():
+        return 400, {}, {'error': {
+            'code': 'BadRequest', 'message': 'Invalid Audio Format: Not a WAVE file.'}}
+
+    @staticmethod
+    def _not_found():
+        return 404, {}, {'error': {'code': 'NotFound', 'message': 'Resource not found.'}}
+
+
+class _RequestHandler(http.server.BaseHTTPRequestHandler):
+    """Serves the MockRecognitionService of the server over HTTP/1.1 keep-alive."""
+
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, avoid the delayed ACK stall on keep-alive
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self._handle()
+
+    def do_DELETE(self):
+        self._handle()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _handle(self):
+        parsed_url = urllib.parse.urlparse(self.path)
+        query = dict(urllib.parse.parse_qsl(parsed_url.query))
+        body = self._read_body()
+
+        # Operation-Location is an absolute url on the real service
+        status, headers, payload = self.server.service.handle(
+            self.command, parsed_url.path, query, body)
+        location = headers.get('Operation-Location')
+        if location is not None:
+            headers['Operation-Location'] = 'http://{0}{1}'.format(
+                self.headers.get('Host'), location)
+
+        content = b'' if payload is None else json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _read_body(self):
+        """Reads a request body sent with either Content-Length or chunked encoding."""
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b';')[0], 16)
+                if size == 0:
+                    # Skip the trailers
+                    while self.rfile.readline() not in (b'\r\n', b'\n', b''):
+                        pass
+                    return b''.join(chunks)
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+        return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+
+class MockRecognitionServer(http.server.ThreadingHTTPServer):
+    """Threaded HTTP server of a MockRecognitionService."""
+
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, service=None, port=0):
+        """Constructor of the MockRecognitionServer class.
+
+        Arguments:
+        service -- the MockRecognitionService to serve, defaults to one with default
+                   settings
+        port -- the port to listen on, 0 picks a free port
+        """
+        super().__init__(('127.0.0.1', port), _RequestHandler)
+        self.service = service or MockRecognitionService()
+
+    def get_base_uri(self):
+        """Returns the base_uri the helpers need to target the server."""
+        return 'http://127.0.0.1:{0}'.format(self.server_address[1])
+
+    def start(self):
+        """Serves requests on a daemon thread."""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+def _is_wav(body):
+    """Returns whether a request body starts with the RIFF header of a WAV file."""
+    return body[:4] == b'RIFF' and body[8:12] == b'WAVE'
+
+
+def _get_speech_time(body):
+    """Returns the duration of 16 kHz 16-bit mono audio, ignoring the WAV header."""
+    return max(0, len(body) - 44) / 32000.0
+
+
+if __name__ == '__main__':
+    server = MockRecognitionServer(MockRecognitionService(
+        latency=float(sys.argv[2]) if len(sys.argv) > 2 else 0.02,
+        processing_time=float(sys.argv[3]) if len(sys.argv) > 3 else 0.2,
+        throttle_rate=float(sys.argv[4]) if len(sys.argv) > 4 else 0.0,
+        error_rate=float(sys.argv[5]) if len(sys.argv) > 5 else 0.0),
+        port=int(sys.argv[1]) if len(sys.argv) > 1 else 8080)
+    print('Serving the mock Speaker Recognition service on ' + server.get_base_uri())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,105 @@
+"""Compares the end-to-end identify latency of fixed 5 second polling with the adaptive
+PollingPolicy, measured on the wall clock against the local MockRecognitionServer.
+
+Every policy runs the same number of identify_file calls through the
+IdentificationServiceHttpClientHelper from a pool of threads, against a mock whose
+processing times follow a log-normal distribution around the median. The latency of a
+call runs from the upload of the audio to the identification result, and the status
+checks per operation come from the metrics of the helper.
+
+Usage: python benchmarks/PollingBenchmark.py [<operations>] [<median_processing_seconds>]
+                                             [<concurrency>] [<latency_seconds>]
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from engine.Identification.IdentificationServiceHttpClientHelper import \
+    IdentificationServiceHttpClientHelper
+from engine.Recognition import ConnectionPool
+from engine.Recognition import Metrics
+from engine.Recognition import RateLimiter
+from engine.Recognition.OperationPoller import PollingPolicy
+from HelperLoadBenchmark import make_audio, measure, percentile
+from MockRecognitionServer import MockRecognitionServer, MockRecognitionService
+
+_SUBSCRIPTION_KEY = 'benchmark'
+_CANDIDATE_PROFILES = 3
+# Sigma of the log-normal distribution of the processing times
+_PROCESSING_SPREAD = 0.6
+
+
+class FixedPollingPolicy(PollingPolicy):
+    """Replays the previous behaviour: check right away, then every 5 seconds."""
+
+    def get_delay(self, attempt, retry_after=None):
+        return 0 if attempt == 0 else 5
+
+
+def run_policy(policy, operations, median_processing_time, concurrency, latency):
+    """Runs the identifications with one polling policy against a fresh mock server and
+    returns the elapsed seconds, the sorted latencies, the number of failed calls and the
+    average number of status checks per operation.
+
+    Arguments:
+    policy -- the PollingPolicy of the helper
+    operations -- the number of identify_file calls
+    median_processing_time -- the median seconds the mock needs to finish an operation
+    concurrency -- the number of calls in flight
+    latency -- seconds every request to the mock is delayed
+    """
+    service = MockRecognitionService(
+        latency=latency, processing_time=median_processing_time,
+        processing_spread=_PROCESSING_SPREAD, seed=42)
+    server = MockRecognitionServer(service).start()
+    try:
+        metrics_sink = Metrics.HistogramMetricsSink()
+        helper = IdentificationServiceHttpClientHelper(
+            _SUBSCRIPTION_KEY,
+            connection_pool=ConnectionPool.ConnectionPool(max_connections_per_host=concurrency),
+            polling_policy=policy, base_uri=server.get_base_uri(), metrics_sink=metrics_sink)
+        profile_ids = [helper.create_profile('en-us').get_profile_id()
+                       for _ in range(_CANDIDATE_PROFILES)]
+        clips = [make_audio(seed) for seed in range(operations)]
+
+        elapsed, latencies, failed = measure(
+            lambda clip: helper.identify_file(clip, profile_ids, True), clips, concurrency)
+        checks = metrics_sink.get_summaries()[Metrics.POLL_ITERATIONS]
+        return elapsed, latencies, failed, checks['sum'] / float(checks['count'])
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def run(operations, median_processing_time, concurrency, latency):
+    RateLimiter.configure_rate_limit(_SUBSCRIPTION_KEY, 100000)
+    policies = [
+        ('fixed 5s (before)', FixedPollingPolicy()),
+        ('adaptive (after)', PollingPolicy())]
+
+    print('{0} operations, {1} in flight, median processing time {2:.2f}s, '
+          'request latency {3:.3f}s'.format(
+              operations, concurrency, median_processing_time, latency))
+    print('{0:<20}{1:>8}{2:>8}{3:>8}{4:>8}{5:>12}{6:>10}{7:>8}'.format(
+        'policy', 'p50', 'p90', 'p99', 'max', 'checks/op', 'elapsed', 'failed'))
+    for name, policy in policies:
+        elapsed, latencies, failed, checks = run_policy(
+            policy, operations, median_processing_time, concurrency, latency)
+        print('{0:<20}{1:>8.2f}{2:>8.2f}{3:>8.2f}{4:>8.2f}{5:>12.2f}{6:>10.1f}{7:>8}'.format(
+            name,
+            percentile(latencies, 0.5),
+            percentile(latencies, 0.9),
+            percentile(latencies, 0.99),
+            latencies[-1],
+            checks,
+            elapsed,
+            failed))
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 200,
+        float(sys.argv[2]) if len(sys.argv) > 2 else 1.5,
+        int(sys.argv[3]) if len(sys.argv) > 3 else 50,
+        float(sys.argv[4]) if len(sys.argv) > 4 else 0.04)
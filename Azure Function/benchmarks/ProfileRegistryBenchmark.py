@@ -0,0 +1,151 @@
+"""Compares the memory and lookup times of a ProfileRegistry with the list of
+IdentificationProfile objects returned by get_all_profiles.
+
+A synthetic listing of profiles is generated with a mix of enrollment statuses, locales
+and last action times. The list is searched by linear scans, as callers of
+get_all_profiles do, and the registry through its indexes. The incremental refresh of the
+registry with a listing in which a small fraction of the profiles changed is also timed.
+
+Usage: python benchmarks/ProfileRegistryBenchmark.py [<profiles>] [<changed_fraction>]
+"""
+
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from engine.Identification.IdentificationProfile import IdentificationProfile
+from engine.Identification.ProfileRegistry import ProfileRegistry
+
+_STATUSES = ('Enrolled', 'Enrolled', 'Enrolled', 'Enrolling', 'Training')
+_LOCALES = ('en-us', 'en-us', 'en-gb', 'zh-cn', 'fr-fr')
+_START = 1500000000
+_SPAN = 86400 * 365
+_LOOKUPS = 20
+
+
+def make_listing(count, seed):
+    """Returns a list of profile dictionaries as the service lists them."""
+    generator = random.Random(seed)
+    return [make_profile(str(uuid.UUID(int=generator.getrandbits(128))), generator)
+            for _ in range(count)]
+
+
+def make_profile(profile_id, generator):
+    created = _START + generator.random() * _SPAN
+    return {
+        'identificationProfileId': profile_id,
+        'locale': generator.choice(_LOCALES),
+        'enrollmentSpeechTime': round(generator.random() * 60, 1),
+        'remainingEnrollmentSpeechTime': round(generator.random() * 30, 1),
+        'createdDateTime': format_date_time(created),
+        'lastActionDateTime': format_date_time(created + generator.random() * 86400),
+        'enrollmentStatus': generator.choice(_STATUSES)}
+
+
+def format_date_time(seconds):
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(seconds)) + '.{0:03d}Z'.format(
+        int(seconds * 1000) % 1000)
+
+
+def measure_memory(build):
+    """Returns the result of build and the bytes it allocated and kept."""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def timed(call, repeat=_LOOKUPS):
+    """Returns the mean seconds of a call over repeated calls."""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        call()
+    return (time.perf_counter() - started) / repeat
+
+
+def run(count, changed_fraction):
+    listing = make_listing(count, 42)
+    # Both are built from the response body, so the memory includes the parsed strings
+    # each representation keeps
+    message = json.dumps(listing)
+    profiles, list_bytes = measure_memory(
+        lambda: [IdentificationProfile(profile_raw) for profile_raw in json.loads(message)])
+    registry, registry_bytes = measure_memory(lambda: build_registry(
+        IdentificationProfile(profile_raw) for profile_raw in json.loads(message)))
+
+    print('{0} profiles'.format(count))
+    print('{0:<36}{1:>14}{2:>14}'.format('', 'list', 'registry'))
+    print('{0:<36}{1:>14.1f}{2:>14.1f}'.format(
+        'memory (MiB)', list_bytes / 1048576.0, registry_bytes / 1048576.0))
+    print('{0:<36}{1:>14.1f}{2:>14.1f}'.format(
+        'bytes per profile', list_bytes / float(count), registry_bytes / float(count)))
+
+    probe_ids = [profile.get_profile_id() for profile in random.Random(1).sample(
+        profiles, min(_LOOKUPS, count))]
+    since = format_date_time(_START + _SPAN / 2)
+    until = format_date_time(_START + _SPAN / 2 + 86400 * 7)
+    lookups = [
+        ('enrolled IDs',
+         lambda: [profile.get_profile_id() for profile in profiles
+                  if profile.get_enrollment_status() == 'Enrolled'],
+         lambda: registry.get_profile_ids('Enrolled')),
+        ('enrolled en-gb IDs',
+         lambda: [profile.get_profile_id() for profile in profiles
+                  if profile.get_enrollment_status() == 'Enrolled'
+                  and profile.get_locale() == 'en-gb'],
+         lambda: registry.get_profile_ids('Enrolled', 'en-gb')),
+        ('last action within a week',
+         lambda: [profile.get_profile_id() for profile in profiles
+                  if since <= profile.get_last_action_date_time() < until],
+         lambda: registry.get_profile_ids_by_last_action(
+             _START + _SPAN / 2, _START + _SPAN / 2 + 86400 * 7)),
+        ('status of one profile',
+         lambda: [next(profile.get_enrollment_status() for profile in profiles
+                       if profile.get_profile_id() == profile_id)
+                  for profile_id in probe_ids],
+         lambda: [registry.get_enrollment_status(profile_id) for profile_id in probe_ids]),
+    ]
+    print('{0:<36}{1:>14}{2:>14}'.format('lookup (ms)', 'list scan', 'registry'))
+    for name, scan, lookup in lookups:
+        # The first lookup builds the last action index, kept until the registry changes
+        lookup()
+        print('{0:<36}{1:>14.3f}{2:>14.3f}'.format(
+            name, timed(scan) * 1000, timed(lookup) * 1000))
+
+    generator = random.Random(7)
+    changed = list(listing)
+    for index in generator.sample(range(count), int(count * changed_fraction)):
+        changed[index] = make_profile(changed[index]['identificationProfileId'], generator)
+    changed_profiles = [IdentificationProfile(profile_raw) for profile_raw in changed]
+    started = time.perf_counter()
+    build_registry(changed_profiles)
+    rebuild = time.perf_counter() - started
+    started = time.perf_counter()
+    added, updated, removed = registry.refresh(changed_profiles)
+    refresh = time.perf_counter() - started
+    print('{0:<36}{1:>14.1f}{2:>14.1f}'.format(
+        'refresh, {0:.1%} changed (ms)'.format(changed_fraction), rebuild * 1000,
+        refresh * 1000))
+    print('  (list column: rebuilding a registry; added {0}, updated {1}, removed {2})'.format(
+        added, updated, removed))
+
+
+def build_registry(profiles):
+    registry = ProfileRegistry()
+    registry.refresh(profiles)
+    return registry
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 100000,
+        float(sys.argv[2]) if len(sys.argv) > 2 else 0.01)
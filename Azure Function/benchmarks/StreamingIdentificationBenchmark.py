@@ -0,0 +1,105 @@
+"""Measures how fast StreamingIdentification works through a long recording against the
+local MockRecognitionServer, and how much memory it needs.
+
+The recording is generated into a temporary file: 44.1 kHz 16-bit mono, like the
+recordings of the field, so every window is resampled before it is sent. It alternates
+bursts of modulated noise standing in for speech with pauses, for the voice activity
+detector to cut windows at.
+
+Usage: python benchmarks/StreamingIdentificationBenchmark.py [<minutes>] [<concurrency>]
+"""
+
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import wave
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from engine.Identification.IdentificationServiceHttpClientHelper import \
+    IdentificationServiceHttpClientHelper
+from engine.Identification.StreamingIdentification import StreamingIdentification
+from engine.Recognition import ConnectionPool
+from engine.Recognition import OperationPoller
+from engine.Recognition import RateLimiter
+from MockRecognitionServer import MockRecognitionServer, MockRecognitionService
+
+_SUBSCRIPTION_KEY = 'benchmark'
+_SAMPLE_RATE = 44100
+_CANDIDATE_PROFILES = 3
+
+
+def make_long_audio(path, seconds, sample_rate=_SAMPLE_RATE, seed=0):
+    """Writes a WAV recording of speech-like bursts separated by pauses, generating it a
+    burst at a time so that long recordings do not have to fit in memory.
+
+    Arguments:
+    path -- the path of the WAV file to write
+    seconds -- the length of the recording
+    sample_rate -- the sample rate of the recording
+    seed -- the seed of the random generator
+    """
+    generator = np.random.RandomState(seed)
+    total = int(seconds * sample_rate)
+    written = 0
+    with wave.open(path, 'wb') as recording:
+        recording.setnchannels(1)
+        recording.setsampwidth(2)
+        recording.setframerate(sample_rate)
+        while written < total:
+            burst = int(generator.uniform(1.5, 4.0) * sample_rate)
+            pause = int(generator.uniform(0.3, 1.0) * sample_rate)
+            times = np.arange(burst) / float(sample_rate)
+            # Syllable-rate envelope over noise
+            envelope = 0.5 + 0.5 * np.sin(2 * np.pi * generator.uniform(3, 6) * times)
+            samples = np.concatenate([
+                generator.normal(0, 6000, burst) * envelope,
+                generator.normal(0, 30, pause)])[:total - written]
+            recording.writeframes(np.clip(samples, -32768, 32767).astype('<i2').tobytes())
+            written += len(samples)
+
+
+def run(minutes, concurrency):
+    service = MockRecognitionService(latency=0.02, processing_time=0.2, seed=42)
+    server = MockRecognitionServer(service).start()
+    RateLimiter.configure_rate_limit(_SUBSCRIPTION_KEY, 100000)
+    helper = IdentificationServiceHttpClientHelper(
+        _SUBSCRIPTION_KEY,
+        connection_pool=ConnectionPool.ConnectionPool(max_connections_per_host=concurrency),
+        polling_policy=OperationPoller.PollingPolicy(
+            initial_delay=0.2, multiplier=1.5, max_delay=0.2, jitter=0.1),
+        base_uri=server.get_base_uri())
+    profile_ids = [helper.create_profile('en-us').get_profile_id()
+                   for _ in range(_CANDIDATE_PROFILES)]
+
+    handle, path = tempfile.mkstemp(suffix='.wav')
+    os.close(handle)
+    try:
+        started = time.perf_counter()
+        make_long_audio(path, minutes * 60)
+        print('generated {0} minutes, {1:.1f} MB in {2:.1f} s'.format(
+            minutes, os.path.getsize(path) / 1e6, time.perf_counter() - started))
+
+        streaming = StreamingIdentification(helper, concurrency=concurrency)
+        tracemalloc.start()
+        started = time.perf_counter()
+        segments = list(streaming.identify_stream(path, profile_ids))
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print('identified in {0:.1f} s ({1:.1f}x real time), {2} segments, '
+              'peak traced memory {3:.1f} MB'.format(
+                  elapsed, minutes * 60 / elapsed, len(segments), peak / 1e6))
+        print('responses by status: {0}'.format(service.get_counts()))
+    finally:
+        os.remove(path)
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    run(float(sys.argv[1]) if len(sys.argv) > 1 else 10,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 4)
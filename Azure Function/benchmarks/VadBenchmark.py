@@ -0,0 +1,42 @@
+"""Measures how much voice-activity trimming shrinks the SoundsForJay samples and how long
+it takes per clip.
+
+Usage: python benchmarks/VadBenchmark.py [<repeats>]
+"""
+
+import os
+import sys
+import time
+
+_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, _ROOT)
+
+from engine.Recognition.VoiceActivityDetector import VoiceActivityDetector
+
+_SAMPLES = ['5sec.wav', '10sec.wav', '20sec.wav', '30sec.wav']
+
+
+def run(repeats):
+    detector = VoiceActivityDetector()
+    print('{0:<12}{1:>12}{2:>12}{3:>10}{4:>12}{5:>12}'.format(
+        'clip', 'bytes in', 'bytes out', 'saved', 'speech s', 'ms/clip'))
+    for name in _SAMPLES:
+        with open(os.path.join(_ROOT, 'engine', 'SoundsForJay', name), 'rb') as clip:
+            data = clip.read()
+
+        started = time.perf_counter()
+        for _ in range(repeats):
+            trimmed, speech_seconds = detector.trim_wav(data)
+        elapsed = (time.perf_counter() - started) / repeats
+
+        print('{0:<12}{1:>12}{2:>12}{3:>9.1f}%{4:>12.2f}{5:>12.2f}'.format(
+            name,
+            len(data),
+            len(trimmed),
+            100.0 * (len(data) - len(trimmed)) / len(data),
+            speech_seconds,
+            elapsed * 1000))
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -0,0 +1,497 @@
+import asyncio
+import ssl
+import time
+import urllib.parse
+import json
+import logging
+from . import IdentificationProfile
+from . import IdentificationResponse
+from . import EnrollmentResponse
+from . import ProfileCreationResponse
+from .IdentificationServiceHttpClientHelper import IdentificationServiceHttpClientHelper
+from ..Recognition import AudioBody
+from ..Recognition import CircuitBreaker
+from ..Recognition import ConnectionPool
+from ..Recognition import Metrics
+from ..Recognition import OperationPoller
+from ..Recognition import RateLimiter
+from ..Recognition import RecognitionTransport
+
+
+class AsyncIdentificationClient:
+    """Abstracts the interaction with the Identification service using asyncio.
+
+    Requests are sent over non-blocking keep-alive sockets, so a single event loop can
+    keep many identifications in flight at once. Like the requests of the helpers, they
+    draw from the RateLimiter of the subscription key, back off on 429 and 503 responses,
+    go through the CircuitBreaker of their host and record their phases to the metrics
+    sink, all without blocking the event loop.
+    """
+
+    _HTTPS_PORT = 443
+    _HTTP_PORT = 80
+    _DEFAULT_MAX_CONNECTIONS_PER_HOST = 100
+    # Statuses of responses that never have a body
+    _NO_BODY_STATUSES = (204, 304)
+
+    def __init__(self, subscription_key, max_connections_per_host=_DEFAULT_MAX_CONNECTIONS_PER_HOST,
+                 polling_policy=None, base_uri=None, rate_limiter=None, metrics_sink=None,
+                 max_retries=RecognitionTransport.RecognitionTransport._DEFAULT_MAX_RETRIES,
+                 circuit_breaker=None):
+        """Constructor of the AsyncIdentificationClient class.
+
+        Arguments:
+        subscription_key -- the subscription key string
+        max_connections_per_host -- the maximum number of concurrent sockets per host
+        polling_policy -- the PollingPolicy used while waiting on operations
+        base_uri -- the host of the service with an optional port, defaults to the
+                    Identification service, prefixed with http:// for a plain HTTP
+                    connection to a local test server, see ConnectionPool.create_connection
+        rate_limiter -- the RateLimiter to draw from, defaults to the process-wide limiter
+                        of the subscription key
+        metrics_sink -- an optional sink recording the phases of every request, see
+                        RecognitionTransport
+        max_retries -- the maximum number of retries of a throttled request
+        circuit_breaker -- the CircuitBreaker of every request, defaults to the
+                           process-wide breaker of the host of each request
+        """
+        self._subscription_key = subscription_key
+        self._base_uri = base_uri or IdentificationServiceHttpClientHelper._BASE_URI
+        self._max_connections_per_host = max_connections_per_host
+        self._polling_policy = polling_policy or OperationPoller.PollingPolicy()
+        self._rate_limiter = rate_limiter or RateLimiter.get_rate_limiter(subscription_key)
+        self._metrics_sink = metrics_sink
+        self._max_retries = max_retries
+        self._circuit_breaker = circuit_breaker
+        if circuit_breaker is not None:
+            circuit_breaker.add_metrics_sink(metrics_sink)
+        self._ssl_context = None
+        self._idle = {}
+        self._semaphores = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def get_all_profiles(self):
+        """Return a list of all profiles on the server."""
+        try:
+            # Send the request
+            res, message = await self._send_request(
+                'GET',
+                self._base_uri,
+                IdentificationServiceHttpClientHelper._IDENTIFICATION_PROFILES_URI,
+                IdentificationServiceHttpClientHelper._JSON_CONTENT_HEADER_VALUE)
+
+            if res.status == IdentificationServiceHttpClientHelper._STATUS_OK:
+                # Parse the response body
+                profiles_raw = Metrics.parse_json(message, self._metrics_sink)
+                return [IdentificationProfile.IdentificationProfile(profile_raw)
+                        for profile_raw in profiles_raw]
+            else:
+                reason = res.reason if not message else message
+                raise Exception('Error getting all profiles: ' + reason)
+        except:
+            logging.error('Error getting all profiles.')
+            raise
+
+    async def create_profile(self, locale):
+        """Creates a profile on the server and returns a dictionary of the creation response.
+
+        Arguments:
+        locale -- the locale string for the profile
+        """
+        try:
+            # Prepare the body of the message
+            body = json.dumps({'locale': '{0}'.format(locale)})
+
+            # Send the request
+            res, message = await self._send_request(
+                'POST',
+                self._base_uri,
+                IdentificationServiceHttpClientHelper._IDENTIFICATION_PROFILES_URI,
+                IdentificationServiceHttpClientHelper._JSON_CONTENT_HEADER_VALUE,
+                body)
+
+            if res.status == IdentificationServiceHttpClientHelper._STATUS_OK:
+                # Parse the response body
+                return ProfileCreationResponse.ProfileCreationResponse(
+                    Metrics.parse_json(message, self._metrics_sink))
+            else:
+                reason = res.reason if not message else message
+                raise Exception('Error creating profile: ' + reason)
+        except:
+            logging.error('Error creating profile.')
+            raise
+
+    async def enroll_profile(self, profile_id, file_path, force_short_audio=False):
+        """Enrolls a profile using an audio file and returns a
+        dictionary of the enrollment response.
+
+        Arguments:
+        profile_id -- the profile ID string of the user to enroll
+        file_path -- the file path string of the audio file to use, or the audio itself
+                     as bytes, a memoryview, a readable stream or an iterator of chunks
+        force_short_audio -- instruct the service to waive the recommended minimum audio limit
+                             needed for enrollment
+        """
+        try:
+            # Prepare the request
+            request_url = '{0}/{1}/enroll?{2}={3}'.format(
+                IdentificationServiceHttpClientHelper._IDENTIFICATION_PROFILES_URI,
+                urllib.parse.quote(profile_id),
+                IdentificationServiceHttpClientHelper._SHORT_AUDIO_PARAMETER_NAME,
+                force_short_audio)
+
+            # Send the request
+            body = await self._read_file(file_path)
+            res, message = await self._send_request(
+                'POST',
+                self._base_uri,
+                request_url,
+                IdentificationServiceHttpClientHelper._STREAM_CONTENT_HEADER_VALUE,
+                body)
+
+            if res.status == IdentificationServiceHttpClientHelper._STATUS_OK:
+                # Parse the response body
+                return EnrollmentResponse.EnrollmentResponse(
+                    Metrics.parse_json(message, self._metrics_sink))
+            elif res.status == IdentificationServiceHttpClientHelper._STATUS_ACCEPTED:
+                operation_url = res.getheader(
+                    IdentificationServiceHttpClientHelper._OPERATION_LOCATION_HEADER)
+
+                return EnrollmentResponse.EnrollmentResponse(
+                    await self._poll_operation(operation_url))
+            else:
+                reason = res.reason if not message else message
+                raise Exception('Error enrolling profile: ' + reason)
+        except:
+            logging.error('Error enrolling profile.')
+            raise
+
+    async def identify_file(self, file_path, test_profile_ids, force_short_audio=False):
+        """Identifies an audio file against the given profiles and returns the
+        identification response.
+
+        Arguments:
+        file_path -- the file path of the audio file to test, or the audio itself as
+                     bytes, a memoryview, a readable stream or an iterator of chunks
+        test_profile_ids -- an array of test profile IDs strings
+        force_short_audio -- instruct the service to waive the recommended minimum audio limit
+                             needed for enrollment
+        """
+        try:
+            # Prepare the request
+            if len(test_profile_ids) < 1:
+                raise Exception('Error identifying file: no test profile IDs are provided.')
+            test_profile_ids_str = ','.join(test_profile_ids)
+
+            request_url = '{0}?identificationProfileIds={1}&{2}={3}'.format(
+                IdentificationServiceHttpClientHelper._IDENTIFICATION_URI,
+                urllib.parse.quote(test_profile_ids_str),
+                IdentificationServiceHttpClientHelper._SHORT_AUDIO_PARAMETER_NAME,
+                force_short_audio)
+
+            # Send the request
+            body = await self._read_file(file_path)
+            res, message = await self._send_request(
+                'POST',
+                self._base_uri,
+                request_url,
+                IdentificationServiceHttpClientHelper._STREAM_CONTENT_HEADER_VALUE,
+                body)
+
+            if res.status == IdentificationServiceHttpClientHelper._STATUS_OK:
+                # Parse the response body
+                return IdentificationResponse.IdentificationResponse(
+                    Metrics.parse_json(message, self._metrics_sink))
+            elif res.status == IdentificationServiceHttpClientHelper._STATUS_ACCEPTED:
+                operation_url = res.getheader(
+                    IdentificationServiceHttpClientHelper._OPERATION_LOCATION_HEADER)
+                return IdentificationResponse.IdentificationResponse(
+                    await self._poll_operation(operation_url))
+            else:
+                reason = res.reason if not message else message
+                raise Exception('Error identifying file: ' + reason)
+        except:
+            logging.error('Error identifying file.')
+            raise
+
+    async def _poll_operation(self, operation_url):
+        """Polls on an operation till it is done without blocking the event loop
+
+        Arguments:
+        operation_url -- the url to poll for the operation status
+        """
+        try:
+            # Parse the operation URL
+            parsed_url = urllib.parse.urlparse(operation_url)
+
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            accepted = time.monotonic()
+            attempt = 0
+            retry_after = None
+            deadline = self._polling_policy.get_deadline()
+            while True:
+                delay = self._polling_policy.get_delay(attempt, retry_after)
+                if deadline is not None and loop.time() + delay - started > deadline:
+                    raise Exception('Operation Error: operation did not finish within '
+                                    '{0} seconds'.format(deadline))
+                await asyncio.sleep(delay)
+
+                # Send the request
+                res, message = await self._send_request(
+                    'GET',
+                    ConnectionPool.get_host(parsed_url),
+                    parsed_url.path,
+                    IdentificationServiceHttpClientHelper._JSON_CONTENT_HEADER_VALUE)
+
+                if res.status != IdentificationServiceHttpClientHelper._STATUS_OK:
+                    reason = res.reason if not message else message
+                    raise Exception('Operation Error: ' + reason)
+
+                # Parse the response body
+                operation_response = Metrics.parse_json(message, self._metrics_sink)
+                status = operation_response[
+                    IdentificationServiceHttpClientHelper._OPERATION_STATUS_FIELD_NAME]
+
+                if status == IdentificationServiceHttpClientHelper._OPERATION_STATUS_SUCCEEDED:
+                    if self._metrics_sink is not None:
+                        self._metrics_sink.record(
+                            Metrics.PROCESSING_SECONDS, time.monotonic() - accepted)
+                        self._metrics_sink.record(Metrics.POLL_ITERATIONS, attempt + 1)
+                    return operation_response[
+                        IdentificationServiceHttpClientHelper._OPERATION_PROC_RES_FIELD_NAME]
+                elif status == IdentificationServiceHttpClientHelper._OPERATION_STATUS_FAILED:
+                    raise Exception('Operation Error: ' + operation_response[
+                        IdentificationServiceHttpClientHelper._OPERATION_MESSAGE_FIELD_NAME])
+                retry_after = res.getheader(
+                    IdentificationServiceHttpClientHelper._RETRY_AFTER_HEADER)
+                attempt += 1
+        except:
+            logging.error('Error polling the operation status.')
+            raise
+
+    async def close(self):
+        """Closes every idle connection held by the client."""
+        idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for _, writer in connections:
+                writer.close()
+
+    async def _send_request(self, method, base_url, request_url, content_type_value, body=None):
+        """Sends the request to the server then returns the response and the response body string.
+
+        Arguments:
+        method -- specifies whether the request is a GET or POST request
+        base_url -- the host of the request, see ConnectionPool.create_connection
+        request_url -- the request url for the connection
+        content_type_value -- the value of the content type field in the headers
+        body -- the body of the request (needed only in POST methods)
+        """
+        try:
+            if isinstance(body, str):
+                body = body.encode('utf-8')
+
+            # Set the headers
+            headers = {
+                'Host': _strip_scheme(base_url),
+                IdentificationServiceHttpClientHelper._CONTENT_TYPE_HEADER: content_type_value,
+                IdentificationServiceHttpClientHelper._SUBSCRIPTION_KEY_HEADER:
+                    self._subscription_key,
+                'Content-Length': str(len(body) if body else 0)}
+
+            # Fail before waiting on the quota when the service is known to be down
+            circuit_breaker = self._circuit_breaker or \
+                CircuitBreaker.get_circuit_breaker(base_url, self._metrics_sink)
+            await circuit_breaker.check_async()
+
+            return await RateLimiter.send_with_backoff_async(
+                self._rate_limiter,
+                lambda: circuit_breaker.call_async(lambda on_acquired: self._send_once(
+                    method, base_url, request_url, headers, body, on_acquired)),
+                self._max_retries)
+        except CircuitBreaker.CircuitOpenError:
+            if self._metrics_sink is not None:
+                self._metrics_sink.record(Metrics.CIRCUIT_REJECTED, 1)
+            logging.error('Error sending the request, the circuit is open.')
+            raise
+        except:
+            logging.error('Error sending the request.')
+            raise
+
+    async def _send_once(self, method, base_url, request_url, headers, body, on_acquired):
+        """Sends the request over a kept-alive connection to the host, or a new one if
+        none is idle, and returns the response and the response body string."""
+        async with self._get_semaphore(base_url):
+            reader, writer, reused = await self._acquire(base_url)
+            on_acquired()
+            try:
+                res, message = await self._exchange(
+                    reader, writer, method, request_url, headers, body)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                if not reused:
+                    raise
+                # The kept-alive socket was closed by the server, retry on a fresh one
+                reader, writer = await self._connect(base_url)
+                res, message = await self._exchange(
+                    reader, writer, method, request_url, headers, body)
+
+            if res.will_close:
+                writer.close()
+            else:
+                self._idle.setdefault(base_url, []).append((reader, writer))
+            return res, message
+
+    def _get_semaphore(self, base_url):
+        """Returns the semaphore bounding the connections to the host, created on first
+        use."""
+        semaphore = self._semaphores.get(base_url)
+        if semaphore is None:
+            semaphore = self._semaphores[base_url] = asyncio.Semaphore(
+                self._max_connections_per_host)
+        return semaphore
+
+    async def _acquire(self, base_url):
+        """Returns an idle connection to the host or opens a new one."""
+        idle = self._idle.get(base_url)
+        while idle:
+            reader, writer = idle.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return reader, writer, True
+            writer.close()
+        reader, writer = await self._connect(base_url)
+        return reader, writer, False
+
+    async def _connect(self, base_url):
+        """Opens a connection to the host, recording the time it took."""
+        if self._metrics_sink is None:
+            return await self._open_connection(base_url)
+        started = time.perf_counter()
+        connection = await self._open_connection(base_url)
+        self._metrics_sink.record(Metrics.CONNECT_SECONDS, time.perf_counter() - started)
+        return connection
+
+    async def _open_connection(self, base_url):
+        """Opens a non-blocking connection to the host, over TLS unless the host is
+        prefixed with http://."""
+        if base_url.startswith(_PLAIN_HTTP_PREFIX):
+            ssl_context = None
+        else:
+            if self._ssl_context is None:
+                self._ssl_context = ssl.create_default_context()
+            ssl_context = self._ssl_context
+        host, _, port = _strip_scheme(base_url).partition(':')
+        if not port:
+            port = self._HTTPS_PORT if ssl_context else self._HTTP_PORT
+        return await asyncio.open_connection(host, int(port), ssl=ssl_context)
+
+    async def _exchange(self, reader, writer, method, request_url, headers, body):
+        """Writes the request on the connection and reads the whole response, closing the
+        connection if this fails or is cancelled."""
+        try:
+            return await self._write_and_read(reader, writer, method, request_url, headers, body)
+        except:
+            writer.close()
+            raise
+
+    async def _write_and_read(self, reader, writer, method, request_url, headers, body):
+        """Writes the request on the connection and reads the whole response."""
+        head = '{0} {1} HTTP/1.1\r\n'.format(method, request_url)
+        head += ''.join('{0}: {1}\r\n'.format(name, value) for name, value in headers.items())
+        started = time.perf_counter()
+        writer.write((head + '\r\n').encode('latin-1'))
+        if body:
+            writer.write(body)
+        await writer.drain()
+        uploaded = time.perf_counter()
+
+        while True:
+            version, status, reason, response_headers = await self._read_head(reader)
+            # Skip the interim responses, such as 100 Continue
+            if not 100 <= status < 200:
+                break
+
+        if method == 'HEAD' or status in self._NO_BODY_STATUSES:
+            content = b''
+        elif response_headers.get('transfer-encoding', '').lower() == 'chunked':
+            content = bytearray()
+            while True:
+                size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+                if size == 0:
+                    await reader.readuntil(b'\r\n')
+                    break
+                content += await reader.readexactly(size)
+                await reader.readexactly(2)
+        elif 'content-length' in response_headers:
+            content = await reader.readexactly(int(response_headers['content-length']))
+        elif response_headers.get('connection', '').lower() == 'close' or (
+                version == 'HTTP/1.0' and
+                response_headers.get('connection', '').lower() != 'keep-alive'):
+            # The body ends when the server closes the connection
+            content = await reader.read()
+            response_headers['connection'] = 'close'
+        else:
+            # Reading to the end would wait for the server to close a kept-alive connection
+            raise Exception('Error reading the response: its length is unknown')
+
+        if self._metrics_sink is not None:
+            self._metrics_sink.record(Metrics.RESPONSE_SECONDS, time.perf_counter() - uploaded)
+            self._metrics_sink.record(Metrics.UPLOAD_SECONDS, uploaded - started)
+            self._metrics_sink.record(Metrics.UPLOAD_BYTES, len(body) if body else 0)
+        res = _AsyncResponse(status, reason, response_headers)
+        return res, bytes(content).decode('utf-8')
+
+    @staticmethod
+    async def _read_head(reader):
+        """Reads the status line and the headers of a response and returns its version,
+        status, reason and dictionary of lowercase header names to values."""
+        status_line = await reader.readuntil(b'\r\n')
+        status_parts = status_line.decode('latin-1').rstrip('\r\n').split(' ', 2)
+        version = status_parts[0]
+        status = int(status_parts[1])
+        reason = status_parts[2] if len(status_parts) > 2 else ''
+
+        response_headers = {}
+        while True:
+            line = (await reader.readuntil(b'\r\n')).decode('latin-1').rstrip('\r\n')
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+        return version, status, reason, response_headers
+
+    @staticmethod
+    async def _read_file(file_path):
+        """Reads the audio in a worker thread so the event loop is never blocked."""
+        return await asyncio.get_running_loop().run_in_executor(
+            None, AudioBody.read_audio, file_path)
+
+
+_PLAIN_HTTP_PREFIX = 'http://'
+_HTTPS_PREFIX = 'https://'
+
+
+def _strip_scheme(base_url):
+    """Returns a host without its http:// or https:// prefix."""
+    for prefix in (_PLAIN_HTTP_PREFIX, _HTTPS_PREFIX):
+        if base_url.startswith(prefix):
+            return base_url[len(prefix):]
+    return base_url
+
+
+class _AsyncResponse:
+    """Mirrors the parts of http.client.HTTPResponse the client relies on."""
+
+    def __init__(self, status, reason, headers):
+        self.status = status
+        self.reason = reason
+        self._headers = headers
+        self.will_close = headers.get('connection', '').lower() == 'close'
+
+    def getheader(self, name, default=None):
+        """Returns the value of the named response header"""
+        return self._headers.get(name.lower(), default)
@@ -33,6 +33,10 @@ WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 class IdentificationProfile:
     """This class encapsulates a user profile."""
 
+    __slots__ = ('_profile_id', '_locale', '_enrollment_speech_time',
+                 '_remaining_enrollment_time', '_created_date_time', '_last_action_date_time',
+                 '_enrollment_status')
+
     _PROFILE_ID = 'identificationProfileId'
     _LOCALE = 'locale'
     _ENROLLMENT_SPEECH_TIME = 'enrollmentSpeechTime'
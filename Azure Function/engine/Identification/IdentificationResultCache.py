@@ -0,0 +1,282 @@
+import collections
+import hashlib
+import threading
+import time
+import logging
+from . import IdentificationResponse
+
+
+class IdentificationResultCache:
+    """Content-addressed cache of identification results.
+
+    Results are keyed by the SHA-256 of the audio bytes as uploaded, after normalization
+    and trimming, together with a hash of the candidate profile IDs. An in-memory LRU
+    serves repeated clips of the same process and an optional shared backend, such as
+    TableResultCacheBackend, serves repeated clips across instances.
+
+    The cache is a profile listener of the helper: enrolling, resetting or deleting a
+    profile through the helper drops every result that had it as a candidate. Results kept
+    in memory also expire after a time to live, which bounds how long an instance can
+    serve a result invalidated by another instance.
+
+    Every invalidation bumps the generation of the profile. The key of an identification
+    records the generation of its candidates when it started, and its result is not cached
+    if one of them was invalidated while the identification was running.
+    """
+
+    _DEFAULT_MAX_ENTRIES = 1024
+    _DEFAULT_TTL = 300
+
+    def __init__(self, max_entries=_DEFAULT_MAX_ENTRIES, backend=None, ttl=_DEFAULT_TTL):
+        """Constructor of the IdentificationResultCache class.
+
+        Arguments:
+        max_entries -- the maximum number of results kept in memory
+        backend -- an optional shared backend with get, put and invalidate_profile methods
+        ttl -- seconds a result is kept in memory
+        """
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._backend = backend
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self._keys_by_profile = {}
+        # Number of invalidations of every profile invalidated so far
+        self._generations = {}
+        self._hits = 0
+        self._backend_hits = 0
+        self._misses = 0
+
+    def get_key(self, audio, test_profile_ids):
+        """Returns the (candidates hash, audio hash, generation) key of an identification,
+        to be taken before it is sent.
+
+        Arguments:
+        audio -- the audio bytes that are uploaded
+        test_profile_ids -- the candidate profile IDs, their order does not matter
+        """
+        test_profile_ids = sorted(set(test_profile_ids))
+        candidates = ','.join(test_profile_ids).encode('utf-8')
+        with self._lock:
+            generation = self._get_generation(test_profile_ids)
+        return (hashlib.sha256(candidates).hexdigest(), hashlib.sha256(audio).hexdigest(),
+                generation)
+
+    def get(self, key):
+        """Returns the cached IdentificationResponse of a key, or None.
+
+        Arguments:
+        key -- the key returned by get_key
+        """
+        with self._lock:
+            entry = self._entries.get(key[:2])
+            if entry is not None and entry[2] <= time.monotonic():
+                self._forget(key[:2])
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key[:2])
+                self._hits += 1
+                return IdentificationResponse.IdentificationResponse(entry[0])
+
+        if self._backend is not None:
+            try:
+                stored = self._backend.get(key[0], key[1])
+            except Exception as e:
+                logging.warning('Error reading the shared identification cache: %s', e)
+                stored = None
+            if stored is not None:
+                result, test_profile_ids = stored
+                self._remember(key, result, test_profile_ids)
+                with self._lock:
+                    self._backend_hits += 1
+                return IdentificationResponse.IdentificationResponse(result)
+
+        with self._lock:
+            self._misses += 1
+        return None
+
+    def put(self, key, test_profile_ids, identification_response):
+        """Caches the result of an identification, unless one of its candidates was
+        invalidated since its key was taken.
+
+        Arguments:
+        key -- the key returned by get_key
+        test_profile_ids -- the candidate profile IDs of the identification
+        identification_response -- the IdentificationResponse to cache
+        """
+        result = {
+            IdentificationResponse.IdentificationResponse._IDENTIFIED_PROFILE_ID:
+                identification_response.get_identified_profile_id(),
+            IdentificationResponse.IdentificationResponse._CONFIDENCE:
+                identification_response.get_confidence()}
+        test_profile_ids = sorted(set(test_profile_ids))
+        if not self._remember(key, result, test_profile_ids):
+            logging.info('Not caching an identification whose candidates were invalidated '
+                         'while it was running.')
+            return
+        if self._backend is not None:
+            try:
+                self._backend.put(key[0], key[1], test_profile_ids, result)
+                with self._lock:
+                    invalidated = self._get_generation(test_profile_ids) != key[2]
+                if invalidated:
+                    # An invalidation ran meanwhile and may have missed the stored result
+                    for profile_id in test_profile_ids:
+                        self._backend.invalidate_profile(profile_id)
+            except Exception as e:
+                logging.warning('Error writing the shared identification cache: %s', e)
+
+    def invalidate_profile(self, profile_id):
+        """Drops every cached result that had the profile as a candidate.
+
+        Arguments:
+        profile_id -- the profile ID string
+        """
+        with self._lock:
+            self._generations[profile_id] = self._generations.get(profile_id, 0) + 1
+            for key in self._keys_by_profile.pop(profile_id, ()):
+                self._forget(key)
+        if self._backend is not None:
+            try:
+                self._backend.invalidate_profile(profile_id)
+            except Exception as e:
+                logging.error('Error invalidating the shared identification cache: %s', e)
+
+    def get_stats(self):
+        """Returns a dictionary of the cache hit and miss counters."""
+        with self._lock:
+            return {
+                'hits': self._hits,
+                'backend_hits': self._backend_hits,
+                'misses': self._misses,
+                'entries': len(self._entries)}
+
+    def profile_created(self, profile_id):
+        """A new profile is not a candidate of any cached result."""
+
+    def profile_enrolled(self, profile_id, enrollment_status):
+        """Drops the results of a re-enrolled profile."""
+        self.invalidate_profile(profile_id)
+
+    def profile_deleted(self, profile_id):
+        """Drops the results of a deleted profile."""
+        self.invalidate_profile(profile_id)
+
+    def profile_reset(self, profile_id):
+        """Drops the results of a reset profile."""
+        self.invalidate_profile(profile_id)
+
+    def _remember(self, key, result, test_profile_ids):
+        """Stores a result in memory, evicting the least recently used one if full, and
+        returns whether it was stored, which it is not if one of the candidates was
+        invalidated since the key was taken."""
+        with self._lock:
+            if self._get_generation(test_profile_ids) != key[2]:
+                return False
+            key = key[:2]
+            if key in self._entries:
+                self._forget(key)
+            self._entries[key] = (result, test_profile_ids, time.monotonic() + self._ttl)
+            for profile_id in test_profile_ids:
+                self._keys_by_profile.setdefault(profile_id, set()).add(key)
+            while len(self._entries) > self._max_entries:
+                self._forget(next(iter(self._entries)))
+            return True
+
+    def _get_generation(self, test_profile_ids):
+        """Returns the total number of invalidations of the candidates, which only grows.
+        Must be called with the lock held."""
+        return sum(self._generations.get(profile_id, 0) for profile_id in test_profile_ids)
+
+    def _forget(self, key):
+        """Removes a result from memory. Must be called with the lock held."""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for profile_id in entry[1]:
+            keys = self._keys_by_profile.get(profile_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_profile[profile_id]
+
+
+class TableResultCacheBackend:
+    """Shares identification results between instances through Azure Table storage.
+
+    Results are stored in a partition per candidate set with the audio hash as row key.
+    For every candidate an index row records the candidate sets it belongs to, so that
+    invalidating a profile deletes exactly the partitions it appears in.
+    """
+
+    _PROFILE_PARTITION_PREFIX = 'profile-'
+
+    def __init__(self, table_service, table_name='identificationresults'):
+        """Constructor of the TableResultCacheBackend class.
+
+        Arguments:
+        table_service -- the TableService of the storage account
+        table_name -- the name of the table, created if it does not exist
+        """
+        self._table_service = table_service
+        self._table_name = table_name
+        table_service.create_table(table_name)
+
+    def get(self, candidates_hash, audio_hash):
+        """Returns a tuple of the result dictionary and the candidate IDs, or None."""
+        entities = list(self._table_service.query_entities(
+            self._table_name,
+            filter='PartitionKey eq {0} and RowKey eq {1}'.format(
+                _quote(candidates_hash), _quote(audio_hash))))
+        if not entities:
+            return None
+        entity = entities[0]
+        result = {
+            IdentificationResponse.IdentificationResponse._IDENTIFIED_PROFILE_ID:
+                entity.get('IdentifiedProfileId'),
+            IdentificationResponse.IdentificationResponse._CONFIDENCE:
+                entity.get('Confidence')}
+        return result, entity.get('Candidates', '').split(',')
+
+    def put(self, candidates_hash, audio_hash, test_profile_ids, result):
+        """Stores a result and the index rows of its candidates."""
+        for profile_id in test_profile_ids:
+            self._table_service.insert_or_replace_entity(self._table_name, {
+                'PartitionKey': self._PROFILE_PARTITION_PREFIX + profile_id,
+                'RowKey': candidates_hash})
+        self._table_service.insert_or_replace_entity(self._table_name, {
+            'PartitionKey': candidates_hash,
+            'RowKey': audio_hash,
+            'Candidates': ','.join(test_profile_ids),
+            'IdentifiedProfileId': result.get(
+                IdentificationResponse.IdentificationResponse._IDENTIFIED_PROFILE_ID),
+            'Confidence': result.get(
+                IdentificationResponse.IdentificationResponse._CONFIDENCE)})
+
+    def invalidate_profile(self, profile_id):
+        """Deletes the results of every candidate set containing the profile."""
+        profile_partition = self._PROFILE_PARTITION_PREFIX + profile_id
+        index_rows = self._table_service.query_entities(
+            self._table_name,
+            filter='PartitionKey eq {0}'.format(_quote(profile_partition)),
+            select='RowKey')
+        for index_row in list(index_rows):
+            candidates_hash = index_row['RowKey']
+            results = self._table_service.query_entities(
+                self._table_name,
+                filter='PartitionKey eq {0}'.format(_quote(candidates_hash)),
+                select='RowKey')
+            for result in list(results):
+                self._table_service.delete_entity(
+                    self._table_name, candidates_hash, result['RowKey'])
+            self._table_service.delete_entity(
+                self._table_name, profile_partition, candidates_hash)
+
+
+def _quote(value):
+    """Returns a string as an OData literal of a table query filter.
+
+    Arguments:
+    value -- the string, such as a profile ID
+    """
+    return "'{0}'".format(value.replace("'", "''"))
@@ -30,11 +30,16 @@ OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
 WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 """
 
-import http.client
 import urllib.parse
+import concurrent.futures
 import json
+import threading
 import time
-from contextlib import closing
+from ..Recognition import AudioBody
+from ..Recognition import BulkRunner
+from ..Recognition import ConnectionPool
+from ..Recognition import OperationPoller
+from ..Recognition import RecognitionTransport
 from . import IdentificationProfile
 from . import IdentificationResponse
 from . import EnrollmentResponse
@@ -46,6 +51,7 @@ class IdentificationServiceHttpClientHelper:
 
     _STATUS_OK = 200
     _STATUS_ACCEPTED = 202
+    _STATUS_NOT_FOUND = 404
     _BASE_URI = 'westus.api.cognitive.microsoft.com'
     _IDENTIFICATION_PROFILES_URI = '/spid/v1.0/identificationProfiles'
     _IDENTIFICATION_URI = '/spid/v1.0/identify'
@@ -60,39 +66,112 @@ class IdentificationServiceHttpClientHelper:
     _OPERATION_MESSAGE_FIELD_NAME = 'message'
     _OPERATION_STATUS_SUCCEEDED = 'succeeded'
     _OPERATION_STATUS_FAILED = 'failed'
-    _OPERATION_STATUS_UPDATE_DELAY = 5
-
-    def __init__(self, subscription_key):
+    _RETRY_AFTER_HEADER = 'Retry-After'
+    _MAX_PROFILES_PER_IDENTIFICATION = 10
+    _MAX_CONCURRENT_SHARDS = 8
+    _NO_MATCH_PROFILE_ID = '00000000-0000-0000-0000-000000000000'
+    _CONFIDENCE_HIGH = 'High'
+    _CONFIDENCE_RANKS = {'Low': 1, 'Normal': 2, 'High': 3}
+    _MIN_SPEECH_SECONDS = 1.0
+    _OPERATION_KIND_ENROLLMENT = 'enrollment'
+    _OPERATION_KIND_IDENTIFICATION = 'identification'
+    _PROFILE_ID_CONTEXT_KEY = 'profileId'
+    _TEST_PROFILE_IDS_CONTEXT_KEY = 'testProfileIds'
+    _DEFAULT_RESUME_CONCURRENCY = 4
+    _DEFAULT_BULK_CONCURRENCY = 8
+    _DEFAULT_BULK_ATTEMPTS = 3
+
+    def __init__(self, subscription_key, connection_pool=None, polling_policy=None,
+                 poll_scheduler=None, rate_limiter=None, normalize_audio=False,
+                 voice_activity_detector=None, min_speech_seconds=_MIN_SPEECH_SECONDS,
+                 result_cache=None, base_uri=None, metrics_sink=None, transport=None,
+                 operation_journal=None, hedging_policy=None):
         """Constructor of the IdentificationServiceHttpClientHelper class.
 
         Arguments:
         subscription_key -- the subscription key string
+        connection_pool -- the ConnectionPool to send requests over, defaults to the
+                           process-wide pool
+        polling_policy -- the PollingPolicy used while waiting on operations
+        poll_scheduler -- an optional shared PollScheduler that tracks the operations of
+                          this helper instead of the calling thread
+        rate_limiter -- the RateLimiter to draw from, defaults to the process-wide limiter
+                        of the subscription key
+        normalize_audio -- convert audio to 16 kHz, 16-bit, mono PCM WAV locally before it
+                           is uploaded
+        voice_activity_detector -- an optional VoiceActivityDetector removing silences from
+                                   audio before it is uploaded
+        min_speech_seconds -- the net speech below which trimmed audio is rejected without
+                              calling the service
+        result_cache -- an optional IdentificationResultCache answering repeated
+                        identifications of the same audio and candidates
+        base_uri -- the host of the service, defaults to _BASE_URI; prefix it with http://
+                    to target a local mock server
+        metrics_sink -- an optional sink, such as Metrics.HistogramMetricsSink, recording
+                        the connect, upload, processing, polling and parsing phases
+        transport -- a RecognitionTransport shared with other helpers, replaces
+                     connection_pool, rate_limiter and metrics_sink
+        operation_journal -- an optional OperationJournal recording the pending operations
+                             so that any worker can resume them, see resume_operations
+        hedging_policy -- an optional HedgingPolicy sending a duplicate of the
+                          identifications that are slower than usual, the first to finish
+                          is used
         """
         self._subscription_key = subscription_key
+        self._base_uri = base_uri or self._BASE_URI
+        self._transport = transport or RecognitionTransport.RecognitionTransport(
+            subscription_key, connection_pool, rate_limiter, metrics_sink)
+        self._polling_policy = polling_policy or OperationPoller.PollingPolicy()
+        self._poll_scheduler = poll_scheduler
+        self._profile_listeners = []
+        self._normalize_audio = normalize_audio
+        self._voice_activity_detector = voice_activity_detector
+        self._min_speech_seconds = min_speech_seconds
+        self._result_cache = result_cache
+        self._operation_journal = operation_journal
+        self._hedging_policy = hedging_policy
+        if result_cache is not None:
+            self.add_profile_listener(result_cache)
+
+    def add_profile_listener(self, listener):
+        """Registers a listener notified of profiles created, enrolled, deleted or reset
+        through this helper.
+
+        Arguments:
+        listener -- object with profile_created(profile_id), profile_enrolled(profile_id,
+                    enrollment_status), profile_deleted(profile_id) and
+                    profile_reset(profile_id) methods
+        """
+        self._profile_listeners.append(listener)
+
+    def remove_profile_listener(self, listener):
+        """Unregisters a listener added with add_profile_listener."""
+        self._profile_listeners.remove(listener)
 
     def get_all_profiles(self):
         """Return a list of all profiles on the server."""
         try:
-            # Send the request
-            res, message = self._send_request(
-                'GET',
-                self._BASE_URI,
+            return self._transport.get_profiles(
+                self._base_uri,
                 self._IDENTIFICATION_PROFILES_URI,
-                self._JSON_CONTENT_HEADER_VALUE)
-            
-            if res.status == self._STATUS_OK:
-                # Parse the response body
-                profiles_raw = json.loads(message)
-                return [IdentificationProfile.IdentificationProfile(profiles_raw[i])
-                        for i in range(0, len(profiles_raw))]
-            else:
-                print("!!!!")
-                reason = res.reason if not message else message
-                print(reason)
-                raise Exception('Error getting all profiles: ' + reason)
+                IdentificationProfile.IdentificationProfile)
         except:
             logging.error('Error getting all profiles.')
             raise
+
+    def iter_all_profiles(self):
+        """Yield all profiles on the server as they are read from the response, in memory
+        bounded by one profile rather than the whole listing."""
+        try:
+            for profile in self._transport.iter_profiles(
+                    self._base_uri,
+                    self._IDENTIFICATION_PROFILES_URI,
+                    IdentificationProfile.IdentificationProfile):
+                yield profile
+        except Exception:
+            # GeneratorExit is not caught, closing the generator early is not an error
+            logging.error('Error getting all profiles.')
+            raise
     
     def get_profile(self, profile_id):
         """Get a speaker's profile with given profile ID
@@ -110,17 +189,18 @@ class IdentificationServiceHttpClientHelper:
             # Send the request
             res, message = self._send_request(
                 'GET',
-                self._BASE_URI,
+                self._base_uri,
                 request_url,
                 self._JSON_CONTENT_HEADER_VALUE)
         
             if res.status == self._STATUS_OK:
                 # Parse the response body
-                profile_raw = json.loads(message)
+                profile_raw = self._transport.parse_json(message)
                 return IdentificationProfile.IdentificationProfile(profile_raw)
             else:
                 reason = res.reason if not message else message
-                raise Exception('Error getting profile: ' + reason)
+                raise RecognitionTransport.ServiceError(
+                    'Error getting profile: ' + reason, res.status)
         except:
             logging.error('Error getting profile.')
             raise
@@ -138,26 +218,32 @@ class IdentificationServiceHttpClientHelper:
             # Send the request
             res, message = self._send_request(
                 'POST',
-                self._BASE_URI,
+                self._base_uri,
                 self._IDENTIFICATION_PROFILES_URI,
                 self._JSON_CONTENT_HEADER_VALUE,
                 body)
 
             if res.status == self._STATUS_OK:
                 # Parse the response body
-                return ProfileCreationResponse.ProfileCreationResponse(json.loads(message))
+                creation_response = ProfileCreationResponse.ProfileCreationResponse(
+                    self._transport.parse_json(message))
+                self._notify_profile_listeners(
+                    'profile_created', creation_response.get_profile_id())
+                return creation_response
             else:
                 reason = res.reason if not message else message
-                raise Exception('Error creating profile: ' + reason)
+                raise RecognitionTransport.ServiceError(
+                    'Error creating profile: ' + reason, res.status)
         except:
             logging.error('Error creating profile.')
             raise
     
-    def delete_profile(self, profile_id):
+    def delete_profile(self, profile_id, missing_ok=False):
         """ Deletes a profile from the server
         
         Arguments:
         profile_id -- the profile ID string of user to delete
+        missing_ok -- whether a profile that does not exist counts as deleted
         """
         try:
             # Prepare the request
@@ -168,13 +254,16 @@ class IdentificationServiceHttpClientHelper:
             # Send the request
             res, message = self._send_request(
                 'DELETE',
-                self._BASE_URI,
+                self._base_uri,
                 request_url,
                 self._JSON_CONTENT_HEADER_VALUE)
                 
-            if res.status != self._STATUS_OK:
+            if res.status != self._STATUS_OK and not (
+                    missing_ok and res.status == self._STATUS_NOT_FOUND):
                 reason = res.reason if not message else message
-                raise Exception('Error deleting profile: ' + reason)
+                raise RecognitionTransport.ServiceError(
+                    'Error deleting profile: ' + reason, res.status)
+            self._notify_profile_listeners('profile_deleted', profile_id)
         except:
             logging.error('Error deleting profile')
             raise
@@ -195,16 +284,60 @@ class IdentificationServiceHttpClientHelper:
             # Send the request
             res, message = self._send_request(
                 'POST',
-                self._BASE_URI,
+                self._base_uri,
                 request_url,
                 self._JSON_CONTENT_HEADER_VALUE)
             
             if res.status != self._STATUS_OK:
                 reason = res.reason if not message else message
-                raise Exception('Error resetting profile: ' + reason)
+                raise RecognitionTransport.ServiceError(
+                    'Error resetting profile: ' + reason, res.status)
+            self._notify_profile_listeners('profile_reset', profile_id)
         except:
             logging.error('Error resetting profile')
             raise
+
+    def delete_many(self, profile_ids, concurrency=_DEFAULT_BULK_CONCURRENCY,
+                    max_attempts=_DEFAULT_BULK_ATTEMPTS, on_outcome=None):
+        """Deletes profiles concurrently within the rate limit of the subscription key and
+        returns a summary of the successes, failures and throughput, see
+        BulkRunner.summarize.
+
+        A failed deletion is sent again up to max_attempts times, unless the service
+        rejected it with a 4xx status. A profile that does not exist counts as deleted, so
+        a deletion whose response was lost is safely sent again.
+
+        Arguments:
+        profile_ids -- iterable of profile ID strings, read lazily
+        concurrency -- the maximum number of concurrent deletions
+        max_attempts -- the maximum number of requests per profile
+        on_outcome -- an optional callable taking the profile ID, result and error of every
+                      profile as soon as it is done
+        """
+        return BulkRunner.summarize(BulkRunner.run_with_retries(
+            lambda profile_id: self.delete_profile(profile_id, missing_ok=True),
+            profile_ids, concurrency, max_attempts, RecognitionTransport.is_retryable),
+            on_outcome)
+
+    def reset_many(self, profile_ids, concurrency=_DEFAULT_BULK_CONCURRENCY,
+                   max_attempts=_DEFAULT_BULK_ATTEMPTS, on_outcome=None):
+        """Resets the enrollments of profiles concurrently within the rate limit of the
+        subscription key and returns a summary of the successes, failures and throughput,
+        see BulkRunner.summarize.
+
+        A failed reset is sent again up to max_attempts times, unless the service rejected
+        it with a 4xx status, e.g. for a profile that does not exist.
+
+        Arguments:
+        profile_ids -- iterable of profile ID strings, read lazily
+        concurrency -- the maximum number of concurrent resets
+        max_attempts -- the maximum number of requests per profile
+        on_outcome -- an optional callable taking the profile ID, result and error of every
+                      profile as soon as it is done
+        """
+        return BulkRunner.summarize(BulkRunner.run_with_retries(
+            self.reset_enrollments, profile_ids, concurrency, max_attempts,
+            RecognitionTransport.is_retryable), on_outcome)
                 
     def enroll_profile(self, profile_id, file_path, force_short_audio = False):
         """Enrolls a profile using an audio file and returns a
@@ -212,7 +345,10 @@ class IdentificationServiceHttpClientHelper:
 
         Arguments:
         profile_id -- the profile ID string of the user to enroll
-        file_path -- the file path string of the audio file to use
+        file_path -- the file path string of the audio file to use,
+                     or the audio itself as bytes, a memoryview, a readable stream or an
+                     iterator of chunks (streams and iterators are sent with chunked
+                     transfer encoding)
         force_short_audio -- instruct the service to waive the recommended minimum audio limit
                              needed for enrollment
         """
@@ -225,36 +361,55 @@ class IdentificationServiceHttpClientHelper:
                 force_short_audio)
 
             # Prepare the body of the message
-            with open(file_path, 'rb') as body:
+            audio = AudioBody.prepare_audio(
+                file_path, self._normalize_audio, self._voice_activity_detector,
+                self._min_speech_seconds)
+            with AudioBody.open_audio(audio) as body:
                 # Send the request
                 res, message = self._send_request(
                     'POST',
-                    self._BASE_URI,
+                    self._base_uri,
                     request_url,
                     self._STREAM_CONTENT_HEADER_VALUE,
                     body)
 
             if res.status == self._STATUS_OK:
                 # Parse the response body
-                return EnrollmentResponse.EnrollmentResponse(json.loads(message))
+                enrollment_response = EnrollmentResponse.EnrollmentResponse(
+                    self._transport.parse_json(message))
             elif res.status == self._STATUS_ACCEPTED:
                 operation_url = res.getheader(self._OPERATION_LOCATION_HEADER)
 
-                return EnrollmentResponse.EnrollmentResponse(
-                    self._poll_operation(operation_url))
+                enrollment_response = EnrollmentResponse.EnrollmentResponse(
+                    self._poll_operation(
+                        operation_url,
+                        self._OPERATION_KIND_ENROLLMENT,
+                        {self._PROFILE_ID_CONTEXT_KEY: profile_id}))
             else:
                 reason = res.reason if not message else message
-                raise Exception('Error enrolling profile: ' + reason)
+                raise RecognitionTransport.ServiceError(
+                    'Error enrolling profile: ' + reason, res.status)
+
+            self._notify_profile_listeners(
+                'profile_enrolled', profile_id, enrollment_response.get_enrollment_status())
+            return enrollment_response
         except:
             logging.error('Error enrolling profile.')
             raise
 
     def identify_file(self, file_path, test_profile_ids, force_short_audio = False):
-        """Enrolls a profile using an audio file and returns a
-        dictionary of the enrollment response.
+        """Identifies an audio file against the given profiles and returns the
+        identification response.
+
+        When there are more candidate profiles than the service accepts in one request, the
+        candidates are split into shards that are identified concurrently and the best
+        ranked result is returned.
 
         Arguments:
-        file_path -- the file path of the audio file to test
+        file_path -- the file path of the audio file to test,
+                     or the audio itself as bytes, a memoryview, a readable stream or an
+                     iterator of chunks (streams and iterators are sent with chunked
+                     transfer encoding)
         test_profile_ids -- an array of test profile IDs strings
         force_short_audio -- instruct the service to waive the recommended minimum audio limit
                              needed for enrollment
@@ -263,90 +418,380 @@ class IdentificationServiceHttpClientHelper:
             # Prepare the request
             if len(test_profile_ids) < 1:
                 raise Exception('Error identifying file: no test profile IDs are provided.')
-            test_profile_ids_str = ','.join(test_profile_ids)
-            print("!: " + urllib.parse.quote(test_profile_ids_str))
-            print("!!: " + test_profile_ids_str)
-
-            request_url = '{0}?identificationProfileIds={1}&{2}={3}'.format(
-                self._IDENTIFICATION_URI,
-                urllib.parse.quote(test_profile_ids_str),
-                self._SHORT_AUDIO_PARAMETER_NAME,
-                force_short_audio)
-
-            # Prepare the body of the message
-            print("starting calling API function")
-            print("1:" + self._BASE_URI)
-            print("2:" + self._STREAM_CONTENT_HEADER_VALUE)
-            print("3:" + request_url)
-
-            with open(file_path, 'rb') as body:
-                # Send the request
-                res, message = self._send_request(
-                    'POST',
-                    self._BASE_URI,
-                    request_url,
-                    self._STREAM_CONTENT_HEADER_VALUE,
-                    body)
-            print("starting if statement function")
-            print(res.status)
-            print(self._STATUS_OK)
 
-            if res.status == self._STATUS_OK:
-                # Parse the response body
-                print("starting 1 function")
-                return IdentificationResponse.IdentificationResponse(json.loads(message))
-            elif res.status == self._STATUS_ACCEPTED:
-                print("starting 2 function")
-                operation_url = res.getheader(self._OPERATION_LOCATION_HEADER)
-                return IdentificationResponse.IdentificationResponse(
-                    self._poll_operation(operation_url))
+            audio = AudioBody.prepare_audio(
+                file_path, self._normalize_audio, self._voice_activity_detector,
+                self._min_speech_seconds)
+            if self._result_cache is not None:
+                audio = AudioBody.read_audio(audio)
+                cache_key = self._result_cache.get_key(audio, test_profile_ids)
+                identification_response = self._result_cache.get(cache_key)
+                if identification_response is not None:
+                    return identification_response
+
+            if len(test_profile_ids) <= self._MAX_PROFILES_PER_IDENTIFICATION and \
+                    self._hedging_policy is None:
+                with AudioBody.open_audio(audio) as body:
+                    identification_response = self._identify(
+                        body, test_profile_ids, force_short_audio)
+            elif len(test_profile_ids) <= self._MAX_PROFILES_PER_IDENTIFICATION:
+                # A hedge sends the same audio again, so read it only once
+                body = AudioBody.read_audio(audio)
+                identification_response = self._identify(
+                    body, test_profile_ids, force_short_audio)
             else:
-                print("starting 3 function")
-                reason = res.reason if not message else message
-                raise Exception('Error identifying file: ' + reason)
+                # Every shard sends the same audio, so read it only once
+                body = AudioBody.read_audio(audio)
+                identification_response = self._identify_sharded(
+                    body, test_profile_ids, force_short_audio)
+
+            if self._result_cache is not None:
+                self._result_cache.put(cache_key, test_profile_ids, identification_response)
+            return identification_response
         except:
             logging.error('Error identifying file.')
             raise
 
-    def _poll_operation(self, operation_url):
-        """Polls on an operation till it is done
+    def _identify(self, body, test_profile_ids, force_short_audio):
+        """Identifies the audio against at most _MAX_PROFILES_PER_IDENTIFICATION profiles
+        and returns the identification response, hedging the request if a hedging policy
+        is set.
 
         Arguments:
-        operation_url -- the url to poll for the operation status
+        body -- the audio to test, as bytes if a hedging policy is set
+        test_profile_ids -- an array of at most _MAX_PROFILES_PER_IDENTIFICATION profile IDs
+        force_short_audio -- instruct the service to waive the recommended minimum audio limit
         """
+        if self._hedging_policy is None:
+            return self._send_identification(body, test_profile_ids, force_short_audio)
+        return self._identify_hedged(body, test_profile_ids, force_short_audio)
+
+    def _identify_hedged(self, body, test_profile_ids, force_short_audio):
+        """Sends one identification request, and a duplicate over a new connection if it
+        is not done after the delay of the hedging policy and the budget allows it, then
+        returns the first identification response. The other request is abandoned.
+
+        Arguments:
+        body -- the audio bytes to test
+        test_profile_ids -- an array of at most _MAX_PROFILES_PER_IDENTIFICATION profile IDs
+        force_short_audio -- instruct the service to waive the recommended minimum audio limit
+        """
+        started = time.monotonic()
+        delay = self._hedging_policy.start_request()
+        abandoned = threading.Event()
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
         try:
-            # Parse the operation URL
-            parsed_url = urllib.parse.urlparse(operation_url)
+            futures = {executor.submit(
+                self._send_identification, body, test_profile_ids, force_short_audio,
+                abandoned): False}
+            done, _ = concurrent.futures.wait(futures, timeout=delay)
+            if not done and self._hedging_policy.acquire_hedge():
+                logging.info('Hedging an identification still running after %.1f seconds.',
+                             delay)
+                futures[executor.submit(
+                    self._send_identification, body, test_profile_ids, force_short_audio,
+                    abandoned, True)] = True
+
+            error = None
+            while futures:
+                done, _ = concurrent.futures.wait(
+                    futures, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    hedge = futures.pop(future)
+                    try:
+                        response = future.result()
+                    except Exception as e:
+                        error = error or e
+                        continue
+                    self._hedging_policy.record(time.monotonic() - started, hedge)
+                    return response
+            raise error
+        finally:
+            # Stops the polling of the request that lost
+            abandoned.set()
+            executor.shutdown(wait=False)
+
+    def _send_identification(self, body, test_profile_ids, force_short_audio, abandoned=None,
+                             fresh_connection=False):
+        """Sends one identification request and returns the identification response.
 
-            while True:
-                # Send the request
-                res, message = self._send_request(
-                    'GET',
-                    parsed_url.netloc,
-                    parsed_url.path,
-                    self._JSON_CONTENT_HEADER_VALUE)
+        Arguments:
+        body -- the audio to test
+        test_profile_ids -- an array of at most _MAX_PROFILES_PER_IDENTIFICATION profile IDs
+        force_short_audio -- instruct the service to waive the recommended minimum audio limit
+        abandoned -- an optional threading.Event set once the response is not needed anymore
+        fresh_connection -- send the request over a new connection
+        """
+        test_profile_ids_str = ','.join(test_profile_ids)
+
+        request_url = '{0}?identificationProfileIds={1}&{2}={3}'.format(
+            self._IDENTIFICATION_URI,
+            urllib.parse.quote(test_profile_ids_str),
+            self._SHORT_AUDIO_PARAMETER_NAME,
+            force_short_audio)
+
+        # Send the request
+        res, message = self._send_request(
+            'POST',
+            self._base_uri,
+            request_url,
+            self._STREAM_CONTENT_HEADER_VALUE,
+            body,
+            fresh_connection)
+
+        if res.status == self._STATUS_OK:
+            # Parse the response body
+            return IdentificationResponse.IdentificationResponse(
+                self._transport.parse_json(message))
+        elif res.status == self._STATUS_ACCEPTED:
+            operation_url = res.getheader(self._OPERATION_LOCATION_HEADER)
+            return IdentificationResponse.IdentificationResponse(
+                self._poll_operation(
+                    operation_url,
+                    self._OPERATION_KIND_IDENTIFICATION,
+                    {self._TEST_PROFILE_IDS_CONTEXT_KEY: test_profile_ids},
+                    abandoned=abandoned))
+        else:
+            reason = res.reason if not message else message
+            raise RecognitionTransport.ServiceError(
+                'Error identifying file: ' + reason, res.status)
+
+    def _identify_sharded(self, body, test_profile_ids, force_short_audio):
+        """Identifies the audio against groups of candidate profiles concurrently and
+        returns the response with the highest confidence.
+
+        Returns as soon as one group reports a High confidence match.
+
+        Arguments:
+        body -- the audio bytes to test
+        test_profile_ids -- an array of test profile IDs strings
+        force_short_audio -- instruct the service to waive the recommended minimum audio limit
+        """
+        shards = [test_profile_ids[i:i + self._MAX_PROFILES_PER_IDENTIFICATION]
+                  for i in range(0, len(test_profile_ids), self._MAX_PROFILES_PER_IDENTIFICATION)]
+
+        best_response = None
+        error = None
+        futures = []
+        executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=min(len(shards), self._MAX_CONCURRENT_SHARDS))
+        try:
+            futures = [executor.submit(self._identify, body, shard, force_short_audio)
+                       for shard in shards]
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    response = future.result()
+                except Exception as e:
+                    error = error or e
+                    continue
+                if best_response is None or \
+                        self._rank_identification(response) > \
+                        self._rank_identification(best_response):
+                    best_response = response
+                if self._rank_identification(best_response) == \
+                        self._CONFIDENCE_RANKS[self._CONFIDENCE_HIGH]:
+                    break
+        finally:
+            # Shards that did not start yet are not needed anymore
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+        if self._rank_identification(best_response) > 0 or error is None:
+            return best_response
+        raise error
+
+    def _rank_identification(self, response):
+        """Returns the rank of an identification response, higher is better.
 
-                if res.status != self._STATUS_OK:
-                    reason = res.reason if not message else message
-                    raise Exception('Operation Error: ' + reason)
+        Arguments:
+        response -- the IdentificationResponse to rank, or None
+        """
+        if response is None or \
+                response.get_identified_profile_id() in (None, self._NO_MATCH_PROFILE_ID):
+            return 0
+        return self._CONFIDENCE_RANKS.get(response.get_confidence(), 0)
+
+    def resume_operations(self, wait=False, concurrency=_DEFAULT_RESUME_CONCURRENCY):
+        """Resumes the pending operations of the operation journal, such as those of a
+        worker that was recycled, and yields a tuple of (record, response, error) for every
+        operation that finished. The response is an EnrollmentResponse or an
+        IdentificationResponse depending on the kind of the operation, and error is set
+        instead if the operation failed or could not be checked.
+
+        Operations another worker is polling are skipped. Enrollments that finished are
+        reported to the profile listeners. The operations that finished longer ago than the
+        retention of the journal are purged from it first.
 
-                # Parse the response body
-                operation_response = json.loads(message)
-
-                if operation_response[self._OPERATION_STATUS_FIELD_NAME] == \
-                        self._OPERATION_STATUS_SUCCEEDED:
-                    return operation_response[self._OPERATION_PROC_RES_FIELD_NAME]
-                elif operation_response[self._OPERATION_STATUS_FIELD_NAME] == \
-                        self._OPERATION_STATUS_FAILED:
-                    raise Exception('Operation Error: ' +
-                                    operation_response[self._OPERATION_MESSAGE_FIELD_NAME])
+        Arguments:
+        wait -- poll every operation till it is done, otherwise check each once and leave
+                the operations still running pending for a later call
+        concurrency -- the maximum number of operations checked at once
+        """
+        if self._operation_journal is None:
+            raise Exception('Error resuming operations: the helper has no operation journal.')
+
+        purged = self._operation_journal.purge()
+        if purged:
+            logging.info('Purged %d finished operations from the journal.', purged)
+
+        def resume(record):
+            operation_id = record.get_operation_id()
+            if not self._operation_journal.claim(operation_id):
+                # Another worker claimed it since it was listed
+                return None
+            if wait:
+                result = self._poll_operation(
+                    record.get_operation_url(), operation_id=operation_id)
+            else:
+                try:
+                    finished, result, _ = self._check_operation(
+                        record.get_operation_url(), operation_id)
+                finally:
+                    # Lets any worker check it again, a no-op once it is finished
+                    self._operation_journal.release(operation_id)
+                if not finished:
+                    return None
+            return self._get_operation_response(record, result)
+
+        for record, response, error in BulkRunner.run_bounded(
+                resume, self._operation_journal.list_pending(), concurrency):
+            if error is not None:
+                logging.error('Error resuming operation %s.', record.get_operation_id())
+                yield record, None, error
+            elif response is not None:
+                # The listed record is still pending, report the finished one
+                yield (self._operation_journal.get(record.get_operation_id()) or record,
+                       response, None)
+
+    def _get_operation_response(self, record, result):
+        """Returns the response of a finished operation of the journal.
+
+        Arguments:
+        record -- the OperationRecord of the operation
+        result -- the processing result of the operation
+        """
+        if record.get_kind() == self._OPERATION_KIND_ENROLLMENT:
+            enrollment_response = EnrollmentResponse.EnrollmentResponse(result)
+            self._notify_profile_listeners(
+                'profile_enrolled',
+                record.get_context().get(self._PROFILE_ID_CONTEXT_KEY),
+                enrollment_response.get_enrollment_status())
+            return enrollment_response
+        return IdentificationResponse.IdentificationResponse(result)
+
+    def _poll_operation(self, operation_url, kind=None, context=None, operation_id=None,
+                        abandoned=None):
+        """Polls on an operation till it is done
+
+        Arguments:
+        operation_url -- the url to poll for the operation status
+        kind -- what the operation does, recorded in the operation journal
+        context -- the dictionary recorded with the operation in the operation journal
+        operation_id -- the ID of an operation already in the journal and claimed
+        abandoned -- an optional threading.Event that stops the polling once set
+        """
+        started = time.monotonic()
+        checks = [0]
+        if self._operation_journal is not None and operation_id is None:
+            operation_id = self._operation_journal.record_pending(operation_url, kind, context)
+
+        def check():
+            if abandoned is not None and abandoned.is_set():
+                raise Exception('Operation Error: the operation was abandoned')
+            checks[0] += 1
+            return self._check_operation(operation_url, operation_id)
+
+        try:
+            if self._poll_scheduler is not None:
+                # Let the shared scheduler thread track the operation
+                result = self._poll_scheduler.submit(check, self._polling_policy).result()
+                self._transport.record_operation(started, checks[0])
+                return result
+
+            attempt = 0
+            retry_after = None
+            deadline = self._polling_policy.get_deadline()
+            while True:
+                delay = self._polling_policy.get_delay(attempt, retry_after)
+                if deadline is not None and time.monotonic() + delay - started > deadline:
+                    raise Exception('Operation Error: operation did not finish within '
+                                    '{0} seconds'.format(deadline))
+                if abandoned is not None:
+                    abandoned.wait(delay)
                 else:
-                    time.sleep(self._OPERATION_STATUS_UPDATE_DELAY)
+                    time.sleep(delay)
+
+                finished, result, retry_after = check()
+                if finished:
+                    self._transport.record_operation(started, checks[0])
+                    return result
+                attempt += 1
         except:
+            if abandoned is not None and abandoned.is_set():
+                if operation_id is not None:
+                    # Nobody needs its result anymore
+                    self._operation_journal.delete(operation_id)
+                raise
+            if operation_id is not None:
+                # Lets another worker resume it, a no-op once it failed
+                self._operation_journal.release(operation_id)
             logging.error('Error polling the operation status.')
             raise
 
-    def _send_request(self, method, base_url, request_url, content_type_value, body=None):
+    def _check_operation(self, operation_url, operation_id=None):
+        """Checks the status of an operation once and returns a tuple of whether it is
+        finished, its processing result and the Retry-After header of the response.
+
+        Arguments:
+        operation_url -- the url to poll for the operation status
+        operation_id -- the ID of the operation in the operation journal, which records
+                        its outcome
+        """
+        # Parse the operation URL
+        parsed_url = urllib.parse.urlparse(operation_url)
+
+        # Send the request
+        res, message = self._send_request(
+            'GET',
+            ConnectionPool.get_host(parsed_url),
+            parsed_url.path,
+            self._JSON_CONTENT_HEADER_VALUE)
+
+        if res.status != self._STATUS_OK:
+            reason = res.reason if not message else message
+            raise RecognitionTransport.ServiceError(
+                'Operation Error: ' + reason, res.status)
+
+        # Parse the response body
+        operation_response = self._transport.parse_json(message)
+
+        if operation_response[self._OPERATION_STATUS_FIELD_NAME] == \
+                self._OPERATION_STATUS_SUCCEEDED:
+            result = operation_response[self._OPERATION_PROC_RES_FIELD_NAME]
+            if operation_id is not None:
+                self._operation_journal.complete(operation_id, result)
+            return True, result, None
+        elif operation_response[self._OPERATION_STATUS_FIELD_NAME] == \
+                self._OPERATION_STATUS_FAILED:
+            message = operation_response[self._OPERATION_MESSAGE_FIELD_NAME]
+            if operation_id is not None:
+                self._operation_journal.fail(operation_id, message)
+            raise Exception('Operation Error: ' + message)
+        return False, None, res.getheader(self._RETRY_AFTER_HEADER)
+
+    def _notify_profile_listeners(self, event, *args):
+        """Calls the given method on every registered profile listener.
+
+        Arguments:
+        event -- the name of the listener method
+        args -- the arguments passed to the listener method
+        """
+        for listener in self._profile_listeners:
+            getattr(listener, event)(*args)
+
+    def _send_request(self, method, base_url, request_url, content_type_value, body=None,
+                      fresh_connection=False):
         """Sends the request to the server then returns the response and the response body string.
 
         Arguments:
@@ -355,20 +800,8 @@ class IdentificationServiceHttpClientHelper:
         request_url -- the request url for the connection
         content_type_value -- the value of the content type field in the headers
         body -- the body of the request (needed only in POST methods)
+        fresh_connection -- send the request over a new connection
         """
-        try:
-            # Set the headers
-            headers = {self._CONTENT_TYPE_HEADER: content_type_value,
-                       self._SUBSCRIPTION_KEY_HEADER: self._subscription_key}
-
-            # Start the connection
-            with closing(http.client.HTTPSConnection(base_url)) as conn:
-                # Send the request
-                conn.request(method, request_url, body, headers)
-                res = conn.getresponse()
-                message = res.read().decode('utf-8')
-
-                return res, message
-        except:
-            logging.error('Error sending the request.')
-            raise
+        return self._transport.send_request(
+            method, base_url, request_url, content_type_value, body,
+            fresh_connection=fresh_connection)
@@ -31,9 +31,37 @@ WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 """
 
 from . import IdentificationServiceHttpClientHelper
+from . import ProfileCache
+from ..Recognition import VoiceActivityDetector
 import sys
+import logging
+import threading
 
-def identify_file(subscription_key, file_path, force_short_audio, profile_ids):
+_helpers = {}
+_helpers_lock = threading.Lock()
+
+def _get_helper_and_profile_cache(subscription_key, normalize_audio, trim_silence):
+    """Returns the helper and the profile cache shared by the calls of a subscription with
+    the same audio preparation.
+
+    Arguments:
+    subscription_key -- the subscription key string
+    normalize_audio -- whether the helper converts WAV audio to 16 kHz 16-bit mono
+    trim_silence -- whether the helper removes the silences of the audio
+    """
+    key = (subscription_key, normalize_audio, trim_silence)
+    with _helpers_lock:
+        if key not in _helpers:
+            helper = IdentificationServiceHttpClientHelper.IdentificationServiceHttpClientHelper(
+                subscription_key,
+                normalize_audio=normalize_audio,
+                voice_activity_detector=VoiceActivityDetector.VoiceActivityDetector()
+                if trim_silence else None)
+            _helpers[key] = (helper, ProfileCache.ProfileCache(helper))
+        return _helpers[key]
+
+def identify_file(subscription_key, file_path, force_short_audio, profile_ids,
+                  normalize_audio=False, trim_silence=False):
     """Identify an audio file on the server.
 
     Arguments:
@@ -41,28 +69,25 @@ def identify_file(subscription_key, file_path, force_short_audio, profile_ids):
     file_path -- the audio file path for identification
     profile_ids -- an array of test profile IDs strings
     force_short_audio -- waive the recommended minimum audio limit needed for enrollment
+    normalize_audio -- convert WAV audio to 16 kHz 16-bit mono before uploading it
+    trim_silence -- remove the silences of the audio before uploading it
     """
-    helper = IdentificationServiceHttpClientHelper.IdentificationServiceHttpClientHelper(
-        subscription_key)
-    print(file_path)
-    print(force_short_audio.lower())
-    print(profile_ids)
-
-    profiles = helper.get_all_profiles()
-    profile_id = []
-    tmp = ''
-    for profile in profiles:
-        if profile.get_enrollment_status() == 'Enrolled':
-           tmp = '(' + profile.get_profile_id() + ')'
-           profile_id.append(tmp)
-    print(profiles)
-    
-    identification_response = helper.identify_file(
-        file_path, profile_id,
-        force_short_audio.lower() == "true")
-
-    print('Identified Speaker = {0}'.format(identification_response.get_identified_profile_id()))
-    print('Confidence = {0}'.format(identification_response.get_confidence()))
+    helper, profile_cache = _get_helper_and_profile_cache(
+        subscription_key, normalize_audio, trim_silence)
+    logging.debug('Identifying %s, force short audio %s', file_path, force_short_audio)
+
+    profile_id = ['(' + enrolled_id + ')'
+                  for enrolled_id in profile_cache.get_enrolled_profile_ids()]
+
+    try:
+        identification_response = helper.identify_file(
+            file_path, profile_id,
+            force_short_audio.lower() == "true")
+    except:
+        # A profile may have changed outside of this process, refetch next time
+        profile_cache.invalidate()
+        raise
+
     message = 'Identified Speaker = {0}'.format(identification_response.get_identified_profile_id()) + 'Confidence = {0}'.format(identification_response.get_confidence())
     return message
 
@@ -79,7 +104,7 @@ if __name__ == "__main__":
         print('\t<profile_ids> the profile IDs for the profiles to identify the audio from.')
         sys.exit('Error: Incorrect Usage.')
 
-    identify_file(sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4:])
+    print(identify_file(sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4:]))
 
 def function2(str):
     return "function 2 : \n" + str
\ No newline at end of file
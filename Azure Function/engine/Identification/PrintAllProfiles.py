@@ -42,7 +42,7 @@ def print_all_profiles(subscription_key):
     helper = IdentificationServiceHttpClientHelper.IdentificationServiceHttpClientHelper(
         subscription_key)
 
-    profiles = helper.get_all_profiles()
+    profiles = helper.iter_all_profiles()
 
     print('Profile ID, Locale, Enrollment Speech Time, Remaining Enrollment Speech Time,'
           ' Created Date Time, Last Action Date Time, Enrollment Status')
@@ -0,0 +1,122 @@
+import threading
+import time
+from . import ProfileRegistry
+
+
+class ProfileCache:
+    """In-process registry of the profiles of a subscription with a time to live.
+
+    The profiles are held in a ProfileRegistry, refreshed incrementally from the listing
+    of the server, and the cache keeps a precomputed list of the enrolled profile IDs so
+    that an identification does not need to list every profile first. It registers itself
+    with the helper, which reports profile creations, enrollments, deletions and resets so
+    the cache stays current between refreshes.
+    """
+
+    _ENROLLMENT_STATUS_ENROLLED = 'Enrolled'
+    _DEFAULT_TTL = 300
+
+    def __init__(self, helper, ttl=_DEFAULT_TTL):
+        """Constructor of the ProfileCache class.
+
+        Arguments:
+        helper -- the IdentificationServiceHttpClientHelper used to list the profiles
+        ttl -- seconds after which the profiles are fetched from the server again
+        """
+        self._helper = helper
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._registry = ProfileRegistry.ProfileRegistry()
+        self._enrolled_ids_list = []
+        self._expires_at = 0
+        helper.add_profile_listener(self)
+
+    def get_enrolled_profile_ids(self):
+        """Returns the list of the IDs of the enrolled profiles, refreshing it if expired."""
+        with self._lock:
+            if time.monotonic() >= self._expires_at:
+                self._refresh()
+            return self._enrolled_ids_list
+
+    def get_enrollment_status(self, profile_id):
+        """Returns the cached enrollment status of a profile, or None if it is unknown.
+
+        Arguments:
+        profile_id -- the profile ID string
+        """
+        with self._lock:
+            if time.monotonic() >= self._expires_at:
+                self._refresh()
+            return self._registry.get_enrollment_status(profile_id)
+
+    def get_registry(self):
+        """Returns the ProfileRegistry of the cached profiles, refreshing it if expired, for
+        lookups by locale or last action time."""
+        with self._lock:
+            if time.monotonic() >= self._expires_at:
+                self._refresh()
+            return self._registry
+
+    def invalidate(self, profile_id=None):
+        """Forces the next lookup to fetch the profiles from the server.
+
+        Arguments:
+        profile_id -- only forget this profile, the whole cache is expired if omitted
+        """
+        with self._lock:
+            if profile_id is None:
+                self._expires_at = 0
+            else:
+                self._set_status(profile_id, None)
+
+    def profile_created(self, profile_id):
+        """Records a profile created through the helper."""
+        with self._lock:
+            self._set_status(profile_id, 'Enrolling')
+
+    def profile_enrolled(self, profile_id, enrollment_status):
+        """Records the enrollment status returned by an enrollment through the helper."""
+        with self._lock:
+            self._set_status(profile_id, enrollment_status)
+
+    def profile_deleted(self, profile_id):
+        """Records a profile deleted through the helper."""
+        with self._lock:
+            self._set_status(profile_id, None)
+
+    def profile_reset(self, profile_id):
+        """Records a profile whose enrollments were reset through the helper."""
+        with self._lock:
+            self._set_status(profile_id, 'Enrolling')
+
+    def _refresh(self):
+        """Fetches every profile from the server, applying them to the registry as they
+        are read. Must be called with the lock held."""
+        try:
+            added, updated, removed = self._registry.refresh(self._helper.iter_all_profiles())
+        except:
+            # The profiles read before the error are already in the registry
+            self._publish_enrolled_ids()
+            raise
+        if added or updated or removed:
+            self._publish_enrolled_ids()
+        self._expires_at = time.monotonic() + self._ttl
+
+    def _set_status(self, profile_id, enrollment_status):
+        """Updates the status of one profile. Must be called with the lock held."""
+        if enrollment_status is None:
+            previous = self._registry.get_enrollment_status(profile_id)
+            self._registry.remove(profile_id)
+        else:
+            previous = self._registry.set_enrollment_status(profile_id, enrollment_status)
+
+        if (previous == self._ENROLLMENT_STATUS_ENROLLED) != \
+                (enrollment_status == self._ENROLLMENT_STATUS_ENROLLED):
+            self._publish_enrolled_ids()
+
+    def _publish_enrolled_ids(self):
+        """Rebuilds the list of the enrolled profile IDs from the registry. Must be called
+        with the lock held."""
+        # Publish a new list, callers may still hold the previous one
+        self._enrolled_ids_list = sorted(self._registry.get_profile_ids(
+            self._ENROLLMENT_STATUS_ENROLLED))
@@ -0,0 +1,373 @@
+import array
+import bisect
+import calendar
+import math
+import threading
+import time
+from . import IdentificationProfile
+
+_MISSING = float('nan')
+# Number of profiles of a listing applied at a time by refresh
+_REFRESH_BATCH_SIZE = 500
+# Seconds since the epoch of the days of the parsed dates, most profiles share few days
+_day_seconds = {}
+
+
+class ProfileRegistry:
+    """Compact, indexed registry of the identification profiles of a subscription.
+
+    Profiles are stored in columns rather than as one object per profile: the IDs in a
+    list, the enrollment status and locale as small codes into tables of the distinct
+    values, and the times as arrays of floats, with dates as seconds since the epoch. The
+    rows of removed profiles are reused. The IDs are indexed by enrollment status and by
+    locale, and a sorted index by last action time is built on first use after a change.
+
+    refresh applies a listing of the server as a diff, so only the profiles that were
+    added, changed or removed since the previous listing touch the indexes. The listing is
+    read without holding the lock and applied in batches, so lookups are not blocked while
+    it is downloaded.
+    """
+
+    def __init__(self):
+        """Constructor of the ProfileRegistry class."""
+        self._lock = threading.Lock()
+        self._rows = {}
+        self._ids = []
+        self._free_rows = []
+        self._status_codes = bytearray()
+        self._locale_codes = array.array('H')
+        self._enrollment_speech_times = array.array('d')
+        self._remaining_enrollment_times = array.array('d')
+        self._created_date_times = array.array('d')
+        self._last_action_date_times = array.array('d')
+        self._statuses = _ValueTable()
+        self._locales = _ValueTable()
+        self._ids_by_status = {}
+        self._ids_by_locale = {}
+        self._last_action_keys = None
+        self._last_action_ids = None
+        # The sets of the profile IDs seen by the refreshes in progress
+        self._refreshes = []
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, profile_id):
+        return profile_id in self._rows
+
+    def refresh(self, profiles):
+        """Makes the registry hold exactly the given profiles, e.g. the result of
+        get_all_profiles, and returns a tuple of the number of profiles added, updated and
+        removed.
+
+        The profiles are applied as they are read, so if the iterable fails the profiles
+        read before the error are registered. Profiles registered by put or
+        set_enrollment_status while the refresh runs are kept even if they are not listed.
+
+        Arguments:
+        profiles -- an iterable of IdentificationProfile objects
+        """
+        counts = [0, 0, 0]
+        seen = set()
+        with self._lock:
+            self._refreshes.append(seen)
+        try:
+            batch = []
+            for profile in profiles:
+                batch.append(profile)
+                if len(batch) >= _REFRESH_BATCH_SIZE:
+                    self._apply_batch(batch, seen, counts)
+                    batch = []
+            self._apply_batch(batch, seen, counts)
+            with self._lock:
+                removed = [profile_id for profile_id in self._rows if profile_id not in seen]
+                for profile_id in removed:
+                    self._remove(profile_id)
+        finally:
+            with self._lock:
+                self._refreshes.remove(seen)
+        return counts[1], counts[2], len(removed)
+
+    def put(self, profile):
+        """Adds or updates one profile, e.g. the result of get_profile.
+
+        Arguments:
+        profile -- the IdentificationProfile
+        """
+        with self._lock:
+            self._put(profile)
+            self._mark_seen(profile.get_profile_id())
+
+    def remove(self, profile_id):
+        """Removes a profile and returns whether it was registered.
+
+        Arguments:
+        profile_id -- the profile ID string
+        """
+        with self._lock:
+            return self._remove(profile_id)
+
+    def set_enrollment_status(self, profile_id, enrollment_status):
+        """Sets the enrollment status of a profile, registering it if it is unknown, and
+        returns its previous status or None.
+
+        Arguments:
+        profile_id -- the profile ID string
+        enrollment_status -- the new enrollment status string
+        """
+        with self._lock:
+            self._mark_seen(profile_id)
+            row = self._rows.get(profile_id)
+            if row is None:
+                self._put(IdentificationProfile.IdentificationProfile({
+                    IdentificationProfile.IdentificationProfile._PROFILE_ID: profile_id,
+                    IdentificationProfile.IdentificationProfile._ENROLLMENT_STATUS:
+                        enrollment_status}))
+                return None
+            previous = self._statuses.get_value(self._status_codes[row])
+            if previous != enrollment_status:
+                self._set_status(row, previous, enrollment_status)
+            return previous
+
+    def get_enrollment_status(self, profile_id):
+        """Returns the enrollment status of a profile, or None if it is not registered.
+
+        Arguments:
+        profile_id -- the profile ID string
+        """
+        with self._lock:
+            row = self._rows.get(profile_id)
+            if row is None:
+                return None
+            return self._statuses.get_value(self._status_codes[row])
+
+    def get_profile(self, profile_id):
+        """Returns a profile as an IdentificationProfile, or None if it is not registered.
+        Its dates are formatted back from the stored times, with millisecond precision.
+
+        Arguments:
+        profile_id -- the profile ID string
+        """
+        with self._lock:
+            row = self._rows.get(profile_id)
+            if row is None:
+                return None
+            return IdentificationProfile.IdentificationProfile({
+                IdentificationProfile.IdentificationProfile._PROFILE_ID: profile_id,
+                IdentificationProfile.IdentificationProfile._LOCALE:
+                    self._locales.get_value(self._locale_codes[row]),
+                IdentificationProfile.IdentificationProfile._ENROLLMENT_SPEECH_TIME:
+                    _get_number(self._enrollment_speech_times[row]),
+                IdentificationProfile.IdentificationProfile._REMAINING_ENROLLMENT_TIME:
+                    _get_number(self._remaining_enrollment_times[row]),
+                IdentificationProfile.IdentificationProfile._CREATED_DATE_TIME:
+                    _format_date_time(self._created_date_times[row]),
+                IdentificationProfile.IdentificationProfile._LAST_ACTION_DATE_TIME:
+                    _format_date_time(self._last_action_date_times[row]),
+                IdentificationProfile.IdentificationProfile._ENROLLMENT_STATUS:
+                    self._statuses.get_value(self._status_codes[row])})
+
+    def get_profile_ids(self, enrollment_status=None, locale=None):
+        """Returns the set of the IDs of the profiles with the given enrollment status and
+        locale, or of every profile if both are omitted.
+
+        Arguments:
+        enrollment_status -- only return profiles with this status, e.g. 'Enrolled'
+        locale -- only return profiles with this locale, e.g. 'en-us'
+        """
+        with self._lock:
+            if enrollment_status is None and locale is None:
+                return set(self._rows)
+            if enrollment_status is None:
+                return set(self._ids_by_locale.get(locale, ()))
+            if locale is None:
+                return set(self._ids_by_status.get(enrollment_status, ()))
+            by_status = self._ids_by_status.get(enrollment_status, set())
+            by_locale = self._ids_by_locale.get(locale, set())
+            return by_status & by_locale
+
+    def get_profile_ids_by_last_action(self, since=None, until=None):
+        """Returns the list of the IDs of the profiles whose last action is within a time
+        range, oldest first. Profiles without a last action time are not returned.
+
+        Arguments:
+        since -- the start of the range in seconds since the epoch, inclusive
+        until -- the end of the range in seconds since the epoch, exclusive
+        """
+        with self._lock:
+            if self._last_action_keys is None:
+                self._build_last_action_index()
+            keys = self._last_action_keys
+            start = 0 if since is None else bisect.bisect_left(keys, since)
+            end = len(keys) if until is None else bisect.bisect_left(keys, until)
+            return self._last_action_ids[start:end]
+
+    def _apply_batch(self, profiles, seen, counts):
+        """Writes a batch of listed profiles, counting them by the change returned by _put
+        in counts."""
+        with self._lock:
+            for profile in profiles:
+                seen.add(profile.get_profile_id())
+                counts[self._put(profile)] += 1
+
+    def _mark_seen(self, profile_id):
+        """Keeps a profile registered outside a refresh in progress from being removed by
+        it. Must be called with the lock held."""
+        for seen in self._refreshes:
+            seen.add(profile_id)
+
+    def _put(self, profile):
+        """Writes one profile to its row and returns 1 if it was added, 2 if it changed
+        and 0 otherwise. Must be called with the lock held."""
+        profile_id = profile.get_profile_id()
+        status = profile.get_enrollment_status()
+        locale = profile.get_locale()
+        last_action = _parse_date_time(profile.get_last_action_date_time())
+        remaining = _get_float(profile.get_remaining_enrollment_time())
+
+        row = self._rows.get(profile_id)
+        if row is None:
+            if self._free_rows:
+                row = self._free_rows.pop()
+                self._ids[row] = profile_id
+            else:
+                row = len(self._ids)
+                self._ids.append(profile_id)
+                self._status_codes.append(0)
+                self._locale_codes.append(0)
+                for column in self._get_time_columns():
+                    column.append(_MISSING)
+            self._rows[profile_id] = row
+            self._status_codes[row] = self._statuses.get_code(status)
+            self._locale_codes[row] = self._locales.get_code(locale)
+            self._add_to_index(self._ids_by_status, status, profile_id)
+            self._add_to_index(self._ids_by_locale, locale, profile_id)
+            change = 1
+        else:
+            previous_status = self._statuses.get_value(self._status_codes[row])
+            previous_locale = self._locales.get_value(self._locale_codes[row])
+            # The service updates the last action time on every change of a profile
+            if (previous_status == status and previous_locale == locale
+                    and _same(self._last_action_date_times[row], last_action)
+                    and _same(self._remaining_enrollment_times[row], remaining)):
+                return 0
+            if previous_status != status:
+                self._set_status(row, previous_status, status)
+            if previous_locale != locale:
+                self._remove_from_index(self._ids_by_locale, previous_locale, profile_id)
+                self._locale_codes[row] = self._locales.get_code(locale)
+                self._add_to_index(self._ids_by_locale, locale, profile_id)
+            change = 2
+
+        self._enrollment_speech_times[row] = _get_float(profile.get_enrollment_speech_time())
+        self._remaining_enrollment_times[row] = remaining
+        self._created_date_times[row] = _parse_date_time(profile.get_created_date_time())
+        if change == 1 or not _same(self._last_action_date_times[row], last_action):
+            self._last_action_date_times[row] = last_action
+            self._last_action_keys = None
+        return change
+
+    def _remove(self, profile_id):
+        """Removes one profile. Must be called with the lock held."""
+        row = self._rows.pop(profile_id, None)
+        if row is None:
+            return False
+        self._remove_from_index(
+            self._ids_by_status, self._statuses.get_value(self._status_codes[row]), profile_id)
+        self._remove_from_index(
+            self._ids_by_locale, self._locales.get_value(self._locale_codes[row]), profile_id)
+        self._ids[row] = None
+        self._free_rows.append(row)
+        if not math.isnan(self._last_action_date_times[row]):
+            self._last_action_keys = None
+        return True
+
+    def _set_status(self, row, previous_status, status):
+        """Moves a row to another enrollment status. Must be called with the lock held."""
+        profile_id = self._ids[row]
+        self._remove_from_index(self._ids_by_status, previous_status, profile_id)
+        self._status_codes[row] = self._statuses.get_code(status)
+        self._add_to_index(self._ids_by_status, status, profile_id)
+
+    def _build_last_action_index(self):
+        """Sorts the profiles by last action time. Must be called with the lock held."""
+        times = self._last_action_date_times
+        rows = sorted((row for row in self._rows.values() if not math.isnan(times[row])),
+                      key=times.__getitem__)
+        self._last_action_keys = array.array('d', (times[row] for row in rows))
+        self._last_action_ids = [self._ids[row] for row in rows]
+
+    def _get_time_columns(self):
+        return (self._enrollment_speech_times, self._remaining_enrollment_times,
+                self._created_date_times, self._last_action_date_times)
+
+    @staticmethod
+    def _add_to_index(index, value, profile_id):
+        ids = index.get(value)
+        if ids is None:
+            ids = index[value] = set()
+        ids.add(profile_id)
+
+    @staticmethod
+    def _remove_from_index(index, value, profile_id):
+        ids = index.get(value)
+        if ids is not None:
+            ids.discard(profile_id)
+            if not ids:
+                del index[value]
+
+
+class _ValueTable:
+    """Maps the few distinct values of a column, such as the locales, to small codes."""
+
+    def __init__(self):
+        # Code 0 stands for None
+        self._values = [None]
+        self._codes = {None: 0}
+
+    def get_code(self, value):
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self._values)
+            self._values.append(value)
+        return code
+
+    def get_value(self, code):
+        return self._values[code]
+
+
+def _parse_date_time(value):
+    """Returns the seconds since the epoch of a date of the service, such as
+    2015-04-23T18:25:43.511Z in UTC, or NaN if missing."""
+    if not value or len(value) < 19 or value[10] != 'T':
+        return _MISSING
+    try:
+        day = _day_seconds.get(value[:10])
+        if day is None:
+            day = _day_seconds[value[:10]] = calendar.timegm(
+                time.strptime(value[:10], '%Y-%m-%d'))
+        return day + int(value[11:13]) * 3600 + int(value[14:16]) * 60 + \
+            float(value[17:].rstrip('Z'))
+    except ValueError:
+        return _MISSING
+
+
+def _format_date_time(seconds):
+    """Returns a date in the format of the service, or None if missing."""
+    if math.isnan(seconds):
+        return None
+    whole_seconds, milliseconds = divmod(int(round(seconds * 1000)), 1000)
+    return '{0}.{1:03d}Z'.format(
+        time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(whole_seconds)), milliseconds)
+
+
+def _get_float(value):
+    return _MISSING if value is None else float(value)
+
+
+def _get_number(value):
+    return None if math.isnan(value) else value
+
+
+def _same(stored, value):
+    return stored == value or (math.isnan(stored) and math.isnan(value))
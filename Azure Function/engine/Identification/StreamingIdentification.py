@@ -0,0 +1,188 @@
+import numpy as np
+from .IdentificationServiceHttpClientHelper import IdentificationServiceHttpClientHelper
+from ..Recognition import AudioBody
+from ..Recognition import AudioNormalizer
+from ..Recognition import BulkRunner
+from ..Recognition import VoiceActivityDetector
+
+
+class StreamingIdentification:
+    """Identifies the speakers of recordings longer than the service accepts.
+
+    The audio is read and decoded incrementally and cut into overlapping windows. Every
+    window ends in a pause found by voice activity detection near its nominal length, so
+    words are not split between windows. Windows are identified concurrently and the
+    results are merged into a timeline of speaker segments, in which the overlap of two
+    windows is split at its middle and consecutive windows of the same speaker are joined.
+
+    Only the current window, the windows being identified and the segment being built are
+    held in memory, whatever the length of the recording.
+    """
+
+    _DEFAULT_WINDOW_SECONDS = 30.0
+    _DEFAULT_OVERLAP_SECONDS = 5.0
+    _DEFAULT_SEARCH_SECONDS = 5.0
+    _DEFAULT_MIN_SPEECH_SECONDS = 1.0
+    _DEFAULT_CONCURRENCY = 4
+    _READ_BLOCK_SECONDS = 1.0
+
+    def __init__(self, helper, window_seconds=_DEFAULT_WINDOW_SECONDS,
+                 overlap_seconds=_DEFAULT_OVERLAP_SECONDS,
+                 search_seconds=_DEFAULT_SEARCH_SECONDS,
+                 min_speech_seconds=_DEFAULT_MIN_SPEECH_SECONDS,
+                 concurrency=_DEFAULT_CONCURRENCY, voice_activity_detector=None):
+        """Constructor of the StreamingIdentification class.
+
+        Arguments:
+        helper -- the IdentificationServiceHttpClientHelper identifying the windows
+        window_seconds -- the nominal length of a window
+        overlap_seconds -- the audio shared by consecutive windows
+        search_seconds -- how far before its nominal end a window may end in a pause
+        min_speech_seconds -- windows with less speech are skipped without calling the
+                              service
+        concurrency -- the maximum number of windows identified at once
+        voice_activity_detector -- the VoiceActivityDetector finding the pauses
+        """
+        if overlap_seconds + search_seconds >= window_seconds:
+            raise Exception('Error configuring streaming identification: the overlap and '
+                            'search lengths must be shorter than the window')
+        self._helper = helper
+        self._window_seconds = window_seconds
+        self._overlap_seconds = overlap_seconds
+        self._search_seconds = search_seconds
+        self._min_speech_seconds = min_speech_seconds
+        self._concurrency = concurrency
+        self._voice_activity_detector = \
+            voice_activity_detector or VoiceActivityDetector.VoiceActivityDetector()
+
+    def identify_stream(self, audio, test_profile_ids, force_short_audio=True):
+        """Identifies the speakers of a WAV recording and yields a tuple of
+        (start, end, profile_id, confidence) for every segment of the timeline, in order.
+        Start and end are in seconds from the beginning of the recording.
+
+        Arguments:
+        audio -- the recording as a file path, bytes, a readable stream or an iterator of
+                 chunks, e.g. downloadFile.iter_blob_chunks
+        test_profile_ids -- an array of test profile IDs strings
+        force_short_audio -- instruct the service to waive the recommended minimum audio
+                             limit, windows are usually shorter than it
+        """
+        def identify(window):
+            try:
+                if window.speech_seconds < self._min_speech_seconds:
+                    return None
+                # Encoding here resamples the windows concurrently
+                wav = AudioNormalizer.encode_wav(
+                    AudioNormalizer.resample(window.samples, window.sample_rate))
+                return self._helper.identify_file(wav, test_profile_ids, force_short_audio)
+            finally:
+                # Results may wait for earlier windows, do not keep their audio
+                window.samples = None
+
+        completed = {}
+        next_index = 0
+        segment = None
+        for window, response, error in BulkRunner.run_bounded(
+                identify, self._iter_windows(audio), self._concurrency):
+            completed[window.index] = window, response, error
+            while next_index in completed:
+                window, response, error = completed.pop(next_index)
+                next_index += 1
+                if error is not None:
+                    raise error
+                if response is None:
+                    if segment is not None:
+                        yield tuple(segment)
+                    segment = None
+                    continue
+
+                profile_id = response.get_identified_profile_id()
+                confidence = response.get_confidence()
+                if segment is not None and segment[2] == profile_id:
+                    segment[1] = window.end
+                    if self._rank(confidence) > self._rank(segment[3]):
+                        segment[3] = confidence
+                    continue
+
+                start = window.start
+                if segment is not None:
+                    if window.start < segment[1]:
+                        # Split the overlap of the two windows at its middle
+                        start = (window.start + segment[1]) / 2
+                        segment[1] = start
+                    yield tuple(segment)
+                segment = [start, window.end, profile_id, confidence]
+
+        if segment is not None:
+            yield tuple(segment)
+
+    def _iter_windows(self, audio):
+        """Reads the audio incrementally and yields its _Window objects."""
+        reader = AudioNormalizer.WavStreamReader(AudioBody.iter_chunks(audio))
+        sample_rate = reader.sample_rate
+        window_length = int(self._window_seconds * sample_rate)
+        overlap_length = int(self._overlap_seconds * sample_rate)
+
+        buffer = np.zeros(0, dtype=np.float32)
+        buffer_start = 0
+        covered_until = 0
+        index = 0
+        for block in reader.iter_blocks(int(self._READ_BLOCK_SECONDS * sample_rate)):
+            buffer = np.concatenate((buffer, block))
+            while len(buffer) >= window_length:
+                end, speech_seconds = self._find_end(buffer[:window_length], sample_rate)
+                yield _Window(index, buffer[:end], buffer_start, sample_rate, speech_seconds)
+                index += 1
+                covered_until = buffer_start + end
+                advance = end - overlap_length
+                buffer = buffer[advance:]
+                buffer_start += advance
+
+        # The rest of the recording, unless the last window already covered it
+        if len(buffer) and buffer_start + len(buffer) > covered_until:
+            speech = self._voice_activity_detector.detect(buffer, sample_rate)
+            frame_length = self._voice_activity_detector.get_frame_length(sample_rate)
+            yield _Window(index, buffer, buffer_start, sample_rate,
+                          np.count_nonzero(speech) * frame_length / float(sample_rate))
+
+    def _find_end(self, samples, sample_rate):
+        """Returns the end of a window in samples, at the last pause within the search
+        length of its nominal end, and the net speech duration up to that end.
+
+        Arguments:
+        samples -- the samples of the window at its nominal length
+        sample_rate -- the sample rate of the samples
+        """
+        speech = self._voice_activity_detector.detect(samples, sample_rate)
+        frame_length = self._voice_activity_detector.get_frame_length(sample_rate)
+        search_start = max(0, len(speech) - int(
+            self._search_seconds * sample_rate) // frame_length)
+        pauses = np.flatnonzero(~speech[search_start:])
+
+        if len(pauses):
+            # Cut in the middle of the last silent frame
+            frame = search_start + pauses[-1]
+            end = frame * frame_length + frame_length // 2
+        else:
+            frame = len(speech)
+            end = len(samples)
+        speech_seconds = np.count_nonzero(speech[:frame]) * frame_length / float(sample_rate)
+        return end, speech_seconds
+
+    @staticmethod
+    def _rank(confidence):
+        return IdentificationServiceHttpClientHelper._CONFIDENCE_RANKS.get(confidence, 0)
+
+
+class _Window:
+    """A window of the recording with its start and end in seconds."""
+
+    __slots__ = ('index', 'start', 'end', 'samples', 'sample_rate', 'speech_seconds')
+
+    def __init__(self, index, samples, offset, sample_rate, speech_seconds):
+        self.index = index
+        self.start = offset / float(sample_rate)
+        self.end = (offset + len(samples)) / float(sample_rate)
+        self.samples = samples
+        self.sample_rate = sample_rate
+        self.speech_seconds = speech_seconds
@@ -0,0 +1,122 @@
+import contextlib
+
+
+@contextlib.contextmanager
+def open_audio(audio):
+    """Yields a request body for the given audio.
+
+    File paths are opened, bytes and memoryviews are sent as they are, readable streams
+    and iterators of chunks are passed through so http.client sends them with chunked
+    transfer encoding without buffering the whole clip.
+
+    Arguments:
+    audio -- a file path string, bytes, bytearray, memoryview, a readable binary stream
+             or an iterator of bytes chunks
+    """
+    if isinstance(audio, str):
+        with open(audio, 'rb') as body:
+            yield body
+    elif isinstance(audio, (bytes, bytearray, memoryview)) or hasattr(audio, 'read'):
+        yield audio
+    elif hasattr(audio, '__iter__'):
+        yield iter(audio)
+    else:
+        raise Exception('Error reading audio: unsupported audio type {0}'.format(
+            type(audio).__name__))
+
+
+def read_audio(audio):
+    """Returns the whole audio as bytes.
+
+    Arguments:
+    audio -- any audio accepted by open_audio
+    """
+    if isinstance(audio, bytes):
+        return audio
+    if isinstance(audio, (bytearray, memoryview)):
+        return bytes(audio)
+    with open_audio(audio) as body:
+        if hasattr(body, 'read'):
+            return body.read()
+        return b''.join(body)
+
+
+def prepare_audio(audio, normalize_audio=False, voice_activity_detector=None,
+                  min_speech_seconds=0):
+    """Returns the audio to upload, converted to 16 kHz, 16-bit, mono PCM WAV when audio
+    normalization is enabled and with its silences removed when a voice activity detector
+    is set, or the audio unchanged when neither is.
+
+    Arguments:
+    audio -- any audio accepted by open_audio
+    normalize_audio -- whether to convert the audio with AudioNormalizer.normalize_wav
+    voice_activity_detector -- an optional VoiceActivityDetector trimming the silences
+    min_speech_seconds -- the speech the trimmed audio must contain, or it is rejected
+    """
+    if not normalize_audio and voice_activity_detector is None:
+        return audio
+
+    data = read_audio(audio)
+    if normalize_audio:
+        # Imported here so that sending audio as it is does not need NumPy
+        from . import AudioNormalizer
+        data = AudioNormalizer.normalize_wav(data)
+    if voice_activity_detector is not None:
+        data, speech_seconds = voice_activity_detector.trim_wav(data)
+        if speech_seconds < min_speech_seconds:
+            raise Exception('Error preparing audio: {0:.2f} seconds of speech found, at '
+                            'least {1} seconds are needed'.format(
+                                speech_seconds, min_speech_seconds))
+    return data
+
+
+def iter_chunks(audio, chunk_size=64 * 1024):
+    """Yields the audio incrementally as bytes chunks of at most chunk_size bytes, so
+    arbitrarily long recordings can be processed without reading them whole.
+
+    Arguments:
+    audio -- any audio accepted by open_audio
+    chunk_size -- the maximum number of bytes read at once from files and streams
+    """
+    with open_audio(audio) as body:
+        if isinstance(body, (bytes, bytearray, memoryview)):
+            body = memoryview(body)
+            for start in range(0, len(body), chunk_size):
+                yield bytes(body[start:start + chunk_size])
+        elif hasattr(body, 'read'):
+            while True:
+                chunk = body.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        else:
+            for chunk in body:
+                yield chunk
+
+
+def tell(body):
+    """Returns the current position of a seekable request body, or None.
+
+    Arguments:
+    body -- a request body yielded by open_audio
+    """
+    try:
+        return body.tell()
+    except (AttributeError, OSError):
+        return None
+
+
+def rewind(body, position):
+    """Rewinds a request body so that it can be sent again, returns whether that is
+    possible. Iterators and unseekable streams cannot be sent twice.
+
+    Arguments:
+    body -- a request body yielded by open_audio
+    position -- the position returned by tell before the body was sent
+    """
+    if body is None or isinstance(body, (str, bytes, bytearray, memoryview)):
+        return True
+    if position is None:
+        return False
+    body.seek(position)
+    return True
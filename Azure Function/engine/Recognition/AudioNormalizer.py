@@ -0,0 +1,305 @@
+import math
+import struct
+import numpy as np
+
+TARGET_SAMPLE_RATE = 16000
+TARGET_BITS_PER_SAMPLE = 16
+TARGET_CHANNELS = 1
+
+_WAVE_FORMAT_PCM = 0x0001
+_WAVE_FORMAT_IEEE_FLOAT = 0x0003
+_WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+_RESAMPLER_HALF_WIDTH = 16
+
+
+class WavAudio:
+    """Decoded PCM audio of a WAV file."""
+
+    def __init__(self, sample_rate, bits_per_sample, samples):
+        """Constructor of the WavAudio class.
+
+        Arguments:
+        sample_rate -- the number of frames per second
+        bits_per_sample -- the sample width of the source encoding
+        samples -- float32 array of shape (frames, channels) scaled to [-1, 1]
+        """
+        self.sample_rate = sample_rate
+        self.bits_per_sample = bits_per_sample
+        self.samples = samples
+
+    def get_channels(self):
+        """Returns the number of channels"""
+        return self.samples.shape[1]
+
+    def get_duration(self):
+        """Returns the duration in seconds"""
+        return self.samples.shape[0] / float(self.sample_rate)
+
+
+def parse_wav(data):
+    """Parses the RIFF header of a WAV file and returns its decoded WavAudio.
+
+    Arguments:
+    data -- the bytes of the WAV file
+    """
+    format_tag, channels, sample_rate, bits_per_sample, pcm = _parse_header(data)
+    frames = len(pcm) // (channels * bits_per_sample // 8)
+    samples = _decode_samples(pcm, format_tag, bits_per_sample)
+    return WavAudio(sample_rate, bits_per_sample, samples.reshape(frames, channels))
+
+
+def _parse_header(data):
+    """Returns the format tag, channels, sample rate, sample width and a memoryview of the
+    whole frames of the data chunk of a WAV file."""
+    data = memoryview(data)
+    if len(data) < 12 or bytes(data[0:4]) != b'RIFF' or bytes(data[8:12]) != b'WAVE':
+        raise Exception('Error parsing audio: not a RIFF WAVE file')
+
+    fmt = None
+    pcm = None
+    offset = 12
+    while offset + 8 <= len(data):
+        chunk_id = bytes(data[offset:offset + 4])
+        chunk_size = struct.unpack_from('<I', data, offset + 4)[0]
+        body = data[offset + 8:offset + 8 + chunk_size]
+        if chunk_id == b'fmt ':
+            fmt = body
+        elif chunk_id == b'data':
+            pcm = body
+            break
+        # Chunks are word aligned
+        offset += 8 + chunk_size + (chunk_size & 1)
+
+    if fmt is None or pcm is None:
+        raise Exception('Error parsing audio: missing fmt or data chunk')
+
+    format_tag, channels, sample_rate, block_align, bits_per_sample = _parse_fmt(fmt)
+    frames = len(pcm) // block_align
+    return format_tag, channels, sample_rate, bits_per_sample, pcm[:frames * block_align]
+
+
+def _parse_fmt(fmt):
+    """Returns the format tag, channels, sample rate, block alignment and sample width of
+    the body of a fmt chunk."""
+    if len(fmt) < 16:
+        raise Exception('Error parsing audio: truncated fmt chunk')
+    format_tag, channels, sample_rate, _, block_align, bits_per_sample = \
+        struct.unpack_from('<HHIIHH', fmt, 0)
+    if format_tag == _WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+        # The actual format is the first two bytes of the sub-format GUID
+        format_tag = struct.unpack_from('<H', fmt, 24)[0]
+    return format_tag, channels, sample_rate, block_align, bits_per_sample
+
+
+def _decode_samples(pcm, format_tag, bits_per_sample):
+    """Returns the samples of a data chunk as a flat float32 array in [-1, 1]."""
+    if format_tag == _WAVE_FORMAT_IEEE_FLOAT and bits_per_sample == 32:
+        return np.frombuffer(pcm, dtype='<f4').astype(np.float32)
+    if format_tag == _WAVE_FORMAT_IEEE_FLOAT and bits_per_sample == 64:
+        return np.frombuffer(pcm, dtype='<f8').astype(np.float32)
+    if format_tag != _WAVE_FORMAT_PCM:
+        raise Exception('Error parsing audio: unsupported WAV format {0}'.format(format_tag))
+
+    if bits_per_sample == 8:
+        # 8-bit PCM is unsigned
+        return (np.frombuffer(pcm, dtype=np.uint8).astype(np.float32) - 128) / 128
+    if bits_per_sample == 16:
+        return np.frombuffer(pcm, dtype='<i2').astype(np.float32) / 32768
+    if bits_per_sample == 24:
+        raw = np.frombuffer(pcm, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        values = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+        values = np.where(values & 0x800000, values - 0x1000000, values)
+        return values.astype(np.float32) / 8388608
+    if bits_per_sample == 32:
+        return np.frombuffer(pcm, dtype='<i4').astype(np.float32) / 2147483648
+    raise Exception('Error parsing audio: unsupported sample width {0}'.format(bits_per_sample))
+
+
+class WavStreamReader:
+    """Decodes a WAV file read incrementally from an iterator of bytes chunks.
+
+    Only the header and the current block are held in memory, so recordings of any length
+    can be decoded from a file or a blob stream.
+    """
+
+    _MAX_HEADER_BYTES = 1 << 20
+
+    def __init__(self, chunks):
+        """Constructor of the WavStreamReader class, reads the header of the file.
+
+        Arguments:
+        chunks -- iterable of bytes chunks of the WAV file, see AudioBody.iter_chunks
+        """
+        self._chunks = iter(chunks)
+        self._buffer = bytearray()
+        self._read_header()
+
+    def iter_blocks(self, block_frames):
+        """Yields the audio as flat float32 arrays of mono samples in [-1, 1], of
+        block_frames frames each except for the last one.
+
+        Arguments:
+        block_frames -- the number of frames per block
+        """
+        block_bytes = block_frames * self._block_align
+        exhausted = False
+        while True:
+            wanted = block_bytes
+            if self._remaining is not None:
+                # Ignore the chunks that may follow the data chunk
+                wanted = min(wanted, self._remaining)
+            while not exhausted and len(self._buffer) < wanted:
+                exhausted = not self._fill()
+            size = min(len(self._buffer), wanted)
+            size -= size % self._block_align
+            if size == 0:
+                return
+            pcm = bytes(self._buffer[:size])
+            del self._buffer[:size]
+            if self._remaining is not None:
+                self._remaining -= size
+            samples = _decode_samples(pcm, self._format_tag, self.bits_per_sample)
+            yield downmix(samples.reshape(-1, self.channels))
+
+    def _fill(self):
+        """Appends the next chunk to the buffer, returns False at the end of the stream."""
+        for chunk in self._chunks:
+            self._buffer += chunk
+            return True
+        return False
+
+    def _require(self, size):
+        """Reads until the buffer holds at least size bytes of header."""
+        if size > self._MAX_HEADER_BYTES:
+            raise Exception('Error parsing audio: WAV header too large')
+        while len(self._buffer) < size:
+            if not self._fill():
+                raise Exception('Error parsing audio: missing fmt or data chunk')
+
+    def _read_header(self):
+        """Parses the chunks preceding the samples and drops them from the buffer."""
+        self._require(12)
+        if bytes(self._buffer[0:4]) != b'RIFF' or bytes(self._buffer[8:12]) != b'WAVE':
+            raise Exception('Error parsing audio: not a RIFF WAVE file')
+
+        fmt = None
+        offset = 12
+        while True:
+            self._require(offset + 8)
+            chunk_id = bytes(self._buffer[offset:offset + 4])
+            chunk_size = struct.unpack_from('<I', self._buffer, offset + 4)[0]
+            if chunk_id == b'data':
+                break
+            self._require(offset + 8 + chunk_size)
+            if chunk_id == b'fmt ':
+                fmt = bytes(self._buffer[offset + 8:offset + 8 + chunk_size])
+            # Chunks are word aligned
+            offset += 8 + chunk_size + (chunk_size & 1)
+
+        if fmt is None:
+            raise Exception('Error parsing audio: missing fmt or data chunk')
+        self._format_tag, self.channels, self.sample_rate, self._block_align, \
+            self.bits_per_sample = _parse_fmt(fmt)
+        # Streaming writers leave the size of the data chunk unset
+        self._remaining = chunk_size if chunk_size not in (0, 0xFFFFFFFF) else None
+        del self._buffer[:offset + 8]
+
+
+def downmix(samples):
+    """Returns the mono mix of a (frames, channels) array as a flat array.
+
+    Arguments:
+    samples -- float32 array of shape (frames, channels)
+    """
+    if samples.shape[1] == 1:
+        return samples[:, 0]
+    return samples.mean(axis=1, dtype=np.float32)
+
+
+def resample(samples, source_rate, target_rate=TARGET_SAMPLE_RATE):
+    """Resamples mono audio with a windowed-sinc interpolator.
+
+    Every output sample is computed at once as a weighted sum of the 2 * 16 nearest input
+    samples. When downsampling the sinc is widened to low-pass the signal below the target
+    Nyquist frequency, which prevents aliasing. The weights only depend on the phase of an
+    output sample between two input samples, which repeats with the reduced rate ratio, so
+    they are computed once per phase.
+
+    Arguments:
+    samples -- flat float32 array of mono samples
+    source_rate -- the sample rate of the input
+    target_rate -- the sample rate of the output
+    """
+    if source_rate == target_rate or len(samples) == 0:
+        return samples
+
+    ratio = target_rate / float(source_rate)
+    cutoff = min(1.0, ratio)
+    half_width = int(np.ceil(_RESAMPLER_HALF_WIDTH / cutoff))
+    output_length = int(len(samples) * ratio)
+
+    # Output sample n sits at input position n * down / up
+    divisor = math.gcd(int(source_rate), int(target_rate))
+    up = int(target_rate) // divisor
+    down = int(source_rate) // divisor
+    taps = np.arange(-half_width + 1, half_width + 1)
+    distance = (np.arange(up) / float(up))[:, None] - taps[None, :]
+    window = 0.5 + 0.5 * np.cos(np.pi * distance / (half_width + 1))
+    phase_weights = (cutoff * np.sinc(cutoff * distance) * window).astype(np.float32)
+
+    output = np.empty(output_length, dtype=np.float32)
+    # Process in blocks to bound the size of the (block, taps) sample matrix
+    block = max(1, (1 << 16) // (2 * half_width))
+    padded = np.pad(samples, (half_width, half_width + 1))
+    for start in range(0, output_length, block):
+        positions = np.arange(start, min(start + block, output_length), dtype=np.int64) * down
+        indices = (positions // up)[:, None] + taps[None, :]
+        output[start:start + len(positions)] = np.einsum(
+            'ij,ij->i', phase_weights[positions % up], padded[indices + half_width])
+    return output
+
+
+def encode_wav(samples, sample_rate=TARGET_SAMPLE_RATE):
+    """Returns the bytes of a 16-bit PCM mono WAV file.
+
+    Arguments:
+    samples -- flat float32 array of mono samples in [-1, 1]
+    sample_rate -- the sample rate of the samples
+    """
+    pcm = (np.clip(samples, -1.0, 32767 / 32768.0) * 32768).astype('<i2').tobytes()
+    block_align = TARGET_CHANNELS * TARGET_BITS_PER_SAMPLE // 8
+    header = struct.pack(
+        '<4sI4s4sIHHIIHH4sI',
+        b'RIFF', 36 + len(pcm), b'WAVE',
+        b'fmt ', 16, _WAVE_FORMAT_PCM, TARGET_CHANNELS, sample_rate,
+        sample_rate * block_align, block_align, TARGET_BITS_PER_SAMPLE,
+        b'data', len(pcm))
+    return header + pcm
+
+
+def is_normalized(data):
+    """Returns whether a WAV file already has the format required by the service.
+
+    Only the header is parsed.
+
+    Arguments:
+    data -- the bytes of the WAV file
+    """
+    format_tag, channels, sample_rate, bits_per_sample, _ = _parse_header(data)
+    return format_tag == _WAVE_FORMAT_PCM and sample_rate == TARGET_SAMPLE_RATE and \
+        bits_per_sample == TARGET_BITS_PER_SAMPLE and channels == TARGET_CHANNELS
+
+
+def normalize_wav(data):
+    """Returns the bytes of a WAV file converted to 16 kHz, 16-bit, mono PCM.
+
+    Audio that already has the required format is returned unchanged.
+
+    Arguments:
+    data -- the bytes of the WAV file
+    """
+    if is_normalized(data):
+        return data
+    audio = parse_wav(data)
+    mono = downmix(audio.samples)
+    return encode_wav(resample(mono, audio.sample_rate))
@@ -0,0 +1,219 @@
+import csv
+import json
+import logging
+import os
+import sys
+import threading
+import urllib.request
+from . import BulkRunner
+
+
+class BulkEnrollment:
+    """Enrolls many profiles from a manifest with bounded concurrency.
+
+    Every manifest row names a profile ID, or "new" to create a profile first, and the
+    path or blob URL of the audio to enroll it with. The outcome of every row is appended
+    to a checkpoint file, and rows recorded as succeeded are skipped when the same
+    manifest is run again, so an interrupted run can be resumed.
+    """
+
+    NEW_PROFILE = 'new'
+    _STATUS_CREATED = 'created'
+    _STATUS_SUCCEEDED = 'succeeded'
+    _STATUS_FAILED = 'failed'
+    _URL_PREFIXES = ('http://', 'https://')
+
+    def __init__(self, helper, checkpoint_path, concurrency=8, locale='en-us',
+                 force_short_audio=None):
+        """Constructor of the BulkEnrollment class.
+
+        Arguments:
+        helper -- the IdentificationServiceHttpClientHelper or
+                  VerificationServiceHttpClientHelper to enroll with
+        checkpoint_path -- the path of the JSON lines checkpoint file
+        concurrency -- the maximum number of rows processed at once, the connection pool of
+                       the helper should allow as many connections per host
+        locale -- the locale string of created profiles
+        force_short_audio -- passed on to enroll_profile of the identification helper,
+                             leave None for the verification helper
+        """
+        self._helper = helper
+        self._checkpoint_path = checkpoint_path
+        self._concurrency = concurrency
+        self._locale = locale
+        self._force_short_audio = force_short_audio
+        self._checkpoint_lock = threading.Lock()
+
+    def run(self, rows):
+        """Enrolls every row that has not succeeded yet and returns a dictionary counting
+        the succeeded, failed and skipped rows.
+
+        Arguments:
+        rows -- iterable of (row_number, profile_id, audio) tuples, see read_manifest
+        """
+        completed, created = self._load_checkpoint()
+        summary = {'succeeded': 0, 'failed': 0, 'skipped': 0}
+
+        def pending_rows():
+            for row in rows:
+                if row[0] in completed:
+                    summary['skipped'] += 1
+                    continue
+                row_number, profile_id, audio = row
+                if profile_id == self.NEW_PROFILE and row_number in created:
+                    # The profile was created by an earlier run, only enroll it
+                    profile_id = created[row_number]
+                yield row_number, profile_id, audio
+
+        for row, enrollment_response, error in BulkRunner.run_bounded(
+                self._enroll_row, pending_rows(), self._concurrency):
+            row_number, profile_id, audio = row
+            if error is None:
+                summary['succeeded'] += 1
+                self._write_checkpoint({
+                    'row': row_number,
+                    'status': self._STATUS_SUCCEEDED,
+                    'profile_id': enrollment_response[0],
+                    'audio': audio,
+                    'enrollment_status': enrollment_response[1].get_enrollment_status()})
+            else:
+                summary['failed'] += 1
+                logging.error('Error enrolling row %s (%s): %s', row_number, audio, error)
+                self._write_checkpoint({
+                    'row': row_number,
+                    'status': self._STATUS_FAILED,
+                    'profile_id': profile_id,
+                    'audio': audio,
+                    'error': str(error)})
+
+            processed = summary['succeeded'] + summary['failed']
+            if processed % 100 == 0:
+                logging.info('Bulk enrollment progress: %s', summary)
+
+        logging.info('Bulk enrollment finished: %s', summary)
+        return summary
+
+    def _enroll_row(self, row):
+        """Creates the profile of a row if needed, enrolls it and returns a tuple of the
+        profile ID and the enrollment response.
+
+        Arguments:
+        row -- a (row_number, profile_id, audio) tuple
+        """
+        row_number, profile_id, audio = row
+        if profile_id == self.NEW_PROFILE:
+            profile_id = self._helper.create_profile(self._locale).get_profile_id()
+            self._write_checkpoint({
+                'row': row_number,
+                'status': self._STATUS_CREATED,
+                'profile_id': profile_id,
+                'audio': audio})
+
+        with _AudioSource(audio) as body:
+            if self._force_short_audio is None:
+                enrollment_response = self._helper.enroll_profile(profile_id, body)
+            else:
+                enrollment_response = self._helper.enroll_profile(
+                    profile_id, body, self._force_short_audio)
+        return profile_id, enrollment_response
+
+    def _load_checkpoint(self):
+        """Returns the set of succeeded row numbers and a dictionary of the profile IDs
+        created for "new" rows by earlier runs."""
+        completed = set()
+        created = {}
+        if not os.path.exists(self._checkpoint_path):
+            return completed, created
+
+        with open(self._checkpoint_path, 'r') as checkpoint:
+            for line in checkpoint:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A run killed mid-write leaves a truncated last line
+                    continue
+                if record['status'] == self._STATUS_SUCCEEDED:
+                    completed.add(record['row'])
+                elif record['status'] == self._STATUS_CREATED:
+                    created[record['row']] = record['profile_id']
+        return completed, created
+
+    def _write_checkpoint(self, record):
+        """Appends a record to the checkpoint file."""
+        line = json.dumps(record) + '\n'
+        with self._checkpoint_lock:
+            with open(self._checkpoint_path, 'a') as checkpoint:
+                checkpoint.write(line)
+                checkpoint.flush()
+                os.fsync(checkpoint.fileno())
+
+
+class _AudioSource:
+    """Context manager returning the audio of a manifest row, blob URLs are opened as a
+    stream that is uploaded while it is downloaded."""
+
+    def __init__(self, audio):
+        self._audio = audio
+        self._stream = None
+
+    def __enter__(self):
+        if not self._audio.lower().startswith(BulkEnrollment._URL_PREFIXES):
+            return self._audio
+        self._stream = urllib.request.urlopen(self._audio)
+        return self._stream
+
+    def __exit__(self, *exc_info):
+        if self._stream is not None:
+            self._stream.close()
+
+
+def read_manifest(manifest_path):
+    """Yields (row_number, profile_id, audio) tuples of a manifest file.
+
+    The manifest is a CSV file with a profile ID (or "new") and an audio path or blob URL
+    per row. Empty rows and rows starting with # are ignored.
+
+    Arguments:
+    manifest_path -- the path of the manifest file
+    """
+    with open(manifest_path, 'r', newline='') as manifest:
+        for row_number, row in enumerate(csv.reader(manifest), 1):
+            if not row or row[0].startswith('#'):
+                continue
+            if len(row) < 2:
+                raise Exception('Error reading manifest: row {0} needs a profile ID and an '
+                                'audio path'.format(row_number))
+            yield row_number, row[0].strip(), row[1].strip()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 5:
+        print('Usage: python -m engine.Recognition.BulkEnrollment <service> <subscription_key> '
+              '<manifest_path> <checkpoint_path> [<concurrency>]')
+        print('\t<service> is either identification or verification')
+        print('\t<subscription_key> is the subscription key for the service')
+        print('\t<manifest_path> is a CSV file of profile_id (or "new"),audio_path_or_blob_url')
+        print('\t<checkpoint_path> is the checkpoint file used to resume an interrupted run')
+        print('\t<concurrency> is the maximum number of concurrent enrollments (default 8)')
+        sys.exit('Error: Incorrect Usage.')
+
+    logging.basicConfig(level=logging.INFO)
+    bulk_concurrency = int(sys.argv[5]) if len(sys.argv) > 5 else 8
+    # As many connections as rows in flight, so no enrollment waits for a connection
+    from . import ConnectionPool
+    bulk_connection_pool = ConnectionPool.ConnectionPool(
+        max_connections_per_host=bulk_concurrency)
+    if sys.argv[1] == 'identification':
+        from ..Identification import IdentificationServiceHttpClientHelper
+        bulk_helper = IdentificationServiceHttpClientHelper.IdentificationServiceHttpClientHelper(
+            sys.argv[2], connection_pool=bulk_connection_pool)
+    else:
+        from ..Verification import VerificationServiceHttpClientHelper
+        bulk_helper = VerificationServiceHttpClientHelper.VerificationServiceHttpClientHelper(
+            sys.argv[2], connection_pool=bulk_connection_pool)
+
+    bulk_enrollment = BulkEnrollment(bulk_helper, sys.argv[4], bulk_concurrency)
+    print(bulk_enrollment.run(read_manifest(sys.argv[3])))
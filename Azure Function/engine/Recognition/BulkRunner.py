@@ -0,0 +1,112 @@
+import concurrent.futures
+import logging
+import random
+import time
+
+_DEFAULT_BACKOFF = 0.5
+
+
+def run_bounded(function, items, concurrency):
+    """Calls a function on every item with bounded concurrency and yields a tuple of
+    (item, result, error) for each call as soon as it finishes.
+
+    Items are pulled lazily from the iterable, so at most `concurrency` calls are in flight
+    and arbitrarily long inputs do not have to fit in memory. Exactly one of result and
+    error is set.
+
+    Arguments:
+    function -- callable taking one item
+    items -- iterable of items
+    concurrency -- the maximum number of concurrent calls
+    """
+    items = iter(items)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending = {}
+
+        def submit_next():
+            for item in items:
+                pending[executor.submit(function, item)] = item
+                return True
+            return False
+
+        for _ in range(concurrency):
+            if not submit_next():
+                break
+
+        while pending:
+            done, _ = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                item = pending.pop(future)
+                try:
+                    outcome = item, future.result(), None
+                except Exception as e:
+                    outcome = item, None, e
+                submit_next()
+                yield outcome
+
+
+def run_with_retries(function, items, concurrency, max_attempts, is_retryable=None,
+                     backoff=_DEFAULT_BACKOFF):
+    """Calls a function on every item like run_bounded, calling it again with exponential
+    backoff when it fails, and yields a tuple of (item, result, error) for each item once
+    it succeeded or its last attempt failed.
+
+    Only idempotent functions should be retried: an attempt that failed on a lost response
+    may have been carried out.
+
+    Arguments:
+    function -- callable taking one item
+    items -- iterable of items
+    concurrency -- the maximum number of concurrent calls
+    max_attempts -- the maximum number of calls per item
+    is_retryable -- callable taking the error of a call and returning whether calling
+                    again may succeed, every error is retried when None
+    backoff -- seconds before the first retry, doubled before every next one
+    """
+    def call(item):
+        attempt = 1
+        while True:
+            try:
+                return function(item)
+            except Exception as e:
+                if attempt >= max_attempts or (is_retryable is not None and
+                                               not is_retryable(e)):
+                    raise
+                delay = backoff * (2 ** (attempt - 1)) * (1 + random.random() * 0.2)
+                logging.warning('Attempt %d of %d failed, retrying in %.2f seconds.',
+                                attempt, max_attempts, delay)
+                time.sleep(delay)
+                attempt += 1
+
+    return run_bounded(call, items, concurrency)
+
+
+def summarize(outcomes, on_outcome=None):
+    """Consumes (item, result, error) tuples, such as those of run_bounded, and returns a
+    dictionary of the number of successes and failures, the seconds it took, the number of
+    items per second and the list of (item, error) tuples of the failures.
+
+    Arguments:
+    outcomes -- iterable of (item, result, error) tuples
+    on_outcome -- an optional callable taking the item, result and error of every outcome
+                  as soon as it is consumed, e.g. to report progress
+    """
+    started = time.monotonic()
+    succeeded = 0
+    failures = []
+    for item, result, error in outcomes:
+        if on_outcome is not None:
+            on_outcome(item, result, error)
+        if error is None:
+            succeeded += 1
+        else:
+            failures.append((item, error))
+    elapsed = time.monotonic() - started
+    completed = succeeded + len(failures)
+    return {
+        'succeeded': succeeded,
+        'failed': len(failures),
+        'elapsed': elapsed,
+        'operations_per_second': completed / elapsed if elapsed else 0.0,
+        'failures': failures}
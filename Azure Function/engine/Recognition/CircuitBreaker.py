@@ -0,0 +1,330 @@
+import asyncio
+import collections
+import threading
+import time
+import weakref
+import logging
+from . import Metrics
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half-open'
+
+# Values of the Metrics.CIRCUIT_STATE metric
+_STATE_VALUES = {STATE_CLOSED: 0, STATE_HALF_OPEN: 1, STATE_OPEN: 2}
+# Responses of a degraded service, 429 is throttling and handled by the RateLimiter
+_FAILURE_STATUSES = (500, 502, 503, 504)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending a request while the circuit of its host is open."""
+
+
+class CircuitBreaker:
+    """Stops sending requests to a host that is failing or too slow.
+
+    The breaker is closed while the host is healthy. It records the outcome of the calls of
+    the last window_seconds and opens when, over at least minimum_calls calls, the rate of
+    failures or the rate of calls slower than slow_call_seconds reaches its threshold.
+    Failures are exceptions, such as connection errors and socket timeouts, and 5xx
+    responses.
+
+    While open, calls fail at once with a CircuitOpenError, or wait up to queue_timeout
+    seconds for the circuit to let them through, so workers do not pile up on socket
+    timeouts. After open_seconds the breaker is half-open and lets half_open_max_calls
+    trial calls through: it closes if they all succeed and opens again on the first one
+    that fails or is slow.
+    """
+
+    def __init__(self, name='', failure_rate_threshold=0.5, slow_call_seconds=10.0,
+                 slow_call_rate_threshold=0.5, minimum_calls=10, window_seconds=30,
+                 open_seconds=30, half_open_max_calls=3, queue_timeout=0,
+                 metrics_sink=None):
+        """Constructor of the CircuitBreaker class.
+
+        Arguments:
+        name -- the name of the breaker in log messages and errors, e.g. the host
+        failure_rate_threshold -- the fraction of failed calls opening the circuit
+        slow_call_seconds -- the duration from which a call counts as slow
+        slow_call_rate_threshold -- the fraction of slow calls opening the circuit
+        minimum_calls -- the number of calls in the window below which it stays closed
+        window_seconds -- the length of the window of recorded calls
+        open_seconds -- seconds the circuit stays open before trial calls are let through
+        half_open_max_calls -- the number of trial calls that must succeed to close it
+        queue_timeout -- seconds a call waits for an open circuit, 0 fails it at once
+        metrics_sink -- an optional sink recording the state changes as CIRCUIT_STATE and
+                        the length of every open period as CIRCUIT_OPEN_SECONDS, more
+                        can be added with add_metrics_sink
+        """
+        self._name = name
+        self._failure_rate_threshold = failure_rate_threshold
+        self._slow_call_seconds = slow_call_seconds
+        self._slow_call_rate_threshold = slow_call_rate_threshold
+        self._minimum_calls = minimum_calls
+        self._window_seconds = window_seconds
+        self._open_seconds = open_seconds
+        self._half_open_max_calls = half_open_max_calls
+        self._queue_timeout = queue_timeout
+        # The breaker of a host is shared by every transport calling it and records to the
+        # sinks of all of them, without keeping the sinks of discarded transports alive
+        self._metrics_sinks = weakref.WeakSet()
+        if metrics_sink is not None:
+            self._metrics_sinks.add(metrics_sink)
+        self._condition = threading.Condition()
+        self._state = STATE_CLOSED
+        self._opened_at = 0
+        self._open_until = 0
+        # Buckets of [second, calls, failures, slow calls] of the window
+        self._buckets = collections.deque()
+        self._calls = 0
+        self._failures = 0
+        self._slow_calls = 0
+        self._trial_calls = 0
+        self._trial_successes = 0
+        self._rejected = 0
+        self._opened = 0
+
+    def call(self, send):
+        """Sends a request through the breaker and returns the response and the response
+        body string, or raises a CircuitOpenError while the circuit is open.
+
+        The latency of the call, compared to slow_call_seconds, runs from the moment the
+        request starts being sent, so that waiting for a pooled connection is not blamed
+        on the host.
+
+        Arguments:
+        send -- callable sending the request and returning (response, message), it takes a
+                callable to call without arguments when the request starts being sent,
+                e.g. the on_acquired callback of ConnectionPool.request
+        """
+        trial = self._acquire(True)
+        started = [time.monotonic()]
+
+        def on_started():
+            started[0] = time.monotonic()
+        try:
+            res, message = send(on_started)
+        except Exception:
+            self._record(trial, True, time.monotonic() - started[0])
+            raise
+        self._record(trial, res.status in _FAILURE_STATUSES, time.monotonic() - started[0])
+        return res, message
+
+    async def call_async(self, send):
+        """Sends a request through the breaker like call without blocking the event loop
+        and returns the response and the response body string.
+
+        Arguments:
+        send -- coroutine function taking a callable to call when the request starts being
+                sent and returning (response, message)
+        """
+        trial = await self._acquire_async(True)
+        started = [time.monotonic()]
+
+        def on_started():
+            started[0] = time.monotonic()
+        try:
+            res, message = await send(on_started)
+        except asyncio.CancelledError:
+            # A cancelled call says nothing about the host, but gives its trial back
+            if trial:
+                self._release_trial()
+            raise
+        except Exception:
+            self._record(trial, True, time.monotonic() - started[0])
+            raise
+        self._record(trial, res.status in _FAILURE_STATUSES, time.monotonic() - started[0])
+        return res, message
+
+    def add_metrics_sink(self, metrics_sink):
+        """Records the state changes of the circuit to one more sink, e.g. the sink of a
+        transport sending requests through the breaker.
+
+        Arguments:
+        metrics_sink -- the sink, ignored if it is None or already recording
+        """
+        if metrics_sink is not None:
+            with self._condition:
+                self._metrics_sinks.add(metrics_sink)
+
+    def check(self):
+        """Raises a CircuitOpenError while the circuit is open, after waiting up to the
+        queue timeout, without taking a trial call of a half-open circuit."""
+        self._acquire(False)
+
+    async def check_async(self):
+        """Raises a CircuitOpenError while the circuit is open like check, waiting for the
+        queue timeout without blocking the event loop."""
+        await self._acquire_async(False)
+
+    def get_state(self):
+        """Returns the state of the circuit: STATE_CLOSED, STATE_OPEN or STATE_HALF_OPEN"""
+        with self._condition:
+            self._update_state(time.monotonic())
+            return self._state
+
+    def get_stats(self):
+        """Returns a dictionary of the state of the circuit, the calls, failures and slow
+        calls in the window, and the number of rejected calls and of times it opened."""
+        with self._condition:
+            now = time.monotonic()
+            self._update_state(now)
+            self._expire(now)
+            return {
+                'state': self._state,
+                'calls': self._calls,
+                'failures': self._failures,
+                'slow_calls': self._slow_calls,
+                'failure_rate': self._failures / float(self._calls) if self._calls else 0.0,
+                'rejected': self._rejected,
+                'opened': self._opened}
+
+    def _acquire(self, take_trial):
+        """Waits until a call may go through and returns whether it is a trial call."""
+        deadline = time.monotonic() + self._queue_timeout
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                self._update_state(now)
+                if self._state == STATE_CLOSED:
+                    return False
+                if self._state == STATE_HALF_OPEN:
+                    if not take_trial:
+                        return False
+                    if self._trial_calls < self._half_open_max_calls:
+                        self._trial_calls += 1
+                        return True
+
+                if now >= deadline:
+                    self._rejected += 1
+                    raise CircuitOpenError(
+                        'Error sending the request: the circuit of {0} is open'.format(
+                            self._name))
+                wait = deadline - now
+                if self._state == STATE_OPEN:
+                    wait = min(wait, self._open_until - now)
+                self._condition.wait(wait)
+
+    async def _acquire_async(self, take_trial):
+        """Runs _acquire in a worker thread when it may wait for the queue timeout."""
+        if not self._queue_timeout:
+            return self._acquire(take_trial)
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self._acquire, take_trial)
+
+    def _release_trial(self):
+        """Lets another trial call through in place of one that was cancelled."""
+        with self._condition:
+            if self._state == STATE_HALF_OPEN and self._trial_calls:
+                self._trial_calls -= 1
+                self._condition.notify_all()
+
+    def _record(self, trial, failed, latency):
+        """Records the outcome of a call and changes the state accordingly."""
+        slow = latency >= self._slow_call_seconds
+        with self._condition:
+            now = time.monotonic()
+            if trial and self._state == STATE_HALF_OPEN:
+                if failed or slow:
+                    self._transition(STATE_OPEN, now)
+                else:
+                    self._trial_successes += 1
+                    if self._trial_successes >= self._half_open_max_calls:
+                        self._transition(STATE_CLOSED, now)
+                self._condition.notify_all()
+                return
+            if self._state != STATE_CLOSED:
+                # Calls let through before the circuit opened do not count
+                return
+
+            second = int(now)
+            if not self._buckets or self._buckets[-1][0] != second:
+                self._buckets.append([second, 0, 0, 0])
+            bucket = self._buckets[-1]
+            bucket[1] += 1
+            bucket[2] += failed
+            bucket[3] += slow
+            self._calls += 1
+            self._failures += failed
+            self._slow_calls += slow
+            self._expire(now)
+
+            if self._calls >= self._minimum_calls and (
+                    self._failures >= self._failure_rate_threshold * self._calls or
+                    self._slow_calls >= self._slow_call_rate_threshold * self._calls):
+                self._transition(STATE_OPEN, now)
+
+    def _update_state(self, now):
+        """Half-opens the circuit once its open period is over. Must be called with the
+        lock held."""
+        if self._state == STATE_OPEN and now >= self._open_until:
+            self._transition(STATE_HALF_OPEN, now)
+
+    def _expire(self, now):
+        """Drops the buckets older than the window. Must be called with the lock held."""
+        oldest = int(now) - self._window_seconds
+        while self._buckets and self._buckets[0][0] <= oldest:
+            _, calls, failures, slow_calls = self._buckets.popleft()
+            self._calls -= calls
+            self._failures -= failures
+            self._slow_calls -= slow_calls
+
+    def _transition(self, state, now):
+        """Changes the state of the circuit. Must be called with the lock held."""
+        previous = self._state
+        self._state = state
+        self._trial_calls = 0
+        self._trial_successes = 0
+        if state == STATE_OPEN:
+            self._open_until = now + self._open_seconds
+            if previous == STATE_CLOSED:
+                self._opened_at = now
+                self._opened += 1
+                logging.warning('Circuit of %s is open for %s seconds, %d of %d calls failed '
+                                'and %d were slow.', self._name, self._open_seconds,
+                                self._failures, self._calls, self._slow_calls)
+            else:
+                logging.warning('Circuit of %s is open again for %s seconds, a trial call '
+                                'failed.', self._name, self._open_seconds)
+        elif state == STATE_CLOSED:
+            self._buckets.clear()
+            self._calls = self._failures = self._slow_calls = 0
+            logging.info('Circuit of %s is closed.', self._name)
+            for metrics_sink in self._metrics_sinks:
+                metrics_sink.record(Metrics.CIRCUIT_OPEN_SECONDS, now - self._opened_at)
+        for metrics_sink in self._metrics_sinks:
+            metrics_sink.record(Metrics.CIRCUIT_STATE, _STATE_VALUES[state])
+
+
+_circuit_breakers = {}
+_circuit_breakers_lock = threading.Lock()
+
+
+def configure_circuit_breaker(host, **settings):
+    """Sets the thresholds of the breaker of a host and returns its process-wide
+    CircuitBreaker.
+
+    Arguments:
+    host -- the host as passed to the transport, e.g. westus.api.cognitive.microsoft.com
+    settings -- the keyword arguments of the CircuitBreaker constructor
+    """
+    with _circuit_breakers_lock:
+        _circuit_breakers[host] = CircuitBreaker(host, **settings)
+        return _circuit_breakers[host]
+
+
+def get_circuit_breaker(host, metrics_sink=None):
+    """Returns the process-wide CircuitBreaker of a host, created with the default
+    thresholds if configure_circuit_breaker was not called.
+
+    Arguments:
+    host -- the host as passed to the transport
+    metrics_sink -- an optional sink the breaker records its state changes to, see
+                    CircuitBreaker.add_metrics_sink
+    """
+    with _circuit_breakers_lock:
+        if host not in _circuit_breakers:
+            _circuit_breakers[host] = CircuitBreaker(host)
+        circuit_breaker = _circuit_breakers[host]
+    circuit_breaker.add_metrics_sink(metrics_sink)
+    return circuit_breaker
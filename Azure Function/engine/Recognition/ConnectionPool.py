@@ -0,0 +1,293 @@
+import http.client
+import urllib.parse
+import threading
+import time
+import logging
+from . import AudioBody
+from . import Metrics
+
+
+class ConnectionPool:
+    """Thread-safe pool of reusable keep-alive HTTPS connections keyed by host."""
+
+    _DEFAULT_MAX_CONNECTIONS_PER_HOST = 10
+    _DEFAULT_IDLE_TIMEOUT = 60
+    _DEFAULT_CONNECTION_TIMEOUT = 30
+
+    # Errors raised by http.client when a kept-alive socket was closed by the server
+    _STALE_CONNECTION_ERRORS = (
+        http.client.RemoteDisconnected,
+        http.client.CannotSendRequest,
+        http.client.ResponseNotReady,
+        http.client.BadStatusLine,
+        ConnectionResetError,
+        BrokenPipeError,
+        ConnectionAbortedError)
+
+    def __init__(self, max_connections_per_host=_DEFAULT_MAX_CONNECTIONS_PER_HOST,
+                 idle_timeout=_DEFAULT_IDLE_TIMEOUT,
+                 connection_timeout=_DEFAULT_CONNECTION_TIMEOUT,
+                 connection_factory=None):
+        """Constructor of the ConnectionPool class.
+
+        Arguments:
+        max_connections_per_host -- the maximum number of open connections per host
+        idle_timeout -- seconds an idle connection is kept before it is evicted
+        connection_timeout -- the socket timeout in seconds of new connections
+        connection_factory -- callable taking (host, timeout) and returning a new connection,
+                              defaults to create_connection
+        """
+        self._max_connections_per_host = max_connections_per_host
+        self._idle_timeout = idle_timeout
+        self._connection_timeout = connection_timeout
+        self._connection_factory = connection_factory or create_connection
+        self._condition = threading.Condition()
+        self._idle = {}
+        self._open_count = {}
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._reconnects = 0
+
+    def request(self, host, method, request_url, body=None, headers=None, metrics_sink=None,
+                stream=False, fresh_connection=False, on_acquired=None):
+        """Sends a request over a pooled connection then returns the response and the
+        response body string.
+
+        A reused connection that turns out to be stale is replaced by a fresh one and the
+        request is sent again.
+
+        When streaming, a successful response is returned unread with a None body string.
+        It is a PooledResponse that holds on to the connection until it is closed, which
+        returns the connection to the pool if the body was read to the end. Other responses
+        are read as usual.
+
+        Arguments:
+        host -- the host to connect to, see create_connection
+        method -- the HTTP method of the request
+        request_url -- the request url for the connection
+        body -- the body of the request (needed only in POST methods)
+        headers -- the dictionary of request headers
+        metrics_sink -- an optional metrics sink recording the connect and upload phases
+        stream -- whether to return a successful response unread
+        fresh_connection -- whether to open a new connection instead of reusing an idle one
+        on_acquired -- an optional callable called without arguments once a connection was
+                       acquired, e.g. to time the exchange without the wait for the pool
+        """
+        body_position = AudioBody.tell(body)
+        conn, reused = self.acquire(host, fresh_connection)
+        try:
+            if on_acquired is not None:
+                on_acquired()
+            try:
+                res, message = Metrics.exchange(
+                    conn, method, request_url, body, headers, metrics_sink, not stream)
+            except self._STALE_CONNECTION_ERRORS:
+                if not reused or not AudioBody.rewind(body, body_position):
+                    raise
+                logging.info('Reconnecting stale connection to %s.', host)
+                conn.close()
+                conn = self._connection_factory(host, self._connection_timeout)
+                with self._condition:
+                    self._reconnects += 1
+                res, message = Metrics.exchange(
+                    conn, method, request_url, body, headers, metrics_sink, not stream)
+            if stream and not 200 <= res.status < 300:
+                message = res.read().decode('utf-8')
+        except:
+            self.release(host, conn, reusable=False)
+            raise
+
+        if message is None:
+            return PooledResponse(self, host, conn, res), message
+        self.release(host, conn, reusable=not res.will_close)
+        return res, message
+
+    def acquire(self, host, fresh=False):
+        """Returns a tuple of a connection to the host and whether it was reused from the pool.
+
+        Blocks while the host already has the maximum number of connections checked out.
+
+        Arguments:
+        host -- the host to connect to
+        fresh -- whether to open a new connection, closing an idle one if the host is at
+                 its maximum number of connections
+        """
+        with self._condition:
+            while True:
+                self._evict_idle(host)
+                idle = self._idle.get(host)
+                if idle and not fresh:
+                    conn, _ = idle.pop()
+                    self._hits += 1
+                    return conn, True
+                if self._open_count.get(host, 0) < self._max_connections_per_host:
+                    self._open_count[host] = self._open_count.get(host, 0) + 1
+                    self._misses += 1
+                    break
+                if idle:
+                    # Its slot is taken over by the new connection
+                    conn, _ = idle.pop(0)
+                    conn.close()
+                    self._misses += 1
+                    break
+                self._condition.wait()
+
+        try:
+            return self._connection_factory(host, self._connection_timeout), False
+        except:
+            with self._condition:
+                self._open_count[host] -= 1
+                self._condition.notify()
+            raise
+
+    def release(self, host, conn, reusable=True):
+        """Returns a connection to the pool, or closes it if it cannot be reused.
+
+        Arguments:
+        host -- the host the connection belongs to
+        conn -- the connection returned by acquire
+        reusable -- whether the connection may be handed out again
+        """
+        if not reusable:
+            conn.close()
+        with self._condition:
+            if reusable:
+                self._idle.setdefault(host, []).append((conn, time.monotonic()))
+            else:
+                self._open_count[host] -= 1
+            self._condition.notify()
+
+    def close(self):
+        """Closes every idle connection in the pool."""
+        with self._condition:
+            for host, idle in self._idle.items():
+                for conn, _ in idle:
+                    conn.close()
+                self._open_count[host] -= len(idle)
+            self._idle.clear()
+            self._condition.notify_all()
+
+    def get_stats(self):
+        """Returns a dictionary of the pool hit, miss, eviction and reconnect counters."""
+        with self._condition:
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'reconnects': self._reconnects,
+                'idle': sum(len(idle) for idle in self._idle.values()),
+                'open': sum(self._open_count.values())}
+
+    def _evict_idle(self, host):
+        """Closes the idle connections of a host that exceeded the idle timeout.
+        Must be called with the pool lock held.
+
+        Arguments:
+        host -- the host to evict connections of
+        """
+        idle = self._idle.get(host)
+        if not idle:
+            return
+        deadline = time.monotonic() - self._idle_timeout
+        fresh = [(conn, released) for conn, released in idle if released >= deadline]
+        for conn, released in idle:
+            if released < deadline:
+                conn.close()
+                self._evictions += 1
+                self._open_count[host] -= 1
+        self._idle[host] = fresh
+
+
+class PooledResponse:
+    """A streamed response holding on to its pooled connection until it is closed.
+
+    Every attribute of the http.client response, such as status, getheader and read, is
+    available on it. Closing the response after reading the body to the end returns the
+    connection to the pool, closing it earlier closes the connection.
+    """
+
+    def __init__(self, pool, host, conn, res):
+        """Constructor of the PooledResponse class.
+
+        Arguments:
+        pool -- the ConnectionPool the connection was acquired from
+        host -- the host the connection belongs to
+        conn -- the connection the response is read from
+        res -- the unread http.client response
+        """
+        self._pool = pool
+        self._host = host
+        self._conn = conn
+        self._res = res
+
+    def __getattr__(self, name):
+        return getattr(self._res, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Releases the connection of the response, only the first call has an effect."""
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        if not self._res.isclosed() and self._res.length == 0:
+            # Nothing is left to read, reading finishes the response
+            self._res.read()
+        # http.client closes a response once its body was read to the end
+        reusable = self._res.isclosed() and not self._res.will_close
+        if not reusable:
+            self._res.close()
+        self._pool.release(self._host, conn, reusable)
+
+
+_PLAIN_HTTP_PREFIX = 'http://'
+_HTTPS_PREFIX = 'https://'
+
+
+def create_connection(host, timeout=None):
+    """Creates a new connection to a host.
+
+    Bare hosts and hosts prefixed with https:// get an HTTPS connection, hosts prefixed
+    with http:// get a plain HTTP connection, which is meant for local test servers.
+
+    Arguments:
+    host -- the host with an optional port and scheme prefix
+    timeout -- the socket timeout in seconds
+    """
+    if host.startswith(_PLAIN_HTTP_PREFIX):
+        return http.client.HTTPConnection(host[len(_PLAIN_HTTP_PREFIX):], timeout=timeout)
+    if host.startswith(_HTTPS_PREFIX):
+        host = host[len(_HTTPS_PREFIX):]
+    return http.client.HTTPSConnection(host, timeout=timeout)
+
+
+def get_host(url):
+    """Returns the host of a url in the form accepted by create_connection, so that
+    https urls share the pooled connections of bare hosts.
+
+    Arguments:
+    url -- the url string or a urllib.parse result
+    """
+    if isinstance(url, str):
+        url = urllib.parse.urlparse(url)
+    if url.scheme == 'http':
+        return _PLAIN_HTTP_PREFIX + url.netloc
+    return url.netloc
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_default_pool():
+    """Returns the process-wide connection pool shared by all service helpers."""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = ConnectionPool()
+        return _default_pool
@@ -0,0 +1,94 @@
+import threading
+from . import Metrics
+
+
+class HedgingPolicy:
+    """Decides when a slow request is duplicated to cut the tail latency.
+
+    The policy keeps a Histogram of the latencies of the requests. A request that has not
+    finished after the given percentile of the latencies, for instance the slowest 5%, is
+    hedged with a duplicate and whichever finishes first is used. Until min_samples
+    latencies are known the initial delay is used.
+
+    Hedges are capped by a budget: every request earns budget_ratio of a hedge and a hedge
+    spends a whole one, so at most that fraction of the requests is duplicated, plus a
+    burst of max_burst hedges saved up while the service was fast.
+    """
+
+    _DEFAULT_PERCENTILE = 0.95
+    _DEFAULT_INITIAL_DELAY = 5.0
+    _DEFAULT_MIN_DELAY = 0.5
+    _DEFAULT_BUDGET_RATIO = 0.1
+    _DEFAULT_MAX_BURST = 5
+    _DEFAULT_MIN_SAMPLES = 20
+
+    def __init__(self, percentile=_DEFAULT_PERCENTILE, initial_delay=_DEFAULT_INITIAL_DELAY,
+                 min_delay=_DEFAULT_MIN_DELAY, budget_ratio=_DEFAULT_BUDGET_RATIO,
+                 max_burst=_DEFAULT_MAX_BURST, min_samples=_DEFAULT_MIN_SAMPLES):
+        """Constructor of the HedgingPolicy class.
+
+        Arguments:
+        percentile -- the fraction of the latencies after which a request is hedged
+        initial_delay -- the delay before a hedge until min_samples latencies are known
+        min_delay -- the shortest delay before a hedge
+        budget_ratio -- the fraction of the requests that may be hedged, below 1
+        max_burst -- the number of hedges that may be saved up
+        min_samples -- the number of latencies needed to use the percentile
+        """
+        self._percentile = percentile
+        self._initial_delay = initial_delay
+        self._min_delay = min_delay
+        self._budget_ratio = budget_ratio
+        self._max_burst = max_burst
+        self._min_samples = min_samples
+        self._lock = threading.Lock()
+        self._latencies = Metrics.Histogram()
+        self._budget = 0.0
+        self._requests = 0
+        self._hedged = 0
+        self._hedges_won = 0
+        self._over_budget = 0
+
+    def start_request(self):
+        """Records a new request, which earns its share of the budget, and returns the
+        number of seconds after which it is hedged."""
+        with self._lock:
+            self._requests += 1
+            self._budget = min(float(self._max_burst), self._budget + self._budget_ratio)
+            if self._latencies.get_count() < self._min_samples:
+                return max(self._min_delay, self._initial_delay)
+            return max(self._min_delay, self._latencies.get_percentile(self._percentile))
+
+    def acquire_hedge(self):
+        """Returns whether a slow request may be hedged, spending budget if it may."""
+        with self._lock:
+            if self._budget < 1:
+                self._over_budget += 1
+                return False
+            self._budget -= 1
+            self._hedged += 1
+            return True
+
+    def record(self, latency, hedge_won=False):
+        """Records the latency of a finished request.
+
+        Arguments:
+        latency -- seconds from the start of the request to its result
+        hedge_won -- whether the result came from the hedge
+        """
+        with self._lock:
+            self._latencies.add(latency)
+            if hedge_won:
+                self._hedges_won += 1
+
+    def get_stats(self):
+        """Returns a dictionary of the number of requests, of hedges sent, of hedges that
+        finished first and of hedges skipped for lack of budget, and the current delay."""
+        with self._lock:
+            return {
+                'requests': self._requests,
+                'hedged': self._hedged,
+                'hedges_won': self._hedges_won,
+                'over_budget': self._over_budget,
+                'delay': None if self._latencies.get_count() < self._min_samples else
+                max(self._min_delay, self._latencies.get_percentile(self._percentile))}
@@ -0,0 +1,133 @@
+import codecs
+import json
+import re
+import time
+from . import Metrics
+
+_DEFAULT_CHUNK_SIZE = 64 * 1024
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_NUMBER_END = re.compile(r'[ \t\n\r,\]]')
+
+
+def iter_array(stream, chunk_size=_DEFAULT_CHUNK_SIZE, metrics_sink=None):
+    """Parses a JSON array from a readable stream, such as a streamed response, and yields
+    its elements as soon as each one was read.
+
+    Only the element being parsed and the rest of the last chunk read are held in memory,
+    so a listing of any length is parsed in memory bounded by its largest element.
+
+    Arguments:
+    stream -- the readable binary stream of UTF-8 JSON
+    chunk_size -- the maximum number of bytes read at once
+    metrics_sink -- the sink recording the total parse time, nothing is recorded when None
+    """
+    parser = _ArrayParser(stream, chunk_size)
+    parse_seconds = 0.0
+    try:
+        while True:
+            started = time.perf_counter()
+            element = parser.next_element()
+            parse_seconds += time.perf_counter() - started
+            if element is _ArrayParser.END:
+                break
+            yield element
+    finally:
+        if metrics_sink is not None:
+            metrics_sink.record(Metrics.JSON_PARSE_SECONDS, parse_seconds)
+
+
+class _ArrayParser:
+    """Incremental parser of the elements of a JSON array read in chunks."""
+
+    END = object()
+
+    def __init__(self, stream, chunk_size):
+        # Unlike read, read1 of a response returns the bytes already received
+        self._read = getattr(stream, 'read1', stream.read)
+        self._read_all = stream.read
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self._buffer = ''
+        self._position = 0
+        self._eof = False
+        self._started = False
+        self._ended = False
+
+    def next_element(self):
+        """Returns the next element of the array, or END after its last element."""
+        if self._ended:
+            return self.END
+        if not self._started:
+            if self._next_char() != '[':
+                raise Exception('Error parsing JSON array: the response is not an array')
+            self._position += 1
+            self._started = True
+            if self._next_char() == ']':
+                self._position += 1
+                return self._end()
+        element = self._next_value()
+        separator = self._next_char()
+        self._position += 1
+        if separator == ']':
+            return self._end(element)
+        if separator != ',':
+            raise Exception('Error parsing JSON array: expected , or ] at {0}'.format(
+                repr(separator)))
+        return element
+
+    def _end(self, element=END):
+        """Reads the stream to its end, which lets a response release its connection, and
+        returns the last element."""
+        self._ended = True
+        rest = self._buffer[self._position:]
+        if not self._eof:
+            rest += self._text_decoder.decode(self._read_all(), final=True)
+            self._eof = True
+        self._buffer = ''
+        self._position = 0
+        if rest.strip(' \t\n\r'):
+            raise Exception('Error parsing JSON array: unexpected data after the array')
+        return element
+
+    def _next_value(self):
+        """Decodes the value at the current position, reading chunks until it is whole."""
+        while True:
+            self._skip_whitespace()
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._position)
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+                self._fill()
+                continue
+            # A number is only whole once followed by a delimiter, 1.5 may be 1.5e3 split
+            # between chunks
+            if (isinstance(value, (int, float)) and not self._eof
+                    and not _NUMBER_END.match(self._buffer, end)):
+                self._fill()
+                continue
+            self._position = end
+            return value
+
+    def _next_char(self):
+        """Returns the next non-whitespace character without consuming it."""
+        while True:
+            self._skip_whitespace()
+            if self._position < len(self._buffer):
+                return self._buffer[self._position]
+            if self._eof:
+                raise Exception('Error parsing JSON array: unexpected end of the response')
+            self._fill()
+
+    def _skip_whitespace(self):
+        self._position = _WHITESPACE.match(self._buffer, self._position).end()
+
+    def _fill(self):
+        """Reads the next chunk, dropping the parsed part of the buffer."""
+        chunk = self._read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+        text = self._text_decoder.decode(chunk, final=self._eof)
+        self._buffer = self._buffer[self._position:] + text
+        self._position = 0
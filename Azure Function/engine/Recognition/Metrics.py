@@ -0,0 +1,222 @@
+import json
+import math
+import threading
+import time
+
+# Names of the metrics recorded by the recognition helpers
+CONNECT_SECONDS = 'connect_seconds'
+UPLOAD_SECONDS = 'upload_seconds'
+UPLOAD_BYTES = 'upload_bytes'
+RESPONSE_SECONDS = 'response_seconds'
+PROCESSING_SECONDS = 'processing_seconds'
+POLL_ITERATIONS = 'poll_iterations'
+JSON_PARSE_SECONDS = 'json_parse_seconds'
+CIRCUIT_STATE = 'circuit_state'
+CIRCUIT_OPEN_SECONDS = 'circuit_open_seconds'
+CIRCUIT_REJECTED = 'circuit_rejected'
+
+
+class Histogram:
+    """Histogram with logarithmic buckets.
+
+    Every bucket spans a factor of 2 ** (1 / 4), so percentiles are accurate to about 19%
+    whatever the magnitude of the values, in memory bounded by their range.
+    """
+
+    _BUCKETS_PER_DOUBLING = 4
+
+    def __init__(self):
+        """Constructor of the Histogram class."""
+        self._buckets = {}
+        self._zero_count = 0
+        self._count = 0
+        self._sum = 0.0
+        self._min = None
+        self._max = None
+
+    def add(self, value):
+        """Adds a non-negative value to the histogram.
+
+        Arguments:
+        value -- the value to add
+        """
+        if value > 0:
+            bucket = int(math.ceil(math.log2(value) * self._BUCKETS_PER_DOUBLING))
+            self._buckets[bucket] = self._buckets.get(bucket, 0) + 1
+        else:
+            self._zero_count += 1
+        self._count += 1
+        self._sum += value
+        self._min = value if self._min is None else min(self._min, value)
+        self._max = value if self._max is None else max(self._max, value)
+
+    def get_count(self):
+        """Returns the number of values added"""
+        return self._count
+
+    def get_sum(self):
+        """Returns the sum of the values added"""
+        return self._sum
+
+    def get_percentile(self, fraction):
+        """Returns the upper bound of the bucket holding the given percentile, or None if
+        the histogram is empty.
+
+        Arguments:
+        fraction -- the percentile as a fraction, e.g. 0.99
+        """
+        if not self._count:
+            return None
+        rank = max(1, int(math.ceil(fraction * self._count)))
+        seen = self._zero_count
+        if seen >= rank:
+            return self._min
+        for bucket in sorted(self._buckets):
+            seen += self._buckets[bucket]
+            if seen >= rank:
+                upper_bound = 2 ** (bucket / float(self._BUCKETS_PER_DOUBLING))
+                return min(self._max, max(self._min, upper_bound))
+        return self._max
+
+    def get_summary(self):
+        """Returns a dictionary of the count, sum, min, max, p50, p90 and p99."""
+        return {
+            'count': self._count,
+            'sum': self._sum,
+            'min': self._min,
+            'max': self._max,
+            'p50': self.get_percentile(0.5),
+            'p90': self.get_percentile(0.9),
+            'p99': self.get_percentile(0.99)}
+
+
+class HistogramMetricsSink:
+    """Thread-safe metrics sink keeping a Histogram per metric name.
+
+    Any object with a record(name, value) method can be passed to the helpers as a metrics
+    sink, e.g. to forward the values to a monitoring service.
+    """
+
+    def __init__(self):
+        """Constructor of the HistogramMetricsSink class."""
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def record(self, name, value):
+        """Adds a value to the histogram of a metric.
+
+        Arguments:
+        name -- the name of the metric, e.g. UPLOAD_SECONDS
+        value -- the value to add
+        """
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.add(value)
+
+    def get_summaries(self):
+        """Returns a dictionary of the summary of every recorded metric by name."""
+        with self._lock:
+            return {name: histogram.get_summary()
+                    for name, histogram in self._histograms.items()}
+
+    def reset(self):
+        """Drops every recorded value."""
+        with self._lock:
+            self._histograms = {}
+
+
+def exchange(conn, method, request_url, body=None, headers=None, metrics_sink=None,
+             read_body=True):
+    """Sends a request on a connection and reads the whole response, recording the connect
+    time of a new connection, the upload time and bytes and the time until the response
+    was read. Returns the response and the response body string.
+
+    Arguments:
+    conn -- the http.client connection
+    method -- the HTTP method of the request
+    request_url -- the request url for the connection
+    body -- the body of the request
+    headers -- the dictionary of request headers
+    metrics_sink -- the sink to record to, nothing is recorded when None
+    read_body -- when False the response is returned unread with a None body string, and
+                 the response time only covers the status line and headers
+    """
+    if metrics_sink is None:
+        conn.request(method, request_url, body, headers or {})
+        res = conn.getresponse()
+        return res, res.read().decode('utf-8') if read_body else None
+
+    if getattr(conn, 'sock', None) is None:
+        # Covers the name resolution, the TCP handshake and the TLS handshake
+        started = time.perf_counter()
+        conn.connect()
+        metrics_sink.record(CONNECT_SECONDS, time.perf_counter() - started)
+
+    counter = _ByteCounter(body)
+    started = time.perf_counter()
+    conn.request(method, request_url, counter.body, headers or {})
+    uploaded = time.perf_counter()
+    res = conn.getresponse()
+    message = res.read().decode('utf-8') if read_body else None
+    metrics_sink.record(RESPONSE_SECONDS, time.perf_counter() - uploaded)
+    metrics_sink.record(UPLOAD_SECONDS, uploaded - started)
+    metrics_sink.record(UPLOAD_BYTES, counter.count)
+    return res, message
+
+
+def parse_json(message, metrics_sink=None):
+    """Parses a JSON response body, recording the time it took.
+
+    Arguments:
+    message -- the response body string
+    metrics_sink -- the sink to record to, nothing is recorded when None
+    """
+    if metrics_sink is None:
+        return json.loads(message)
+    started = time.perf_counter()
+    parsed = json.loads(message)
+    metrics_sink.record(JSON_PARSE_SECONDS, time.perf_counter() - started)
+    return parsed
+
+
+class _ByteCounter:
+    """Counts the bytes http.client sends of a request body.
+
+    Bytes-like bodies are measured directly, streams and iterators are wrapped so the
+    count is known once the request was sent.
+    """
+
+    def __init__(self, body):
+        self.count = 0
+        if body is None:
+            self.body = body
+        elif isinstance(body, str):
+            self.body = body
+            self.count = len(body.encode('iso-8859-1', 'replace'))
+        elif isinstance(body, (bytes, bytearray, memoryview)):
+            self.body = body
+            self.count = memoryview(body).nbytes
+        elif hasattr(body, 'read'):
+            self.body = _CountingReader(body, self)
+        else:
+            self.body = self._count_chunks(body)
+
+    def _count_chunks(self, chunks):
+        for chunk in chunks:
+            self.count += len(chunk)
+            yield chunk
+
+
+class _CountingReader:
+    """Readable stream wrapper adding the size of every read to a _ByteCounter."""
+
+    def __init__(self, stream, counter):
+        self._stream = stream
+        self._counter = counter
+
+    def read(self, size=-1):
+        data = self._stream.read(size)
+        self._counter.count += len(data)
+        return data
@@ -0,0 +1,484 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+STATUS_PENDING = 'pending'
+STATUS_SUCCEEDED = 'succeeded'
+STATUS_FAILED = 'failed'
+
+
+class OperationJournal:
+    """Durable journal of the long running operations of the service.
+
+    Every operation accepted with a 202 is recorded with its Operation-Location url before
+    it is polled, and marked succeeded or failed with its processing result once it is
+    finished. The journal is kept in a backend shared by the workers, such as
+    SqliteOperationJournalBackend or TableOperationJournalBackend, so an operation whose
+    worker was recycled can be resumed by any other worker instead of uploading the audio
+    again.
+
+    A worker polling an operation holds a lease on it. Other workers only claim operations
+    whose lease expired, so each operation is polled by one worker at a time.
+
+    Finished operations are kept retention_seconds for the workers reporting their result,
+    then removed by purge.
+    """
+
+    _DEFAULT_LEASE_SECONDS = 360
+    _DEFAULT_RETENTION_SECONDS = 86400
+
+    def __init__(self, backend, owner=None, lease_seconds=_DEFAULT_LEASE_SECONDS,
+                 retention_seconds=_DEFAULT_RETENTION_SECONDS):
+        """Constructor of the OperationJournal class.
+
+        Arguments:
+        backend -- the backend storing the records
+        owner -- the name of this worker in the leases, defaults to a unique name built
+                 from the host name and process ID
+        lease_seconds -- seconds a worker holds an operation before others may claim it
+        retention_seconds -- seconds a finished operation is kept before purge removes it
+        """
+        self._backend = backend
+        self._owner = owner or '{0}-{1}-{2}'.format(
+            socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+        self._lease_seconds = lease_seconds
+        self._retention_seconds = retention_seconds
+
+    def get_owner(self):
+        """Returns the name of this worker in the leases"""
+        return self._owner
+
+    def record_pending(self, operation_url, kind, context=None):
+        """Records an accepted operation, leased to this worker, and returns its ID.
+
+        Arguments:
+        operation_url -- the Operation-Location url of the operation
+        kind -- what the operation does, e.g. 'enrollment' or 'identification'
+        context -- a JSON serializable dictionary needed to handle the result, such as the
+                   profile ID of an enrollment
+        """
+        now = time.time()
+        record = OperationRecord(
+            get_operation_id(operation_url), operation_url, kind, context or {},
+            STATUS_PENDING, created=now, updated=now, lease_owner=self._owner,
+            lease_until=now + self._lease_seconds)
+        self._backend.add(record)
+        return record.get_operation_id()
+
+    def claim(self, operation_id):
+        """Leases a pending operation to this worker and returns whether it succeeded,
+        which fails while another worker holds an unexpired lease on it.
+
+        Arguments:
+        operation_id -- the ID returned by record_pending
+        """
+        now = time.time()
+        return self._backend.claim(
+            operation_id, self._owner, now, now + self._lease_seconds)
+
+    def release(self, operation_id):
+        """Gives up the lease of this worker on a pending operation, so another worker
+        may resume it right away.
+
+        Arguments:
+        operation_id -- the ID returned by record_pending
+        """
+        self._backend.release(operation_id, self._owner)
+
+    def complete(self, operation_id, result):
+        """Marks an operation succeeded with its processing result.
+
+        Arguments:
+        operation_id -- the ID returned by record_pending
+        result -- the processing result dictionary of the operation
+        """
+        self._backend.complete(operation_id, STATUS_SUCCEEDED, result, None, time.time())
+
+    def fail(self, operation_id, message):
+        """Marks an operation failed with the message of the service.
+
+        Arguments:
+        operation_id -- the ID returned by record_pending
+        message -- the failure message string
+        """
+        self._backend.complete(operation_id, STATUS_FAILED, None, message, time.time())
+
+    def get(self, operation_id):
+        """Returns the OperationRecord of an operation, or None if it is not recorded.
+
+        Arguments:
+        operation_id -- the ID returned by record_pending
+        """
+        return self._backend.get(operation_id)
+
+    def list_pending(self, claimable_only=True):
+        """Returns the list of the OperationRecord objects of the pending operations.
+
+        Arguments:
+        claimable_only -- leave out the operations another worker holds a lease on
+        """
+        now = time.time()
+        return [record for record in self._backend.list_by_status(STATUS_PENDING)
+                if not claimable_only or record.get_lease_owner() == self._owner
+                or record.get_lease_until() < now]
+
+    def delete(self, operation_id):
+        """Removes an operation from the journal, e.g. once its result was handled.
+
+        Arguments:
+        operation_id -- the ID returned by record_pending
+        """
+        self._backend.delete(operation_id)
+
+    def purge(self, older_than=None):
+        """Removes the operations that finished more than older_than seconds ago and
+        returns their number. Pending operations are kept however old they are.
+
+        Arguments:
+        older_than -- the age in seconds of the finished operations to remove, defaults to
+                      the retention of the journal
+        """
+        if older_than is None:
+            older_than = self._retention_seconds
+        return self._backend.purge(time.time() - older_than)
+
+
+class OperationRecord:
+    """This class encapsulates an operation recorded in an OperationJournal."""
+
+    __slots__ = ('_operation_id', '_operation_url', '_kind', '_context', '_status',
+                 '_result', '_error', '_created', '_updated', '_lease_owner', '_lease_until')
+
+    def __init__(self, operation_id, operation_url, kind, context, status, result=None,
+                 error=None, created=None, updated=None, lease_owner=None, lease_until=0):
+        """Constructor of the OperationRecord class.
+
+        Arguments:
+        operation_id -- the ID of the operation
+        operation_url -- the Operation-Location url of the operation
+        kind -- what the operation does, e.g. 'enrollment'
+        context -- the dictionary recorded with the operation
+        status -- STATUS_PENDING, STATUS_SUCCEEDED or STATUS_FAILED
+        result -- the processing result dictionary of a succeeded operation
+        error -- the failure message of a failed operation
+        created -- the time the operation was recorded in seconds since the epoch
+        updated -- the time the operation was last changed in seconds since the epoch
+        lease_owner -- the worker holding the lease
+        lease_until -- the time the lease expires in seconds since the epoch
+        """
+        self._operation_id = operation_id
+        self._operation_url = operation_url
+        self._kind = kind
+        self._context = context
+        self._status = status
+        self._result = result
+        self._error = error
+        self._created = created
+        self._updated = updated
+        self._lease_owner = lease_owner
+        self._lease_until = lease_until
+
+    def get_operation_id(self):
+        """Returns the ID of the operation"""
+        return self._operation_id
+
+    def get_operation_url(self):
+        """Returns the Operation-Location url of the operation"""
+        return self._operation_url
+
+    def get_kind(self):
+        """Returns what the operation does"""
+        return self._kind
+
+    def get_context(self):
+        """Returns the dictionary recorded with the operation"""
+        return self._context
+
+    def get_status(self):
+        """Returns the status of the operation"""
+        return self._status
+
+    def get_result(self):
+        """Returns the processing result of a succeeded operation"""
+        return self._result
+
+    def get_error(self):
+        """Returns the failure message of a failed operation"""
+        return self._error
+
+    def get_created(self):
+        """Returns the time the operation was recorded"""
+        return self._created
+
+    def get_updated(self):
+        """Returns the time the operation was last changed"""
+        return self._updated
+
+    def get_lease_owner(self):
+        """Returns the worker holding the lease"""
+        return self._lease_owner
+
+    def get_lease_until(self):
+        """Returns the time the lease expires"""
+        return self._lease_until
+
+
+class SqliteOperationJournalBackend:
+    """Keeps an OperationJournal in a local SQLite database.
+
+    The database file can be shared by the worker processes of one machine. Claims are
+    single conditional updates, so two workers never both hold a lease.
+    """
+
+    _SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS operations ('
+        'operation_id TEXT PRIMARY KEY, operation_url TEXT NOT NULL, kind TEXT NOT NULL, '
+        'context TEXT, status TEXT NOT NULL, result TEXT, error TEXT, created REAL, '
+        'updated REAL, lease_owner TEXT, lease_until REAL NOT NULL DEFAULT 0)',
+        'CREATE INDEX IF NOT EXISTS operations_status ON operations (status)')
+    _COLUMNS = ('operation_id, operation_url, kind, context, status, result, error, created, '
+                'updated, lease_owner, lease_until')
+
+    def __init__(self, path, timeout=30):
+        """Constructor of the SqliteOperationJournalBackend class.
+
+        Arguments:
+        path -- the path of the database file, created if it does not exist
+        timeout -- seconds to wait for another process to release the database
+        """
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        with self._lock:
+            if path != ':memory:':
+                # Readers do not block the writer of another process
+                self._connection.execute('PRAGMA journal_mode=WAL')
+            for statement in self._SCHEMA:
+                self._connection.execute(statement)
+
+    def add(self, record):
+        """Stores a new record, replacing a record of the same operation."""
+        self._execute(
+            'INSERT OR REPLACE INTO operations ({0}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'
+            .format(self._COLUMNS),
+            (record.get_operation_id(), record.get_operation_url(), record.get_kind(),
+             json.dumps(record.get_context()), record.get_status(),
+             _dumps(record.get_result()), record.get_error(), record.get_created(),
+             record.get_updated(), record.get_lease_owner(), record.get_lease_until()))
+
+    def get(self, operation_id):
+        """Returns the record of an operation, or None."""
+        rows = self._execute(
+            'SELECT {0} FROM operations WHERE operation_id = ?'.format(self._COLUMNS),
+            (operation_id,)).fetchall()
+        return self._to_record(rows[0]) if rows else None
+
+    def list_by_status(self, status):
+        """Returns the list of the records with a status, oldest first."""
+        rows = self._execute(
+            'SELECT {0} FROM operations WHERE status = ? ORDER BY created'.format(
+                self._COLUMNS),
+            (status,)).fetchall()
+        return [self._to_record(row) for row in rows]
+
+    def claim(self, operation_id, owner, now, lease_until):
+        """Leases a pending operation whose lease expired or is held by the owner."""
+        cursor = self._execute(
+            'UPDATE operations SET lease_owner = ?, lease_until = ? WHERE operation_id = ? '
+            'AND status = ? AND (lease_until < ? OR lease_owner = ?)',
+            (owner, lease_until, operation_id, STATUS_PENDING, now, owner))
+        return cursor.rowcount == 1
+
+    def release(self, operation_id, owner):
+        """Expires the lease of the owner on a pending operation."""
+        self._execute(
+            'UPDATE operations SET lease_until = 0 WHERE operation_id = ? AND status = ? '
+            'AND lease_owner = ?',
+            (operation_id, STATUS_PENDING, owner))
+
+    def complete(self, operation_id, status, result, error, now):
+        """Records the outcome of an operation."""
+        self._execute(
+            'UPDATE operations SET status = ?, result = ?, error = ?, updated = ?, '
+            'lease_until = 0 WHERE operation_id = ?',
+            (status, _dumps(result), error, now, operation_id))
+
+    def delete(self, operation_id):
+        """Removes the record of an operation."""
+        self._execute('DELETE FROM operations WHERE operation_id = ?', (operation_id,))
+
+    def purge(self, finished_before):
+        """Removes the records of the operations finished before a time and returns their
+        number."""
+        cursor = self._execute(
+            'DELETE FROM operations WHERE status != ? AND updated < ?',
+            (STATUS_PENDING, finished_before))
+        return cursor.rowcount
+
+    def _execute(self, statement, parameters):
+        with self._lock:
+            return self._connection.execute(statement, parameters)
+
+    @staticmethod
+    def _to_record(row):
+        (operation_id, operation_url, kind, context, status, result, error, created,
+         updated, lease_owner, lease_until) = row
+        return OperationRecord(
+            operation_id, operation_url, kind, _loads(context) or {}, status, _loads(result),
+            error, created, updated, lease_owner, lease_until)
+
+
+class TableOperationJournalBackend:
+    """Keeps an OperationJournal in Azure Table storage, shared by every instance of the
+    function app.
+
+    Records are rows of one partition keyed by operation ID. Claims and releases are
+    conditional on the ETag of the row read before, so two workers never both hold a lease.
+    """
+
+    _PARTITION_KEY = 'operations'
+    _STATUS_PRECONDITION_FAILED = 412
+    _STATUS_NOT_FOUND = 404
+
+    def __init__(self, table_service, table_name='pendingoperations'):
+        """Constructor of the TableOperationJournalBackend class.
+
+        Arguments:
+        table_service -- the TableService of the storage account
+        table_name -- the name of the table, created if it does not exist
+        """
+        self._table_service = table_service
+        self._table_name = table_name
+        table_service.create_table(table_name)
+
+    def add(self, record):
+        """Stores a new record, replacing a record of the same operation."""
+        self._table_service.insert_or_replace_entity(self._table_name, {
+            'PartitionKey': self._PARTITION_KEY,
+            'RowKey': record.get_operation_id(),
+            'OperationUrl': record.get_operation_url(),
+            'Kind': record.get_kind(),
+            'Context': json.dumps(record.get_context()),
+            'Status': record.get_status(),
+            'Result': _dumps(record.get_result()),
+            'Error': record.get_error(),
+            'Created': record.get_created(),
+            'Updated': record.get_updated(),
+            'LeaseOwner': record.get_lease_owner(),
+            'LeaseUntil': float(record.get_lease_until())})
+
+    def get(self, operation_id):
+        """Returns the record of an operation, or None."""
+        entity = self._get_entity(operation_id)
+        return self._to_record(entity) if entity is not None else None
+
+    def list_by_status(self, status):
+        """Returns the list of the records with a status, oldest first."""
+        entities = self._table_service.query_entities(
+            self._table_name,
+            filter="PartitionKey eq '{0}' and Status eq '{1}'".format(
+                self._PARTITION_KEY, status))
+        records = [self._to_record(entity) for entity in entities]
+        records.sort(key=lambda record: record.get_created() or 0)
+        return records
+
+    def claim(self, operation_id, owner, now, lease_until):
+        """Leases a pending operation whose lease expired or is held by the owner."""
+        entity = self._get_entity(operation_id)
+        if entity is None or entity.get('Status') != STATUS_PENDING:
+            return False
+        if entity.get('LeaseUntil', 0) >= now and entity.get('LeaseOwner') != owner:
+            return False
+        return self._merge_if_unchanged(
+            entity, {'LeaseOwner': owner, 'LeaseUntil': float(lease_until)})
+
+    def release(self, operation_id, owner):
+        """Expires the lease of the owner on a pending operation."""
+        entity = self._get_entity(operation_id)
+        if entity is not None and entity.get('Status') == STATUS_PENDING and \
+                entity.get('LeaseOwner') == owner:
+            self._merge_if_unchanged(entity, {'LeaseUntil': 0.0})
+
+    def complete(self, operation_id, status, result, error, now):
+        """Records the outcome of an operation."""
+        self._table_service.merge_entity(self._table_name, {
+            'PartitionKey': self._PARTITION_KEY,
+            'RowKey': operation_id,
+            'Status': status,
+            'Result': _dumps(result),
+            'Error': error,
+            'Updated': now,
+            'LeaseUntil': 0.0})
+
+    def delete(self, operation_id):
+        """Removes the record of an operation."""
+        try:
+            self._table_service.delete_entity(
+                self._table_name, self._PARTITION_KEY, operation_id)
+        except Exception as e:
+            if getattr(e, 'status_code', None) != self._STATUS_NOT_FOUND:
+                raise
+
+    def purge(self, finished_before):
+        """Removes the records of the operations finished before a time and returns their
+        number."""
+        entities = self._table_service.query_entities(
+            self._table_name,
+            filter="PartitionKey eq '{0}' and Status ne '{1}' and Updated lt {2!r}".format(
+                self._PARTITION_KEY, STATUS_PENDING, float(finished_before)),
+            select='RowKey')
+        purged = 0
+        for entity in entities:
+            self.delete(entity['RowKey'])
+            purged += 1
+        return purged
+
+    def _get_entity(self, operation_id):
+        entities = list(self._table_service.query_entities(
+            self._table_name,
+            filter="PartitionKey eq '{0}' and RowKey eq '{1}'".format(
+                self._PARTITION_KEY, operation_id)))
+        return entities[0] if entities else None
+
+    def _merge_if_unchanged(self, entity, properties):
+        """Merges properties into a row unless it changed since it was read, and returns
+        whether it was merged."""
+        properties['PartitionKey'] = self._PARTITION_KEY
+        properties['RowKey'] = entity['RowKey']
+        try:
+            self._table_service.merge_entity(
+                self._table_name, properties, if_match=entity.etag)
+        except Exception as e:
+            if getattr(e, 'status_code', None) == self._STATUS_PRECONDITION_FAILED:
+                return False
+            raise
+        return True
+
+    @staticmethod
+    def _to_record(entity):
+        return OperationRecord(
+            entity['RowKey'], entity.get('OperationUrl'), entity.get('Kind'),
+            _loads(entity.get('Context')) or {}, entity.get('Status'),
+            _loads(entity.get('Result')), entity.get('Error'), entity.get('Created'),
+            entity.get('Updated'), entity.get('LeaseOwner'), entity.get('LeaseUntil', 0))
+
+
+def get_operation_id(operation_url):
+    """Returns the ID of an operation, the last segment of its Operation-Location url.
+
+    Arguments:
+    operation_url -- the Operation-Location url of the operation
+    """
+    return operation_url.rstrip('/').rsplit('/', 1)[-1]
+
+
+def _dumps(value):
+    return None if value is None else json.dumps(value)
+
+
+def _loads(text):
+    return None if not text else json.loads(text)
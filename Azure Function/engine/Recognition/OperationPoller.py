@@ -0,0 +1,177 @@
+import concurrent.futures
+import heapq
+import itertools
+import random
+import threading
+import time
+import logging
+
+
+class PollingPolicy:
+    """Computes the delays between operation status checks.
+
+    The first check happens after a short delay, then the delay grows exponentially with
+    random jitter up to a ceiling. A Retry-After value sent by the server takes precedence
+    and the whole operation is bounded by an overall deadline.
+    """
+
+    def __init__(self, initial_delay=0.5, multiplier=1.5, max_delay=5, jitter=0.2, deadline=300):
+        """Constructor of the PollingPolicy class.
+
+        Arguments:
+        initial_delay -- seconds to wait before the first status check
+        multiplier -- factor the delay grows by after every check
+        max_delay -- the ceiling of the delay between two checks in seconds
+        jitter -- the fraction of the delay that is randomized
+        deadline -- seconds after which the operation is abandoned, None waits forever
+        """
+        self._initial_delay = initial_delay
+        self._multiplier = multiplier
+        self._max_delay = max_delay
+        self._jitter = jitter
+        self._deadline = deadline
+
+    def get_deadline(self):
+        """Returns the overall deadline of an operation in seconds"""
+        return self._deadline
+
+    def get_delay(self, attempt, retry_after=None):
+        """Returns the number of seconds to wait before the next status check.
+
+        Arguments:
+        attempt -- the number of status checks already made
+        retry_after -- the value of the Retry-After header of the last response, if any
+        """
+        retry_after_seconds = parse_retry_after(retry_after)
+        if retry_after_seconds is not None:
+            return retry_after_seconds
+        delay = min(self._initial_delay * (self._multiplier ** attempt), self._max_delay)
+        if self._jitter:
+            delay *= 1 + random.uniform(-self._jitter, self._jitter)
+        return max(delay, 0)
+
+
+class PollScheduler:
+    """Tracks many outstanding operations from a single background thread.
+
+    Each operation is described by a check callable that makes one status request and
+    returns a (finished, result, retry_after) tuple. The scheduler calls it whenever the
+    operation is due and resolves the returned future once it finishes.
+    """
+
+    def __init__(self, polling_policy=None):
+        """Constructor of the PollScheduler class.
+
+        Arguments:
+        polling_policy -- the default PollingPolicy of submitted operations
+        """
+        self._polling_policy = polling_policy or PollingPolicy()
+        self._condition = threading.Condition()
+        self._queue = []
+        self._sequence = itertools.count()
+        self._thread = None
+        self._closed = False
+
+    def submit(self, check, polling_policy=None):
+        """Schedules an operation and returns a concurrent.futures.Future of its result.
+
+        Arguments:
+        check -- callable making one status request, returns (finished, result, retry_after)
+        polling_policy -- the PollingPolicy of this operation, defaults to the scheduler's
+        """
+        policy = polling_policy or self._polling_policy
+        future = concurrent.futures.Future()
+        started = time.monotonic()
+        entry = _PendingOperation(check, policy, future, started)
+        with self._condition:
+            if self._closed:
+                raise Exception('Poll scheduler is closed.')
+            self._push(started + policy.get_delay(0), entry)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name='PollScheduler', daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return future
+
+    def get_pending_count(self):
+        """Returns the number of operations currently tracked"""
+        with self._condition:
+            return len(self._queue)
+
+    def close(self):
+        """Stops the scheduler thread, pending operations are cancelled."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+        for _, _, entry in self._queue:
+            entry.future.cancel()
+        self._queue = []
+
+    def _push(self, due, entry):
+        heapq.heappush(self._queue, (due, next(self._sequence), entry))
+
+    def _run(self):
+        """Body of the scheduler thread."""
+        while True:
+            with self._condition:
+                while not self._closed:
+                    now = time.monotonic()
+                    if self._queue and self._queue[0][0] <= now:
+                        break
+                    timeout = self._queue[0][0] - now if self._queue else None
+                    self._condition.wait(timeout)
+                if self._closed:
+                    return
+                _, _, entry = heapq.heappop(self._queue)
+
+            if entry.future.cancelled():
+                continue
+            try:
+                finished, result, retry_after = entry.check()
+            except Exception as e:
+                entry.future.set_exception(e)
+                continue
+            if finished:
+                entry.future.set_result(result)
+                continue
+
+            entry.attempt += 1
+            due = time.monotonic() + entry.policy.get_delay(entry.attempt, retry_after)
+            deadline = entry.policy.get_deadline()
+            if deadline is not None and due - entry.started > deadline:
+                logging.error('Operation did not finish within %s seconds.', deadline)
+                entry.future.set_exception(Exception(
+                    'Operation Error: operation did not finish within {0} seconds'.format(deadline)))
+                continue
+            with self._condition:
+                self._push(due, entry)
+
+
+class _PendingOperation:
+    """State of an operation tracked by the PollScheduler."""
+
+    __slots__ = ('check', 'policy', 'future', 'started', 'attempt')
+
+    def __init__(self, check, policy, future, started):
+        self.check = check
+        self.policy = policy
+        self.future = future
+        self.started = started
+        self.attempt = 0
+
+
+def parse_retry_after(retry_after):
+    """Returns the number of seconds of a Retry-After header value, or None.
+
+    Arguments:
+    retry_after -- the raw header value
+    """
+    if retry_after is None:
+        return None
+    try:
+        return max(float(retry_after), 0)
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,271 @@
+"""Runs profile operations in bulk and streams their results as JSON lines.
+
+One process sends every operation over one pool of keep-alive connections, drawing from
+the rate limiter of the subscription key, with up to --concurrency operations in flight.
+The profile IDs or locales are read one per line from --input or stdin, either as plain
+values or as JSON objects. Every result is written to stdout as soon as it is done, so the
+lines are not in the order of the input:
+
+    {"command": "delete", "input": "<profile ID>", "ok": true, "result": null}
+    {"command": "delete", "input": "<profile ID>", "ok": false, "error": "..."}
+
+delete and reset run through delete_many and reset_many of the helper, which retry them
+up to --max-attempts times unless the service rejected them with a 4xx status, and
+deleting a profile that does not exist counts as a success. get is retried the same way.
+enroll runs a BulkEnrollment manifest, see BulkEnrollment.read_manifest, recording the
+outcome of every row to the --checkpoint file so that running it again resumes it, and
+writes its summary as one line. A summary is written to stderr at the end and the exit
+status is 1 if any operation failed, 2 if the command line is invalid.
+
+Usage: python -m engine.Recognition.ProfileBatch <subscription_key> <command> [options]
+
+    create [--locale en-us] [--count N]  one profile per locale line, or N profiles
+    get                                   one profile ID per line
+    delete                                one profile ID per line
+    reset                                 one profile ID per line, resets its enrollments
+    enroll --input <manifest> --checkpoint <path> [--locale en-us] [--force-short-audio]
+                                          one profile_id (or "new"),audio_path_or_blob_url
+                                          CSV row per line
+    list                                  all the profiles, no input
+
+Options: --service identification|verification, --base-uri, --concurrency, --input,
+         --max-attempts
+"""
+
+import argparse
+import json
+import logging
+import sys
+import time
+from ..Identification import IdentificationServiceHttpClientHelper
+from ..Verification import VerificationServiceHttpClientHelper
+from . import BulkEnrollment
+from . import BulkRunner
+from . import ConnectionPool
+from . import RecognitionTransport
+
+_SERVICE_IDENTIFICATION = 'identification'
+_SERVICE_VERIFICATION = 'verification'
+_PROFILE_ID_FIELD_NAME = 'profileId'
+_LOCALE_FIELD_NAME = 'locale'
+_DEFAULT_LOCALE = 'en-us'
+_DEFAULT_CONCURRENCY = 8
+_DEFAULT_MAX_ATTEMPTS = 3
+# Exit status of a run in which an operation failed, argparse exits with 2 on usage errors
+_EXIT_FAILED = 1
+
+
+def create_helper(service, subscription_key, concurrency, base_uri=None):
+    """Returns the helper of a service sending its requests over a pool of as many
+    connections as operations in flight.
+
+    Arguments:
+    service -- _SERVICE_IDENTIFICATION or _SERVICE_VERIFICATION
+    subscription_key -- the subscription key string
+    concurrency -- the maximum number of operations in flight
+    base_uri -- the host of the service, defaults to the host of the helper
+    """
+    connection_pool = ConnectionPool.ConnectionPool(max_connections_per_host=concurrency)
+    if service == _SERVICE_VERIFICATION:
+        return VerificationServiceHttpClientHelper.VerificationServiceHttpClientHelper(
+            subscription_key, base_uri=base_uri, connection_pool=connection_pool)
+    return IdentificationServiceHttpClientHelper.IdentificationServiceHttpClientHelper(
+        subscription_key, connection_pool=connection_pool, base_uri=base_uri)
+
+
+def read_items(stream):
+    """Yields the items of an input stream, one per line, skipping blank lines and lines
+    starting with #. Lines starting with { are parsed as JSON objects.
+
+    Arguments:
+    stream -- the readable text stream
+    """
+    for line in stream:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        yield json.loads(line) if line.startswith('{') else line
+
+
+def to_json(result):
+    """Returns a JSON-serializable value of a result, with the values of the getters of
+    response objects, e.g. {"profile_id": ...} for get_profile_id.
+
+    Arguments:
+    result -- None, a JSON value or a response object
+    """
+    if result is None or isinstance(result, (str, int, float, bool, list, dict)):
+        return result
+    return {name[len('get_'):]: getattr(result, name)()
+            for name in dir(result) if name.startswith('get_')}
+
+
+def run(helper, command, items, concurrency, output, max_attempts=_DEFAULT_MAX_ATTEMPTS):
+    """Runs create, get, delete or reset on every item concurrently, writes a JSON line per
+    result to the output as soon as it is done, and returns the numbers of successes and
+    failures.
+
+    Arguments:
+    helper -- the helper of the service
+    command -- one of create, get, delete and reset
+    items -- iterable of input items, read lazily
+    concurrency -- the maximum number of operations in flight
+    output -- the writable text stream of the JSON lines
+    max_attempts -- the maximum number of requests per item of get, delete and reset
+    """
+    def write(item, result, error):
+        line = {'command': command, 'input': item, 'ok': error is None}
+        if error is None:
+            line['result'] = to_json(result)
+        else:
+            line['error'] = str(error)
+        output.write(json.dumps(line) + '\n')
+        output.flush()
+
+    def profile_id(item):
+        return item[_PROFILE_ID_FIELD_NAME] if isinstance(item, dict) else item
+
+    if command == 'delete':
+        summary = helper.delete_many(
+            (profile_id(item) for item in items), concurrency, max_attempts, write)
+    elif command == 'reset':
+        summary = helper.reset_many(
+            (profile_id(item) for item in items), concurrency, max_attempts, write)
+    elif command == 'get':
+        summary = BulkRunner.summarize(BulkRunner.run_with_retries(
+            helper.get_profile, (profile_id(item) for item in items), concurrency,
+            max_attempts, RecognitionTransport.is_retryable), write)
+    else:
+        # Creating a profile again would create a second one, so it is not retried
+        summary = BulkRunner.summarize(BulkRunner.run_bounded(
+            lambda item: helper.create_profile(
+                item[_LOCALE_FIELD_NAME] if isinstance(item, dict) else item),
+            items, concurrency), write)
+    return summary['succeeded'], summary['failed']
+
+
+def enroll(helper, manifest_path, checkpoint_path, concurrency, output, locale=_DEFAULT_LOCALE,
+           force_short_audio=None):
+    """Enrolls the rows of a manifest that have not succeeded yet with a BulkEnrollment,
+    writes its summary as a JSON line to the output, and returns the numbers of successes
+    and failures.
+
+    Arguments:
+    helper -- the helper of the service
+    manifest_path -- the path of the CSV manifest, see BulkEnrollment.read_manifest
+    checkpoint_path -- the path of the checkpoint file of the BulkEnrollment
+    concurrency -- the maximum number of rows processed at once
+    output -- the writable text stream of the JSON line
+    locale -- the locale string of the profiles created for "new" rows
+    force_short_audio -- passed on to enroll_profile of the identification helper, None for
+                         the verification helper
+    """
+    summary = BulkEnrollment.BulkEnrollment(
+        helper, checkpoint_path, concurrency, locale, force_short_audio).run(
+            BulkEnrollment.read_manifest(manifest_path))
+    output.write(json.dumps({'command': 'enroll', 'input': manifest_path,
+                             'ok': not summary['failed'], 'result': summary}) + '\n')
+    output.flush()
+    return summary['succeeded'], summary['failed']
+
+
+def list_profiles(helper, output):
+    """Writes a JSON line per profile of the subscription to the output as the listing is
+    read, and returns the number of profiles.
+
+    Arguments:
+    helper -- the helper of the service
+    output -- the writable text stream of the JSON lines
+    """
+    count = 0
+    for profile in helper.iter_all_profiles():
+        output.write(json.dumps({'command': 'list', 'ok': True,
+                                 'result': to_json(profile)}) + '\n')
+        count += 1
+    output.flush()
+    return count
+
+
+def parse_args(argv=None):
+    """Parses the command line and returns its arguments, exiting with status 2 if it is
+    invalid.
+
+    Arguments:
+    argv -- the command line arguments, defaults to sys.argv[1:]
+    """
+    parser = argparse.ArgumentParser(
+        prog='python -m engine.Recognition.ProfileBatch',
+        description='Runs profile operations in bulk and streams their results as JSON lines.')
+    parser.add_argument('subscription_key', help='the subscription key for the service')
+    parser.add_argument('command', choices=('create', 'get', 'delete', 'reset', 'enroll', 'list'))
+    parser.add_argument('--service', choices=(_SERVICE_IDENTIFICATION, _SERVICE_VERIFICATION),
+                        default=_SERVICE_IDENTIFICATION)
+    parser.add_argument('--base-uri', help='the host of the service, e.g. of a mock server')
+    parser.add_argument('--concurrency', type=int, default=_DEFAULT_CONCURRENCY,
+                        help='the maximum number of operations in flight')
+    parser.add_argument('--max-attempts', type=int, default=_DEFAULT_MAX_ATTEMPTS,
+                        help='the maximum number of requests per get, delete or reset')
+    parser.add_argument('--input', help='the file of the input items, defaults to stdin')
+    parser.add_argument('--checkpoint', help='the checkpoint file of enroll')
+    parser.add_argument('--locale', default=_DEFAULT_LOCALE,
+                        help='the locale of the profiles created with --count or for the '
+                             '"new" rows of enroll')
+    parser.add_argument('--count', type=int,
+                        help='the number of profiles to create instead of reading locales')
+    parser.add_argument('--force-short-audio', action='store_true',
+                        help='waive the recommended minimum audio of identification enrollments')
+    args = parser.parse_args(argv)
+
+    if args.concurrency < 1:
+        parser.error('--concurrency must be at least 1')
+    if args.max_attempts < 1:
+        parser.error('--max-attempts must be at least 1')
+    if args.command == 'enroll' and (not args.input or args.input == '-' or
+                                     not args.checkpoint):
+        parser.error('enroll needs a manifest file as --input and a --checkpoint file')
+    if args.count is not None and args.command != 'create':
+        parser.error('--count only applies to create')
+    return args
+
+
+def main(argv=None):
+    """Parses the command line, runs the command and returns the exit status.
+
+    Arguments:
+    argv -- the command line arguments, defaults to sys.argv[1:]
+    """
+    args = parse_args(argv)
+    helper = create_helper(args.service, args.subscription_key, args.concurrency, args.base_uri)
+    started = time.monotonic()
+    if args.command == 'list':
+        count = list_profiles(helper, sys.stdout)
+        print('Listed {0} profiles in {1:.1f} seconds.'.format(
+            count, time.monotonic() - started), file=sys.stderr)
+        return 0
+
+    if args.command == 'enroll':
+        force_short_audio = args.force_short_audio \
+            if args.service == _SERVICE_IDENTIFICATION else None
+        succeeded, failed = enroll(helper, args.input, args.checkpoint, args.concurrency,
+                                   sys.stdout, args.locale, force_short_audio)
+    elif args.command == 'create' and args.count is not None:
+        items = (args.locale for _ in range(args.count))
+        succeeded, failed = run(helper, args.command, items, args.concurrency, sys.stdout)
+    elif args.input and args.input != '-':
+        with open(args.input) as stream:
+            succeeded, failed = run(helper, args.command, read_items(stream),
+                                    args.concurrency, sys.stdout, args.max_attempts)
+    else:
+        succeeded, failed = run(helper, args.command, read_items(sys.stdin),
+                                args.concurrency, sys.stdout, args.max_attempts)
+
+    elapsed = time.monotonic() - started
+    print('{0} succeeded, {1} failed in {2:.1f} seconds ({3:.1f} operations per second).'.format(
+        succeeded, failed, elapsed, (succeeded + failed) / elapsed if elapsed else 0.0),
+        file=sys.stderr)
+    return _EXIT_FAILED if failed else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    sys.exit(main())
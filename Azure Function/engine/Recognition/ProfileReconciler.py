@@ -0,0 +1,238 @@
+import calendar
+import time
+import logging
+from . import BulkRunner
+
+ACTION_DELETE_ORPHAN = 'delete_orphan'
+ACTION_RECREATE_PROFILE = 'recreate_profile'
+ACTION_ENROLL = 'enroll'
+
+# Status of a profile that never finished its enrollment or whose enrollments were reset
+_ENROLLMENT_STATUS_ENROLLING = 'Enrolling'
+
+
+class ReconciliationAbortedError(Exception):
+    """Raised instead of repairing anything when the mapping looks wrong, i.e. too many
+    profiles of the service are not mapped to any user."""
+
+
+class ProfileReconciler:
+    """Reconciles a local mapping of users to profile IDs with the profiles of a service.
+
+    The profiles are listed once and indexed by ID, the mapping is indexed by profile ID,
+    and the drift between them is computed in time linear in their sizes:
+
+    - orphaned profiles, on the service but not mapped to any user, are deleted since
+      they still bill;
+    - users mapped to a profile the service does not have, or to no profile, get a new
+      profile, and its enrollment is queued;
+    - users mapped to a profile that is not enrolled, e.g. after a reset, have their
+      enrollment queued.
+
+    Enrollments need the audio of the users, which only the caller has, so they are put on
+    the enrollment queue as (user_id, profile_id) tuples. The repairs are executed
+    concurrently in batches. As a safeguard against an empty or wrong mapping, nothing is
+    repaired when the orphans exceed max_orphan_ratio of the profiles, and profiles
+    created less than orphan_grace_seconds ago are not orphans yet: they may belong to a
+    user whose mapping is being recorded.
+
+    Example, with helper being an IdentificationServiceHttpClientHelper:
+
+        reconciler = ProfileReconciler(helper, enrollment_queue=queue.Queue())
+        summary = reconciler.reconcile(user_profiles)
+        user_profiles.update(summary['recreated'])
+    """
+
+    _DEFAULT_LOCALE = 'en-us'
+    _DEFAULT_CONCURRENCY = 8
+    _DEFAULT_BATCH_SIZE = 100
+    _DEFAULT_MAX_ATTEMPTS = 3
+    _DEFAULT_MAX_ORPHAN_RATIO = 0.5
+    _DEFAULT_ORPHAN_GRACE_SECONDS = 3600
+
+    def __init__(self, helper, enrollment_queue=None, locale=_DEFAULT_LOCALE,
+                 concurrency=_DEFAULT_CONCURRENCY, batch_size=_DEFAULT_BATCH_SIZE,
+                 max_attempts=_DEFAULT_MAX_ATTEMPTS, max_orphan_ratio=_DEFAULT_MAX_ORPHAN_RATIO,
+                 orphan_grace_seconds=_DEFAULT_ORPHAN_GRACE_SECONDS):
+        """Constructor of the ProfileReconciler class.
+
+        Arguments:
+        helper -- the Identification or Verification service helper
+        enrollment_queue -- an object with a put method, such as a queue.Queue, receiving
+                            the (user_id, profile_id) tuples of the enrollments to redo
+        locale -- the locale of the recreated profiles
+        concurrency -- the maximum number of concurrent repairs
+        batch_size -- the number of repair actions executed together
+        max_attempts -- the maximum number of requests per orphan deletion
+        max_orphan_ratio -- the fraction of orphaned profiles above which nothing is
+                            repaired
+        orphan_grace_seconds -- the age below which an unmapped profile is not an orphan
+        """
+        self._helper = helper
+        self._enrollment_queue = enrollment_queue
+        self._locale = locale
+        self._concurrency = concurrency
+        self._batch_size = batch_size
+        self._max_attempts = max_attempts
+        self._max_orphan_ratio = max_orphan_ratio
+        self._orphan_grace_seconds = orphan_grace_seconds
+
+    def diff(self, user_profiles):
+        """Lists the profiles of the service once and returns the list of RepairAction
+        bringing the service and the mapping back in line, orphan deletions first. Raises a
+        ReconciliationAbortedError when the orphans exceed max_orphan_ratio of the profiles.
+
+        Arguments:
+        user_profiles -- a dictionary of the profile ID string, or None, of every user ID
+        """
+        mapped_profile_ids = set(profile_id for profile_id in user_profiles.values()
+                                 if profile_id is not None)
+        enrollment_statuses = {}
+        orphans = []
+        grace_deadline = time.time() - self._orphan_grace_seconds
+        for profile in self._helper.iter_all_profiles():
+            profile_id = profile.get_profile_id()
+            enrollment_statuses[profile_id] = profile.get_enrollment_status()
+            if profile_id not in mapped_profile_ids and \
+                    _parse_date_time(profile.get_created_date_time()) < grace_deadline:
+                orphans.append(RepairAction(ACTION_DELETE_ORPHAN, None, profile_id))
+
+        if len(orphans) > self._max_orphan_ratio * len(enrollment_statuses):
+            raise ReconciliationAbortedError(
+                'Error reconciling profiles: {0} of {1} profiles are not mapped to any user, '
+                'check the mapping'.format(len(orphans), len(enrollment_statuses)))
+
+        actions = orphans
+        for user_id, profile_id in user_profiles.items():
+            enrollment_status = enrollment_statuses.get(profile_id)
+            if enrollment_status is None:
+                actions.append(RepairAction(ACTION_RECREATE_PROFILE, user_id, profile_id))
+            elif enrollment_status == _ENROLLMENT_STATUS_ENROLLING:
+                actions.append(RepairAction(ACTION_ENROLL, user_id, profile_id))
+        return actions
+
+    def repair(self, actions):
+        """Executes repair actions concurrently in batches and returns a summary, see
+        reconcile.
+
+        Arguments:
+        actions -- iterable of RepairAction, such as returned by diff
+        """
+        started = time.monotonic()
+        summary = {
+            'deleted': 0,
+            'recreated': {},
+            'enrollments_queued': 0,
+            'failed': 0,
+            'failures': []}
+        batch = []
+        for action in actions:
+            batch.append(action)
+            if len(batch) >= self._batch_size:
+                self._repair_batch(batch, summary)
+                batch = []
+        if batch:
+            self._repair_batch(batch, summary)
+        summary['elapsed'] = time.monotonic() - started
+        return summary
+
+    def reconcile(self, user_profiles):
+        """Computes the drift between the mapping and the service and repairs it. Returns
+        a dictionary of the number of orphans deleted, the new profile ID of every user
+        whose profile was recreated, which the caller records in its mapping, the number
+        of enrollments queued, the number of failed repairs, the list of (action, error)
+        tuples of the failures and the seconds the repairs took.
+
+        Arguments:
+        user_profiles -- a dictionary of the profile ID string, or None, of every user ID
+        """
+        actions = self.diff(user_profiles)
+        logging.info('Reconciling %d users with %d repair actions.',
+                     len(user_profiles), len(actions))
+        return self.repair(actions)
+
+    def _repair_batch(self, batch, summary):
+        """Executes a batch of repair actions and adds their outcome to the summary."""
+        deletions = {}
+        recreations = []
+        for action in batch:
+            if action.get_kind() == ACTION_DELETE_ORPHAN:
+                deletions[action.get_profile_id()] = action
+            elif action.get_kind() == ACTION_RECREATE_PROFILE:
+                recreations.append(action)
+            else:
+                self._queue_enrollment(action.get_user_id(), action.get_profile_id(), summary)
+
+        if deletions:
+            deletion_summary = self._helper.delete_many(
+                deletions, self._concurrency, self._max_attempts)
+            summary['deleted'] += deletion_summary['succeeded']
+            for profile_id, error in deletion_summary['failures']:
+                self._record_failure(deletions[profile_id], error, summary)
+
+        # Not retried, a creation whose response was lost leaves an orphan behind that the
+        # next reconciliation deletes
+        for action, response, error in BulkRunner.run_bounded(
+                lambda action: self._helper.create_profile(self._locale),
+                recreations, self._concurrency):
+            if error is not None:
+                self._record_failure(action, error, summary)
+                continue
+            profile_id = response.get_profile_id()
+            summary['recreated'][action.get_user_id()] = profile_id
+            self._queue_enrollment(action.get_user_id(), profile_id, summary)
+
+    def _queue_enrollment(self, user_id, profile_id, summary):
+        if self._enrollment_queue is not None:
+            self._enrollment_queue.put((user_id, profile_id))
+        summary['enrollments_queued'] += 1
+
+    def _record_failure(self, action, error, summary):
+        logging.error('Error repairing profile %s of user %s: %s.',
+                      action.get_profile_id(), action.get_user_id(), error)
+        summary['failed'] += 1
+        summary['failures'].append((action, error))
+
+
+class RepairAction:
+    """A change bringing the service and the mapping of users to profiles back in line."""
+
+    __slots__ = ('_kind', '_user_id', '_profile_id')
+
+    def __init__(self, kind, user_id, profile_id):
+        """Constructor of the RepairAction class.
+
+        Arguments:
+        kind -- ACTION_DELETE_ORPHAN, ACTION_RECREATE_PROFILE or ACTION_ENROLL
+        user_id -- the user ID, None for an orphan
+        profile_id -- the profile ID string the action applies to, None for a user mapped
+                      to no profile
+        """
+        self._kind = kind
+        self._user_id = user_id
+        self._profile_id = profile_id
+
+    def get_kind(self):
+        """Returns the kind of the action"""
+        return self._kind
+
+    def get_user_id(self):
+        """Returns the user ID, None for an orphan"""
+        return self._user_id
+
+    def get_profile_id(self):
+        """Returns the profile ID the action applies to"""
+        return self._profile_id
+
+    def __repr__(self):
+        return 'RepairAction({0}, {1}, {2})'.format(
+            self._kind, self._user_id, self._profile_id)
+
+
+def _parse_date_time(value):
+    """Returns the seconds since the epoch of a date of the service, such as
+    2015-04-23T18:25:43.511Z in UTC, or 0 if missing so that the profile is old enough."""
+    try:
+        return calendar.timegm(time.strptime(value[:19], '%Y-%m-%dT%H:%M:%S'))
+    except (TypeError, ValueError):
+        return 0
@@ -0,0 +1,229 @@
+import asyncio
+import random
+import threading
+import time
+import logging
+from . import AudioBody
+from . import OperationPoller
+
+
+class RateLimiter:
+    """Token bucket limiting the transactions per second of a subscription.
+
+    One limiter is shared by every helper of a process using the same subscription key,
+    see get_rate_limiter. When the service still answers 429 or 503 the whole bucket is
+    paused for the Retry-After period, so every thread backs off together.
+    """
+
+    def __init__(self, transactions_per_second, burst=None):
+        """Constructor of the RateLimiter class.
+
+        Arguments:
+        transactions_per_second -- the sustained number of requests allowed per second
+        burst -- the number of requests that may be sent at once, defaults to one second
+                 worth of requests
+        """
+        self._rate = float(transactions_per_second)
+        self._capacity = float(burst if burst is not None else max(transactions_per_second, 1))
+        self._tokens = self._capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0
+        self._lock = threading.Lock()
+        self._acquired = 0
+        self._delayed = 0
+        self._total_delay = 0.0
+        self._throttled = 0
+        self._throttled_latency = 0.0
+        self._retry_after_delay = 0.0
+
+    def set_rate(self, transactions_per_second, burst=None):
+        """Changes the quota of the limiter, which its users draw from right away.
+
+        Arguments:
+        transactions_per_second -- the sustained number of requests allowed per second
+        burst -- the number of requests that may be sent at once, defaults to one second
+                 worth of requests
+        """
+        with self._lock:
+            # Settle the tokens earned at the old rate before switching to the new one
+            now = time.monotonic()
+            self._tokens = min(self._capacity,
+                               self._tokens + (now - self._updated) * self._rate)
+            self._updated = now
+            self._rate = float(transactions_per_second)
+            self._capacity = float(
+                burst if burst is not None else max(transactions_per_second, 1))
+            self._tokens = min(self._tokens, self._capacity)
+
+    def acquire(self):
+        """Blocks until a request may be sent and returns the number of seconds waited."""
+        waited = 0.0
+        while True:
+            delay = self._take(waited)
+            if delay is None:
+                return waited
+            time.sleep(delay)
+            waited += delay
+
+    async def acquire_async(self):
+        """Waits without blocking the event loop until a request may be sent and returns
+        the number of seconds waited."""
+        waited = 0.0
+        while True:
+            delay = self._take(waited)
+            if delay is None:
+                return waited
+            await asyncio.sleep(delay)
+            waited += delay
+
+    def record_throttled(self, latency, retry_after):
+        """Records a 429 or 503 response and pauses the bucket for the Retry-After period.
+
+        Arguments:
+        latency -- seconds spent on the rejected request
+        retry_after -- seconds the service asked to wait
+        """
+        with self._lock:
+            self._throttled += 1
+            self._throttled_latency += latency
+            self._retry_after_delay += retry_after
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            self._tokens = 0
+
+    def _take(self, waited):
+        """Takes a token and returns None, or returns the seconds to wait before trying
+        again if none is available.
+
+        Arguments:
+        waited -- the seconds already waited for the token
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._capacity,
+                               self._tokens + (now - self._updated) * self._rate)
+            self._updated = now
+            if now >= self._paused_until and self._tokens >= 1:
+                self._tokens -= 1
+                self._acquired += 1
+                if waited:
+                    self._delayed += 1
+                    self._total_delay += waited
+                return None
+            return max(self._paused_until - now, (1 - self._tokens) / self._rate)
+
+    def get_stats(self):
+        """Returns a dictionary of the limiter counters.
+
+        estimated_latency_saved multiplies the number of requests the limiter delayed by the
+        average time lost on a request the service rejected.
+        """
+        with self._lock:
+            average_throttled_latency = \
+                self._throttled_latency / self._throttled if self._throttled else 0.0
+            return {
+                'acquired': self._acquired,
+                'delayed': self._delayed,
+                'total_delay': self._total_delay,
+                'throttled': self._throttled,
+                'throttled_latency': self._throttled_latency,
+                'retry_after_delay': self._retry_after_delay,
+                'estimated_latency_saved': self._delayed * average_throttled_latency}
+
+
+_DEFAULT_TRANSACTIONS_PER_SECOND = 10
+_THROTTLED_STATUSES = (429, 503)
+_DEFAULT_MAX_RETRIES = 5
+_DEFAULT_BACKOFF = 1.0
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def configure_rate_limit(subscription_key, transactions_per_second, burst=None):
+    """Sets the quota of a subscription and returns its process-wide RateLimiter. The
+    limiter already used by the helpers of the subscription is updated in place.
+
+    Arguments:
+    subscription_key -- the subscription key string
+    transactions_per_second -- the sustained number of requests allowed per second
+    burst -- the number of requests that may be sent at once
+    """
+    with _rate_limiters_lock:
+        if subscription_key in _rate_limiters:
+            _rate_limiters[subscription_key].set_rate(transactions_per_second, burst)
+        else:
+            _rate_limiters[subscription_key] = RateLimiter(transactions_per_second, burst)
+        return _rate_limiters[subscription_key]
+
+
+def get_rate_limiter(subscription_key):
+    """Returns the process-wide RateLimiter of a subscription, created with the default
+    quota if configure_rate_limit was not called.
+
+    Arguments:
+    subscription_key -- the subscription key string
+    """
+    with _rate_limiters_lock:
+        if subscription_key not in _rate_limiters:
+            _rate_limiters[subscription_key] = RateLimiter(_DEFAULT_TRANSACTIONS_PER_SECOND)
+        return _rate_limiters[subscription_key]
+
+
+def send_with_backoff(rate_limiter, send, body=None, max_retries=_DEFAULT_MAX_RETRIES):
+    """Sends a request once the rate limiter allows it, retrying on 429 and 503 responses
+    after the Retry-After period. Returns the response and the response body string.
+
+    Arguments:
+    rate_limiter -- the RateLimiter to draw from
+    send -- callable sending the request and returning (response, message)
+    body -- the request body, rewound before a retry when it is a seekable stream
+    max_retries -- the maximum number of retries of a throttled request
+    """
+    position = AudioBody.tell(body)
+    attempt = 0
+    while True:
+        rate_limiter.acquire()
+        started = time.monotonic()
+        res, message = send()
+        if res.status not in _THROTTLED_STATUSES or attempt >= max_retries:
+            return res, message
+
+        retry_after = OperationPoller.parse_retry_after(res.getheader('Retry-After'))
+        if retry_after is None:
+            retry_after = _DEFAULT_BACKOFF * (2 ** attempt) * (1 + random.random() * 0.2)
+        rate_limiter.record_throttled(time.monotonic() - started, retry_after)
+        if not AudioBody.rewind(body, position):
+            return res, message
+
+        logging.warning('Request throttled with status %s, retrying in %.2f seconds.',
+                        res.status, retry_after)
+        attempt += 1
+
+
+async def send_with_backoff_async(rate_limiter, send, max_retries=_DEFAULT_MAX_RETRIES):
+    """Sends a request like send_with_backoff without blocking the event loop, waiting on
+    the rate limiter and the Retry-After periods with asyncio.sleep. Returns the response
+    and the response body string.
+
+    Arguments:
+    rate_limiter -- the RateLimiter to draw from
+    send -- coroutine function sending the request and returning (response, message), its
+            body must be bytes so that it can be sent again
+    max_retries -- the maximum number of retries of a throttled request
+    """
+    attempt = 0
+    while True:
+        await rate_limiter.acquire_async()
+        started = time.monotonic()
+        res, message = await send()
+        if res.status not in _THROTTLED_STATUSES or attempt >= max_retries:
+            return res, message
+
+        retry_after = OperationPoller.parse_retry_after(res.getheader('Retry-After'))
+        if retry_after is None:
+            retry_after = _DEFAULT_BACKOFF * (2 ** attempt) * (1 + random.random() * 0.2)
+        rate_limiter.record_throttled(time.monotonic() - started, retry_after)
+
+        logging.warning('Request throttled with status %s, retrying in %.2f seconds.',
+                        res.status, retry_after)
+        attempt += 1
@@ -0,0 +1,185 @@
+import time
+from contextlib import closing
+import logging
+from . import CircuitBreaker
+from . import ConnectionPool
+from . import JsonStream
+from . import Metrics
+from . import RateLimiter
+
+# Rejected requests that may succeed when sent again later
+_RETRYABLE_CLIENT_STATUSES = (408, 429)
+
+
+class ServiceError(Exception):
+    """Raised when the service answers a request with an error status."""
+
+    def __init__(self, message, status):
+        """Constructor of the ServiceError class.
+
+        Arguments:
+        message -- the error message
+        status -- the HTTP status of the response
+        """
+        super().__init__(message)
+        self._status = status
+
+    def get_status(self):
+        """Returns the HTTP status of the response"""
+        return self._status
+
+
+class RecognitionTransport:
+    """Sends the requests of the Identification and Verification helpers.
+
+    A transport holds one connection pool, one rate limiter with its 429/503 backoff and
+    one metrics sink. Passing the same transport to both helpers makes a service that
+    identifies and verifies share a single set of connections, quota and metrics.
+
+    Every request also goes through the CircuitBreaker of its host, so requests fail fast
+    with a CircuitOpenError while the service is failing or too slow.
+    """
+
+    _STATUS_OK = 200
+    _SUBSCRIPTION_KEY_HEADER = 'Ocp-Apim-Subscription-Key'
+    _CONTENT_TYPE_HEADER = 'Content-Type'
+    _JSON_CONTENT_HEADER_VALUE = 'application/json'
+    _DEFAULT_MAX_RETRIES = 5
+
+    def __init__(self, subscription_key, connection_pool=None, rate_limiter=None,
+                 metrics_sink=None, max_retries=_DEFAULT_MAX_RETRIES, circuit_breaker=None):
+        """Constructor of the RecognitionTransport class.
+
+        Arguments:
+        subscription_key -- the subscription key string
+        connection_pool -- the ConnectionPool to send requests over, defaults to the
+                           process-wide pool
+        rate_limiter -- the RateLimiter to draw from, defaults to the process-wide limiter
+                        of the subscription key
+        metrics_sink -- an optional sink, such as Metrics.HistogramMetricsSink, recording
+                        the phases of every request and the state changes of the circuit
+                        breakers
+        max_retries -- the maximum number of retries of a throttled request
+        circuit_breaker -- the CircuitBreaker of every request, defaults to the
+                           process-wide breaker of the host of each request, see
+                           CircuitBreaker.configure_circuit_breaker
+        """
+        self._subscription_key = subscription_key
+        self._connection_pool = connection_pool or ConnectionPool.get_default_pool()
+        self._rate_limiter = rate_limiter or RateLimiter.get_rate_limiter(subscription_key)
+        self._metrics_sink = metrics_sink
+        self._max_retries = max_retries
+        self._circuit_breaker = circuit_breaker
+        if circuit_breaker is not None:
+            circuit_breaker.add_metrics_sink(metrics_sink)
+
+    def send_request(self, method, base_url, request_url, content_type_value, body=None,
+                     stream=False, fresh_connection=False):
+        """Sends the request to the server then returns the response and the response body string.
+
+        Arguments:
+        method -- specifies whether the request is a GET or POST request
+        base_url -- the host of the request, see ConnectionPool.create_connection
+        request_url -- the request url for the connection
+        content_type_value -- the value of the content type field in the headers
+        body -- the body of the request (needed only in POST methods)
+        stream -- return a successful response unread, see ConnectionPool.request
+        fresh_connection -- send the request over a new connection, e.g. a hedged request
+                            that should not share the connection of a slow one
+        """
+        try:
+            # Set the headers
+            headers = {self._CONTENT_TYPE_HEADER: content_type_value,
+                       self._SUBSCRIPTION_KEY_HEADER: self._subscription_key}
+
+            # Fail before waiting on the quota when the service is known to be down
+            circuit_breaker = self._circuit_breaker or \
+                CircuitBreaker.get_circuit_breaker(base_url, self._metrics_sink)
+            circuit_breaker.check()
+
+            # Send the request over a pooled keep-alive connection within the quota, the
+            # breaker timing it from the moment a connection was acquired
+            return RateLimiter.send_with_backoff(
+                self._rate_limiter,
+                lambda: circuit_breaker.call(lambda on_acquired: self._connection_pool.request(
+                    base_url, method, request_url, body, headers, self._metrics_sink,
+                    stream, fresh_connection, on_acquired)),
+                body,
+                self._max_retries)
+        except CircuitBreaker.CircuitOpenError:
+            if self._metrics_sink is not None:
+                self._metrics_sink.record(Metrics.CIRCUIT_REJECTED, 1)
+            logging.error('Error sending the request, the circuit is open.')
+            raise
+        except:
+            logging.error('Error sending the request.')
+            raise
+
+    def parse_json(self, message):
+        """Parses a JSON response body.
+
+        Arguments:
+        message -- the response body string
+        """
+        return Metrics.parse_json(message, self._metrics_sink)
+
+    def get_profiles(self, base_url, profiles_url, profile_class):
+        """Returns the list of all profiles of a profiles url.
+
+        Arguments:
+        base_url -- the host of the service
+        profiles_url -- the url listing the profiles
+        profile_class -- the class wrapping the dictionary of a profile
+        """
+        res, message = self.send_request(
+            'GET', base_url, profiles_url, self._JSON_CONTENT_HEADER_VALUE)
+        if res.status != self._STATUS_OK:
+            reason = res.reason if not message else message
+            raise Exception('Error getting all profiles: ' + reason)
+        return [profile_class(profile_raw) for profile_raw in self.parse_json(message)]
+
+    def iter_profiles(self, base_url, profiles_url, profile_class):
+        """Yields the profiles of a profiles url as they are read from the response, holding
+        one profile at a time rather than the whole listing.
+
+        The pooled connection is in use until the profiles were all read, or the generator
+        is closed.
+
+        Arguments:
+        base_url -- the host of the service
+        profiles_url -- the url listing the profiles
+        profile_class -- the class wrapping the dictionary of a profile
+        """
+        res, message = self.send_request(
+            'GET', base_url, profiles_url, self._JSON_CONTENT_HEADER_VALUE, stream=True)
+        with closing(res):
+            if res.status != self._STATUS_OK:
+                reason = res.reason if not message else message
+                raise Exception('Error getting all profiles: ' + reason)
+            for profile_raw in JsonStream.iter_array(res, metrics_sink=self._metrics_sink):
+                yield profile_class(profile_raw)
+
+    def record_operation(self, started, checks):
+        """Records the processing time and the number of status checks of a finished
+        operation.
+
+        Arguments:
+        started -- the monotonic time the operation was accepted at
+        checks -- the number of status checks sent
+        """
+        if self._metrics_sink is not None:
+            self._metrics_sink.record(Metrics.PROCESSING_SECONDS, time.monotonic() - started)
+            self._metrics_sink.record(Metrics.POLL_ITERATIONS, checks)
+
+
+def is_retryable(error):
+    """Returns whether a failed request may succeed when sent again, which is not the case
+    of most requests the service rejected with a 4xx status.
+
+    Arguments:
+    error -- the exception raised by the request
+    """
+    if not isinstance(error, ServiceError):
+        return True
+    status = error.get_status()
+    return not 400 <= status < 500 or status in _RETRYABLE_CLIENT_STATUSES
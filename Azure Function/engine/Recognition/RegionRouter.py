@@ -0,0 +1,304 @@
+import threading
+import time
+import logging
+from . import BulkRunner
+from . import CircuitBreaker
+from . import Metrics
+from . import RecognitionTransport
+
+_STATUS_NOT_FOUND = 404
+
+
+class RegionRouter:
+    """Routes the calls of a recognition service between regional endpoints.
+
+    Every region has its own endpoint, subscription key and helper. The router keeps a
+    moving average of the response time and of the error rate of each region: the response
+    times come from the metrics of the helper of the region, the errors from the calls
+    made through the router. Requests the service rejected with a 4xx status, which would
+    fail the same way when sent again, do not count as errors.
+
+    Profiles only exist in the region they were created in, so the router keeps an index
+    of the region of every profile. Profile-scoped calls go to the region owning the
+    profile, which is looked up in the regions on first use. New profiles are created in
+    the fastest healthy region, failing over to the next one if it fails. A region is
+    unhealthy while its error average is above the threshold or its circuit is open. Regions
+    not called for retry_unhealthy_seconds, including those never called, are tried first
+    so that their averages are measured again.
+
+    Example, identifying against candidates of several regions:
+
+        router = RegionRouter(
+            [('westus', 'westus.api.cognitive.microsoft.com', westus_key),
+             ('westeurope', 'westeurope.api.cognitive.microsoft.com', westeurope_key)],
+            lambda subscription_key, base_uri, metrics_sink:
+                IdentificationServiceHttpClientHelper(
+                    subscription_key, base_uri=base_uri, metrics_sink=metrics_sink))
+        responses = router.call_profiles(
+            profile_ids, lambda helper, ids: helper.identify_file(audio, ids, True))
+    """
+
+    _DEFAULT_SMOOTHING = 0.2
+    _DEFAULT_UNHEALTHY_ERROR_RATE = 0.5
+    _DEFAULT_RETRY_UNHEALTHY_SECONDS = 30
+    _DEFAULT_CONCURRENCY = 4
+
+    def __init__(self, regions, create_helper, smoothing=_DEFAULT_SMOOTHING,
+                 unhealthy_error_rate=_DEFAULT_UNHEALTHY_ERROR_RATE,
+                 retry_unhealthy_seconds=_DEFAULT_RETRY_UNHEALTHY_SECONDS,
+                 metrics_sink=None):
+        """Constructor of the RegionRouter class.
+
+        Arguments:
+        regions -- a list of (name, base_uri, subscription_key) tuples, in the order of
+                   preference before any latency is known
+        create_helper -- callable taking (subscription_key, base_uri, metrics_sink) and
+                         returning the service helper of a region
+        smoothing -- the weight of the latest value in the moving averages
+        unhealthy_error_rate -- the error average from which a region is unhealthy
+        retry_unhealthy_seconds -- seconds after which an unhealthy region is tried again
+        metrics_sink -- an optional sink the metrics of every region are forwarded to
+        """
+        if not regions:
+            raise Exception('Error configuring the region router: no regions are provided.')
+        self._smoothing = smoothing
+        self._unhealthy_error_rate = unhealthy_error_rate
+        self._retry_unhealthy_seconds = retry_unhealthy_seconds
+        self._lock = threading.Lock()
+        self._regions = []
+        self._regions_by_name = {}
+        for order, (name, base_uri, subscription_key) in enumerate(regions):
+            region = _Region(self, order, name, base_uri, metrics_sink)
+            region.helper = create_helper(subscription_key, base_uri, region)
+            self._regions.append(region)
+            self._regions_by_name[name] = region
+        self._profile_regions = {}
+
+    def get_helper(self, region_name):
+        """Returns the helper of a region.
+
+        Arguments:
+        region_name -- the name of the region
+        """
+        return self._regions_by_name[region_name].helper
+
+    def get_region_names(self):
+        """Returns the names of the regions, healthy regions first and the fastest first."""
+        return [region.name for region in self._get_regions_by_preference()]
+
+    def get_profile_region(self, profile_id):
+        """Returns the name of the region owning a profile, looking it up in every region
+        if it is not indexed yet.
+
+        Arguments:
+        profile_id -- the profile ID string
+        """
+        with self._lock:
+            region = self._profile_regions.get(profile_id)
+        if region is None:
+            region = self._find_profile(profile_id)
+        return region.name
+
+    def assign(self, profile_id, region_name):
+        """Records the region owning a profile, e.g. one created by another process.
+
+        Arguments:
+        profile_id -- the profile ID string
+        region_name -- the name of the region
+        """
+        region = self._regions_by_name[region_name]
+        with self._lock:
+            self._profile_regions[profile_id] = region
+
+    def forget(self, profile_id):
+        """Drops a profile from the index, e.g. one deleted by another process.
+
+        Arguments:
+        profile_id -- the profile ID string
+        """
+        with self._lock:
+            self._profile_regions.pop(profile_id, None)
+
+    def refresh_index(self):
+        """Rebuilds the profile index from the profile listings of every region and returns
+        the number of profiles indexed. A region that cannot be listed keeps its entries."""
+        profile_regions = {}
+        failed_regions = set()
+        for region in self._regions:
+            try:
+                profiles = self._call(region, lambda helper: list(helper.iter_all_profiles()))
+            except Exception:
+                logging.error('Error listing the profiles of region %s.', region.name)
+                failed_regions.add(region)
+                continue
+            for profile in profiles:
+                profile_regions[profile.get_profile_id()] = region
+        with self._lock:
+            for profile_id, region in self._profile_regions.items():
+                if region in failed_regions:
+                    profile_regions.setdefault(profile_id, region)
+            self._profile_regions = profile_regions
+            return len(profile_regions)
+
+    def create_profile(self, locale):
+        """Creates a profile in the fastest healthy region, failing over to the next region
+        on an error that may not happen there, and returns the creation response.
+
+        Arguments:
+        locale -- the locale string for the profile
+        """
+        error = None
+        for region in self._get_regions_by_preference():
+            try:
+                response = self._call(region, lambda helper: helper.create_profile(locale))
+            except Exception as e:
+                if not RecognitionTransport.is_retryable(e):
+                    # Another region would reject it the same way, e.g. an unknown locale
+                    raise
+                logging.warning('Error creating a profile in region %s, failing over.',
+                                region.name)
+                error = e
+                continue
+            with self._lock:
+                self._profile_regions[response.get_profile_id()] = region
+            return response
+        raise error
+
+    def delete_profile(self, profile_id):
+        """Deletes a profile in its region and drops it from the index.
+
+        Arguments:
+        profile_id -- the profile ID string
+        """
+        self.call_profile(profile_id, lambda helper: helper.delete_profile(profile_id))
+        self.forget(profile_id)
+
+    def call_profile(self, profile_id, function):
+        """Calls a function with the helper of the region owning a profile and returns its
+        result, e.g. call_profile(id, lambda helper: helper.enroll_profile(id, audio)).
+
+        Arguments:
+        profile_id -- the profile ID string
+        function -- callable taking the helper of the region
+        """
+        region = self._regions_by_name[self.get_profile_region(profile_id)]
+        return self._call(region, function)
+
+    def call_profiles(self, profile_ids, function, concurrency=_DEFAULT_CONCURRENCY):
+        """Groups profiles by region, calls a function with the helper and the profile IDs
+        of each region concurrently, and returns a list of (region_name, result, error)
+        tuples.
+
+        Arguments:
+        profile_ids -- an array of profile IDs strings
+        function -- callable taking the helper of a region and its profile IDs
+        concurrency -- the maximum number of regions called at once
+        """
+        groups = {}
+        for profile_id in profile_ids:
+            region = self._regions_by_name[self.get_profile_region(profile_id)]
+            groups.setdefault(region, []).append(profile_id)
+        return [(region.name, result, error) for (region, ids), result, error in
+                BulkRunner.run_bounded(
+                    lambda group: self._call(group[0], lambda helper: function(helper, group[1])),
+                    groups.items(), concurrency)]
+
+    def get_stats(self):
+        """Returns a dictionary of the moving latency and error averages, the health and the
+        number of indexed profiles of every region by name."""
+        with self._lock:
+            counts = {}
+            for region in self._profile_regions.values():
+                counts[region] = counts.get(region, 0) + 1
+            now = time.monotonic()
+            return {region.name: {
+                'latency': region.latency,
+                'error_rate': region.error_rate,
+                'healthy': self._is_healthy(region, now),
+                'profiles': counts.get(region, 0)} for region in self._regions}
+
+    def _find_profile(self, profile_id):
+        """Looks a profile up in every region and indexes the region owning it."""
+        for region in self._get_regions_by_preference():
+            try:
+                self._call(region, lambda helper: helper.get_profile(profile_id))
+            except RecognitionTransport.ServiceError as e:
+                if e.get_status() != _STATUS_NOT_FOUND:
+                    raise
+                continue
+            with self._lock:
+                self._profile_regions[profile_id] = region
+            return region
+        raise Exception('Error routing the call: profile {0} was not found in any '
+                        'region'.format(profile_id))
+
+    def _call(self, region, function):
+        """Calls a function with the helper of a region and records its outcome."""
+        with self._lock:
+            region.last_attempt = time.monotonic()
+        try:
+            result = function(region.helper)
+        except Exception as e:
+            # A request the service rejected, e.g. for an unknown profile, says nothing
+            # about the health of the region
+            if RecognitionTransport.is_retryable(e):
+                self._record_error(region, 1.0)
+            raise
+        self._record_error(region, 0.0)
+        return result
+
+    def _get_regions_by_preference(self):
+        with self._lock:
+            now = time.monotonic()
+            return sorted(self._regions, key=lambda region: (
+                not self._is_healthy(region, now),
+                # Measure the regions never or long not used before trusting the averages
+                -1 if region.latency is None or self._is_stale(region, now)
+                else region.latency,
+                region.order))
+
+    def _is_healthy(self, region, now):
+        """Returns whether a region takes new calls. Must be called with the lock held."""
+        if self._is_stale(region, now):
+            # Give it a chance to show it recovered
+            return True
+        if region.error_rate >= self._unhealthy_error_rate:
+            return False
+        return CircuitBreaker.get_circuit_breaker(region.base_uri).get_state() != \
+            CircuitBreaker.STATE_OPEN
+
+    def _is_stale(self, region, now):
+        """Returns whether a region was not called for retry_unhealthy_seconds."""
+        return now - region.last_attempt >= self._retry_unhealthy_seconds
+
+    def _record_error(self, region, error):
+        with self._lock:
+            region.error_rate += self._smoothing * (error - region.error_rate)
+
+    def _record_latency(self, region, latency):
+        with self._lock:
+            if region.latency is None:
+                region.latency = latency
+            else:
+                region.latency += self._smoothing * (latency - region.latency)
+
+
+class _Region:
+    """A regional endpoint and its health, and the metrics sink of its helper."""
+
+    def __init__(self, router, order, name, base_uri, metrics_sink):
+        self.order = order
+        self.name = name
+        self.base_uri = base_uri
+        self.helper = None
+        self.latency = None
+        self.error_rate = 0.0
+        self.last_attempt = 0
+        self._router = router
+        self._metrics_sink = metrics_sink
+
+    def record(self, name, value):
+        if name == Metrics.RESPONSE_SECONDS:
+            self._router._record_latency(self, value)
+        if self._metrics_sink is not None:
+            self._metrics_sink.record(name, value)
@@ -0,0 +1,105 @@
+import numpy as np
+from . import AudioNormalizer
+
+
+class VoiceActivityDetector:
+    """Finds speech in mono audio from the energy and zero-crossing rate of short frames.
+
+    A frame is speech when its energy is well above the noise floor of the clip, or when it
+    is only moderately above it but has the high zero-crossing rate of unvoiced consonants.
+    Speech regions are padded so that short pauses between words are kept and only longer
+    silences are removed.
+
+    The noise floor is the energy of the quietest frames, but never above max_noise_floor_db:
+    a clip of continuous speech has no silent frames, and a floor measured on its quietest
+    syllables would trim the rest of its speech.
+    """
+
+    def __init__(self, frame_seconds=0.02, energy_margin_db=12.0, unvoiced_margin_db=6.0,
+                 min_energy_db=-55.0, unvoiced_zero_crossing_rate=0.25, padding_seconds=0.2,
+                 max_noise_floor_db=-40.0):
+        """Constructor of the VoiceActivityDetector class.
+
+        Arguments:
+        frame_seconds -- the length of an analysis frame
+        energy_margin_db -- dB above the noise floor from which a frame is speech
+        unvoiced_margin_db -- dB above the noise floor from which a frame with a high
+                              zero-crossing rate is speech
+        min_energy_db -- the energy in dBFS below which a frame is never speech
+        unvoiced_zero_crossing_rate -- the zero-crossing rate of unvoiced speech frames
+        padding_seconds -- silence kept around every speech region
+        max_noise_floor_db -- the highest noise floor in dBFS, the energy of silence in a
+                              quiet recording
+        """
+        self._frame_seconds = frame_seconds
+        self._energy_margin_db = energy_margin_db
+        self._unvoiced_margin_db = unvoiced_margin_db
+        self._min_energy_db = min_energy_db
+        self._unvoiced_zero_crossing_rate = unvoiced_zero_crossing_rate
+        self._padding_seconds = padding_seconds
+        self._max_noise_floor_db = max_noise_floor_db
+
+    def get_frame_length(self, sample_rate):
+        """Returns the number of samples of an analysis frame.
+
+        Arguments:
+        sample_rate -- the sample rate of the samples
+        """
+        return max(1, int(sample_rate * self._frame_seconds))
+
+    def detect(self, samples, sample_rate):
+        """Returns a boolean array telling for every frame whether it contains speech.
+
+        Arguments:
+        samples -- flat float32 array of mono samples in [-1, 1]
+        sample_rate -- the sample rate of the samples
+        """
+        frame_length = self.get_frame_length(sample_rate)
+        frame_count = len(samples) // frame_length
+        if frame_count == 0:
+            return np.zeros(0, dtype=bool)
+        frames = samples[:frame_count * frame_length].reshape(frame_count, frame_length)
+
+        energy_db = 10 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+        signs = np.signbit(frames)
+        zero_crossing_rate = np.count_nonzero(
+            signs[:, 1:] != signs[:, :-1], axis=1) / float(frame_length)
+
+        noise_floor_db = min(np.percentile(energy_db, 10), self._max_noise_floor_db)
+        speech = (energy_db > noise_floor_db + self._energy_margin_db) | (
+            (energy_db > noise_floor_db + self._unvoiced_margin_db) &
+            (zero_crossing_rate > self._unvoiced_zero_crossing_rate))
+        return speech & (energy_db > self._min_energy_db)
+
+    def trim(self, samples, sample_rate):
+        """Returns the samples with leading, trailing and long internal silences removed
+        and the net speech duration in seconds.
+
+        Arguments:
+        samples -- flat float32 array of mono samples in [-1, 1]
+        sample_rate -- the sample rate of the samples
+        """
+        speech = self.detect(samples, sample_rate)
+        frame_length = self.get_frame_length(sample_rate)
+        speech_seconds = np.count_nonzero(speech) * frame_length / float(sample_rate)
+
+        # Keep the silence around speech so words are not clipped
+        padding = int(round(self._padding_seconds / self._frame_seconds))
+        if padding and speech.any():
+            kernel = np.ones(2 * padding + 1, dtype=np.float32)
+            speech = np.convolve(speech.astype(np.float32), kernel, mode='same') > 0
+
+        keep = np.repeat(speech, frame_length)
+        return samples[:len(keep)][keep], speech_seconds
+
+    def trim_wav(self, data):
+        """Returns the bytes of a 16-bit mono WAV file with the silences removed and the
+        net speech duration in seconds.
+
+        Arguments:
+        data -- the bytes of the WAV file
+        """
+        audio = AudioNormalizer.parse_wav(data)
+        trimmed, speech_seconds = self.trim(
+            AudioNormalizer.downmix(audio.samples), audio.sample_rate)
+        return AudioNormalizer.encode_wav(trimmed, audio.sample_rate), speech_seconds
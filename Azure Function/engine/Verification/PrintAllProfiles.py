@@ -1,4 +1,4 @@
-import VerificationServiceHttpClientHelper
+from . import VerificationServiceHttpClientHelper
 import sys
 
 def print_all_profiles(subscription_key):
@@ -10,7 +10,7 @@ def print_all_profiles(subscription_key):
     helper = VerificationServiceHttpClientHelper.VerificationServiceHttpClientHelper(
         subscription_key)
 
-    profiles = helper.get_all_profiles()
+    profiles = helper.iter_all_profiles()
 
     print('Profile ID, Locale, Enrollments Count, Remaining Enrollments Count,'
           ' Created Date Time, Last Action Date Time, Enrollment Status')
@@ -1,18 +1,21 @@
-import http.client
 import urllib.parse
 import json
 import time
-from contextlib import closing
-import ProfileCreationResponse
-import EnrollmentResponse
-import VerificationResponse
-import VerificationProfile
+import threading
+from . import ProfileCreationResponse
+from . import EnrollmentResponse
+from . import VerificationResponse
+from . import VerificationProfile
+from ..Recognition import AudioBody
+from ..Recognition import BulkRunner
+from ..Recognition import RecognitionTransport
 import logging
 
 class VerificationServiceHttpClientHelper:
     """Abstracts the interaction with the Verification service."""
 
     _STATUS_OK = 200
+    _STATUS_NOT_FOUND = 404
     _BASE_URI = 'westus.api.cognitive.microsoft.com'
     _VERIFICATION_PROFILES_URI = '/spid/v1.0/verificationProfiles'
     _VERIFICATION_URI = '/spid/v1.0/verify'
@@ -20,37 +23,75 @@ class VerificationServiceHttpClientHelper:
     _CONTENT_TYPE_HEADER = 'Content-Type'
     _JSON_CONTENT_HEADER_VALUE = 'application/json'
     _STREAM_CONTENT_HEADER_VALUE = 'application/octet-stream'
+    _MIN_SPEECH_SECONDS = 1.0
+    _DEFAULT_BATCH_CONCURRENCY = 8
+    _DEFAULT_BULK_ATTEMPTS = 3
 
-    def __init__(self, subscription_key):
+    def __init__(self, subscription_key, rate_limiter=None, normalize_audio=False,
+                 voice_activity_detector=None, min_speech_seconds=_MIN_SPEECH_SECONDS,
+                 base_uri=None, metrics_sink=None, connection_pool=None, transport=None):
         """Constructor of the VerificationServiceHttpClientHelper class.
 
         Arguments:
         subscription_key -- the subscription key string
+        rate_limiter -- the RateLimiter to draw from, defaults to the process-wide limiter
+                        of the subscription key
+        normalize_audio -- convert audio to 16 kHz, 16-bit, mono PCM WAV locally before it
+                           is uploaded
+        voice_activity_detector -- an optional VoiceActivityDetector removing silences from
+                                   audio before it is uploaded
+        min_speech_seconds -- the net speech below which trimmed audio is rejected without
+                              calling the service
+        base_uri -- the host of the service, defaults to _BASE_URI; prefix it with http://
+                    to target a local mock server
+        metrics_sink -- an optional sink, such as Metrics.HistogramMetricsSink, recording
+                        the connect, upload and parsing phases
+        connection_pool -- the ConnectionPool to send requests over, defaults to the
+                           process-wide pool
+        transport -- a RecognitionTransport shared with other helpers, replaces
+                     connection_pool, rate_limiter and metrics_sink
         """
         self._subscription_key = subscription_key
+        self._base_uri = base_uri or self._BASE_URI
+        self._transport = transport or RecognitionTransport.RecognitionTransport(
+            subscription_key, connection_pool, rate_limiter, metrics_sink)
+        self._normalize_audio = normalize_audio
+        self._voice_activity_detector = voice_activity_detector
+        self._min_speech_seconds = min_speech_seconds
+        self._batch_lock = threading.Lock()
+        self._batch_verified = 0
+        self._batch_failed = 0
+        self._batch_in_flight = 0
+        self._batch_latency = 0.0
+        self._batch_runs = 0
+        self._batch_elapsed = 0.0
+        self._batch_resumed = None
 
     def get_all_profiles(self):
         """Return a list of all profiles on the server."""
         try:
-            # Send the request
-            res, message = self._send_request(
-                'GET',
-                self._BASE_URI,
+            return self._transport.get_profiles(
+                self._base_uri,
                 self._VERIFICATION_PROFILES_URI,
-                self._JSON_CONTENT_HEADER_VALUE)
-
-            if res.status == self._STATUS_OK:
-                # Parse the response body
-                profiles_raw = json.loads(message)
-                return [VerificationProfile.VerificationProfile(profiles_raw[i])
-                        for i in range(0, len(profiles_raw))]
-            else:
-                reason = reason if not message else message
-                raise Exception('Error getting all profiles: ' + reason)
+                VerificationProfile.VerificationProfile)
         except:
             logging.error('Error getting all profiles.')
             raise
 
+    def iter_all_profiles(self):
+        """Yield all profiles on the server as they are read from the response, in memory
+        bounded by one profile rather than the whole listing."""
+        try:
+            for profile in self._transport.iter_profiles(
+                    self._base_uri,
+                    self._VERIFICATION_PROFILES_URI,
+                    VerificationProfile.VerificationProfile):
+                yield profile
+        except Exception:
+            # GeneratorExit is not caught, closing the generator early is not an error
+            logging.error('Error getting all profiles.')
+            raise
+
     def create_profile(self, locale):
         """Creates a profile on the server and returns a dictionary of the creation response.
 
@@ -64,17 +105,19 @@ class VerificationServiceHttpClientHelper:
             # Send the request
             res, message = self._send_request(
                 'POST',
-                self._BASE_URI,
+                self._base_uri,
                 self._VERIFICATION_PROFILES_URI,
                 self._JSON_CONTENT_HEADER_VALUE,
                 body)
 
             if res.status == self._STATUS_OK:
                 # Parse the response body
-                return ProfileCreationResponse.ProfileCreationResponse(json.loads(message))
+                return ProfileCreationResponse.ProfileCreationResponse(
+                    self._transport.parse_json(message))
             else:
                 reason = res.reason if not message else message
-                raise Exception('Error creating profile: ' + reason)
+                raise RecognitionTransport.ServiceError(
+                    'Error creating profile: ' + reason, res.status)
 				
         except:
             logging.error('Error creating profile.')
@@ -96,28 +139,30 @@ class VerificationServiceHttpClientHelper:
             # Send the request
             res, message = self._send_request(
                 'GET',
-                self._BASE_URI,
+                self._base_uri,
                 request_url,
                 self._JSON_CONTENT_HEADER_VALUE)
             
             if res.status == self._STATUS_OK:
                 # Parse the response body
-                profile_raw = json.loads(message)
+                profile_raw = self._transport.parse_json(message)
                 return VerificationProfile.VerificationProfile(profile_raw)
             else:
-                reason = reason if not message else message
-                raise Exception('Error getting profile: ' + reason)
+                reason = res.reason if not message else message
+                raise RecognitionTransport.ServiceError(
+                    'Error getting profile: ' + reason, res.status)
             
         except:
             logging.error('Error getting profile')
             raise
         
     
-    def delete_profile(self, profile_id):
+    def delete_profile(self, profile_id, missing_ok=False):
         """Delete the given profile from the server
 
         Arguments:
         profile_id -- the profile ID of the profile to delete
+        missing_ok -- whether a profile that does not exist counts as deleted
         """
         try:
             # Prepare the request
@@ -128,13 +173,15 @@ class VerificationServiceHttpClientHelper:
             # Send the request
             res, message = self._send_request(
                 'DELETE',
-                self._BASE_URI,
+                self._base_uri,
                 request_url,
                 self._JSON_CONTENT_HEADER_VALUE)
                 
-            if res.status != self._STATUS_OK:
+            if res.status != self._STATUS_OK and not (
+                    missing_ok and res.status == self._STATUS_NOT_FOUND):
                 reason = res.reason if not message else message
-                raise Exception('Error deleting profile: ' + reason)
+                raise RecognitionTransport.ServiceError(
+                    'Error deleting profile: ' + reason, res.status)
         
         except:
             logging.error('Error deleting profile')
@@ -156,16 +203,59 @@ class VerificationServiceHttpClientHelper:
             # Send the request
             res, message = self._send_request(
                 'POST',
-                self._BASE_URI,
+                self._base_uri,
                 request_url,
                 self._JSON_CONTENT_HEADER_VALUE)
             
             if res.status != self._STATUS_OK:
                 reason = res.reason if not message else message
-                raise Exception('Error resetting profile: ' + reason)
+                raise RecognitionTransport.ServiceError(
+                    'Error resetting profile: ' + reason, res.status)
         except:
             logging.error('Error resetting profile')
             raise
+
+    def delete_many(self, profile_ids, concurrency=_DEFAULT_BATCH_CONCURRENCY,
+                    max_attempts=_DEFAULT_BULK_ATTEMPTS, on_outcome=None):
+        """Deletes profiles concurrently within the rate limit of the subscription key and
+        returns a summary of the successes, failures and throughput, see
+        BulkRunner.summarize.
+
+        A failed deletion is sent again up to max_attempts times, unless the service
+        rejected it with a 4xx status. A profile that does not exist counts as deleted, so
+        a deletion whose response was lost is safely sent again.
+
+        Arguments:
+        profile_ids -- iterable of profile ID strings, read lazily
+        concurrency -- the maximum number of concurrent deletions
+        max_attempts -- the maximum number of requests per profile
+        on_outcome -- an optional callable taking the profile ID, result and error of every
+                      profile as soon as it is done
+        """
+        return BulkRunner.summarize(BulkRunner.run_with_retries(
+            lambda profile_id: self.delete_profile(profile_id, missing_ok=True),
+            profile_ids, concurrency, max_attempts, RecognitionTransport.is_retryable),
+            on_outcome)
+
+    def reset_many(self, profile_ids, concurrency=_DEFAULT_BATCH_CONCURRENCY,
+                   max_attempts=_DEFAULT_BULK_ATTEMPTS, on_outcome=None):
+        """Resets the enrollments of profiles concurrently within the rate limit of the
+        subscription key and returns a summary of the successes, failures and throughput,
+        see BulkRunner.summarize.
+
+        A failed reset is sent again up to max_attempts times, unless the service rejected
+        it with a 4xx status, e.g. for a profile that does not exist.
+
+        Arguments:
+        profile_ids -- iterable of profile ID strings, read lazily
+        concurrency -- the maximum number of concurrent resets
+        max_attempts -- the maximum number of requests per profile
+        on_outcome -- an optional callable taking the profile ID, result and error of every
+                      profile as soon as it is done
+        """
+        return BulkRunner.summarize(BulkRunner.run_with_retries(
+            self.reset_enrollments, profile_ids, concurrency, max_attempts,
+            RecognitionTransport.is_retryable), on_outcome)
     
     def enroll_profile(self, profile_id, file_path):
         """Enrolls a profile using an audio file and returns a
@@ -173,7 +263,10 @@ class VerificationServiceHttpClientHelper:
 
         Arguments:
         profile_id -- the profile ID string of the user to enroll
-        file_path -- the file path string of the audio file to use
+        file_path -- the file path string of the audio file to use,
+                     or the audio itself as bytes, a memoryview, a readable stream or an
+                     iterator of chunks (streams and iterators are sent with chunked
+                     transfer encoding)
         """
         try:
             # Prepare the request
@@ -183,20 +276,25 @@ class VerificationServiceHttpClientHelper:
 
 
             # Prepare the body of the message
-            with open(file_path, 'rb') as body:
+            audio = AudioBody.prepare_audio(
+                file_path, self._normalize_audio, self._voice_activity_detector,
+                self._min_speech_seconds)
+            with AudioBody.open_audio(audio) as body:
                 # Send the request
                 res, message = self._send_request(
                     'POST',
-                    self._BASE_URI,
+                    self._base_uri,
                     request_url,
                     self._STREAM_CONTENT_HEADER_VALUE,
                     body)
             if res.status == self._STATUS_OK:
                 # Parse the response body
-                return EnrollmentResponse.EnrollmentResponse(json.loads(message))
+                return EnrollmentResponse.EnrollmentResponse(
+                    self._transport.parse_json(message))
             else:
                 reason = res.reason if not message else message
-                raise Exception('Error enrolling profile: ' + reason)
+                raise RecognitionTransport.ServiceError(
+                    'Error enrolling profile: ' + reason, res.status)
         except:
             logging.error('Error enrolling profile.')
             raise
@@ -205,7 +303,10 @@ class VerificationServiceHttpClientHelper:
         """Verifies a profile using an audio file and returns a
 
         Arguments:
-        file_path -- the file path of the audio file to test
+        file_path -- the file path of the audio file to test,
+                     or the audio itself as bytes, a memoryview, a readable stream or an
+                     iterator of chunks (streams and iterators are sent with chunked
+                     transfer encoding)
         profile_id -- a profile to test against
         """
         try:
@@ -215,25 +316,91 @@ class VerificationServiceHttpClientHelper:
                 urllib.parse.quote(profile_id))
 
             # Prepare the body of the message
-            with open(file_path, 'rb') as body:
+            audio = AudioBody.prepare_audio(
+                file_path, self._normalize_audio, self._voice_activity_detector,
+                self._min_speech_seconds)
+            with AudioBody.open_audio(audio) as body:
                 # Send the request
                 res, message = self._send_request(
                     'POST',
-                    self._BASE_URI,
+                    self._base_uri,
                     request_url,
                     self._STREAM_CONTENT_HEADER_VALUE,
                     body)
 
             if res.status == self._STATUS_OK:
                 # Parse the response body
-                return VerificationResponse.VerificationResponse(json.loads(message))
+                return VerificationResponse.VerificationResponse(
+                    self._transport.parse_json(message))
             else:
                 reason = res.reason if not message else message
-                raise Exception('Error verifying audio from file: ' + reason)
+                raise RecognitionTransport.ServiceError(
+                    'Error verifying audio from file: ' + reason, res.status)
         except:
             logging.error('Error performing verification.')
             raise
 
+    def verify_many(self, pairs, concurrency=_DEFAULT_BATCH_CONCURRENCY):
+        """Verifies (profile ID, audio) pairs concurrently and yields a tuple of
+        (pair, verification response, error) for each pair as soon as it finishes.
+        Exactly one of the response and the error is set.
+
+        Pairs are pulled lazily from the iterable, so arbitrarily long batches do not have
+        to fit in memory. Requests share the pooled connections of the transport, whose
+        pool should allow `concurrency` connections per host for all of them to run at once.
+
+        Arguments:
+        pairs -- iterable of (profile_id, audio) tuples, the audio being anything accepted
+                 by verify_file
+        concurrency -- the maximum number of concurrent verifications
+        """
+        def verify(pair):
+            profile_id, audio = pair
+            with self._batch_lock:
+                self._batch_in_flight += 1
+            started = time.monotonic()
+            try:
+                return self.verify_file(audio, profile_id)
+            finally:
+                with self._batch_lock:
+                    self._batch_in_flight -= 1
+                    self._batch_latency += time.monotonic() - started
+
+        with self._batch_lock:
+            if self._batch_runs == 0:
+                self._batch_resumed = time.monotonic()
+            self._batch_runs += 1
+        try:
+            for pair, response, error in BulkRunner.run_bounded(verify, pairs, concurrency):
+                with self._batch_lock:
+                    if error is None:
+                        self._batch_verified += 1
+                    else:
+                        self._batch_failed += 1
+                yield pair, response, error
+        finally:
+            with self._batch_lock:
+                self._batch_runs -= 1
+                if self._batch_runs == 0:
+                    self._batch_elapsed += time.monotonic() - self._batch_resumed
+
+    def get_batch_stats(self):
+        """Returns a dictionary of the throughput counters of verify_many: verified and
+        failed pairs, verifications in flight, seconds spent running batches, completed
+        verifications per second and mean latency of a verification."""
+        with self._batch_lock:
+            elapsed = self._batch_elapsed
+            if self._batch_runs:
+                elapsed += time.monotonic() - self._batch_resumed
+            completed = self._batch_verified + self._batch_failed
+            return {
+                'verified': self._batch_verified,
+                'failed': self._batch_failed,
+                'in_flight': self._batch_in_flight,
+                'elapsed': elapsed,
+                'verifications_per_second': completed / elapsed if elapsed else 0.0,
+                'mean_latency': self._batch_latency / completed if completed else 0.0}
+
     def _send_request(self, method, base_url, request_url, content_type_value, body=None):
         """Sends the request to the server then returns the response and the response body string.
 
@@ -244,19 +411,5 @@ class VerificationServiceHttpClientHelper:
         content_type_value -- the value of the content type field in the headers
         body -- the body of the request (needed only in POST methods)
         """
-        try:
-            # Set the headers
-            headers = {self._CONTENT_TYPE_HEADER: content_type_value,
-                       self._SUBSCRIPTION_KEY_HEADER: self._subscription_key}
-
-            # Start the connection
-            with closing(http.client.HTTPSConnection(base_url)) as conn:
-                # Send the request
-                conn.request(method, request_url, body, headers)
-                res = conn.getresponse()
-                message = res.read().decode('utf-8')
-
-                return res, message
-        except:
-            logging.error('Error sending the request.')
-            raise
+        return self._transport.send_request(
+            method, base_url, request_url, content_type_value, body)
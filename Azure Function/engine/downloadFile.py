@@ -54,6 +54,26 @@ def run_sample():
     return "run_sample is running."
 
 
+def iter_blob_chunks(block_blob_service, container_name, blob_name, chunk_size=4 * 1024 * 1024):
+    """Yields the content of a blob in ranges of chunk_size bytes.
+
+    The generator can be passed as audio to enroll_profile or identify_file, which send
+    it with chunked transfer encoding, so the blob never touches the local disk.
+
+    Arguments:
+    block_blob_service -- the BlockBlobService of the storage account
+    container_name -- the name of the container of the blob
+    blob_name -- the name of the blob
+    chunk_size -- the number of bytes downloaded per range request
+    """
+    blob_size = block_blob_service.get_blob_properties(
+        container_name, blob_name).properties.content_length
+    for start in range(0, blob_size, chunk_size):
+        end = min(start + chunk_size, blob_size) - 1
+        yield block_blob_service.get_blob_to_bytes(
+            container_name, blob_name, start_range=start, end_range=end).content
+
+
 def hello():
     return "Hello World"
 
@@ -0,0 +1,225 @@
+import asyncio
+import os
+import sys
+import unittest
+
+_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, _ROOT)
+sys.path.insert(0, os.path.join(_ROOT, 'benchmarks'))
+
+from engine.Identification.AsyncIdentificationClient import AsyncIdentificationClient
+from engine.Recognition import CircuitBreaker
+from engine.Recognition import Metrics
+from engine.Recognition import OperationPoller
+from engine.Recognition import RateLimiter
+from HelperLoadBenchmark import make_audio
+from MockRecognitionServer import MockRecognitionServer, MockRecognitionService
+
+_SUBSCRIPTION_KEY = 'async-client-test'
+
+
+class _ScriptedServer:
+    """Answers the requests of the nth connection with the raw responses of the nth script,
+    closing the connection at None or after a Connection: close response, and never
+    answering at _HANG."""
+
+    def __init__(self, *scripts):
+        self._scripts = list(scripts)
+        self.connections = 0
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, '127.0.0.1', 0)
+        return 'http://127.0.0.1:{0}'.format(self._server.sockets[0].getsockname()[1])
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        script = self._scripts[self.connections]
+        self.connections += 1
+        try:
+            for response in script:
+                await reader.readuntil(b'\r\n\r\n')
+                if response is None:
+                    break
+                if response is _HANG:
+                    await reader.read()
+                    break
+                writer.write(response)
+                await writer.drain()
+                if b'Connection: close' in response:
+                    break
+            else:
+                await reader.read()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        writer.close()
+
+
+_HANG = object()
+
+
+class ResponseBodyTest(unittest.TestCase):
+
+    def setUp(self):
+        RateLimiter.configure_rate_limit(_SUBSCRIPTION_KEY, 100000)
+
+    def exchange(self, responses, methods):
+        async def run():
+            server = _ScriptedServer(responses)
+            base_url = await server.start()
+            client = AsyncIdentificationClient(_SUBSCRIPTION_KEY, base_uri=base_url)
+            try:
+                results = []
+                for method in methods:
+                    res, message = await asyncio.wait_for(
+                        client._send_request(method, base_url, '/', 'application/json'), 5)
+                    results.append((res.status, message))
+                return results, server
+            finally:
+                await client.close()
+                await server.stop()
+        return asyncio.run(run())
+
+    def test_no_content_keeps_the_connection(self):
+        results, server = self.exchange(
+            [b'HTTP/1.1 204 No Content\r\n\r\n',
+             b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\n[]'],
+            ['DELETE', 'GET'])
+        self.assertEqual(results, [(204, ''), (200, '[]')])
+        self.assertEqual(server.connections, 1)
+
+    def test_head_has_no_body(self):
+        results, server = self.exchange(
+            [b'HTTP/1.1 200 OK\r\nContent-Length: 10\r\n\r\n',
+             b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\n{}'],
+            ['HEAD', 'GET'])
+        self.assertEqual(results, [(200, ''), (200, '{}')])
+        self.assertEqual(server.connections, 1)
+
+    def test_interim_response_is_skipped(self):
+        results, _ = self.exchange(
+            [b'HTTP/1.1 100 Continue\r\n\r\nHTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\n{}'],
+            ['POST'])
+        self.assertEqual(results, [(200, '{}')])
+
+    def test_body_until_close(self):
+        results, _ = self.exchange(
+            [b'HTTP/1.1 200 OK\r\nConnection: close\r\n\r\n{"a": 1}'], ['GET'])
+        self.assertEqual(results, [(200, '{"a": 1}')])
+
+    def test_unknown_length_on_kept_alive_connection_fails(self):
+        with self.assertRaises(Exception):
+            self.exchange([b'HTTP/1.1 200 OK\r\n\r\n{}'], ['GET'])
+
+
+class RetryTest(unittest.TestCase):
+
+    def setUp(self):
+        RateLimiter.configure_rate_limit(_SUBSCRIPTION_KEY, 100000)
+
+    def test_retry_connection_is_closed_when_cancelled(self):
+        async def run():
+            # The second request finds its kept-alive connection closed by the server, and
+            # the retry on a fresh connection never gets an answer
+            server = _ScriptedServer(
+                [b'HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n', None], [_HANG])
+            base_url = await server.start()
+            client = AsyncIdentificationClient(_SUBSCRIPTION_KEY, base_uri=base_url)
+            opened = []
+            open_connection = client._open_connection
+
+            async def record_open_connection(url):
+                connection = await open_connection(url)
+                opened.append(connection[1])
+                return connection
+            client._open_connection = record_open_connection
+            try:
+                await client._send_request('GET', base_url, '/', 'application/json')
+                with self.assertRaises(asyncio.TimeoutError):
+                    await asyncio.wait_for(
+                        client._send_request('GET', base_url, '/', 'application/json'), 0.5)
+                return server, opened
+            finally:
+                await client.close()
+                await server.stop()
+
+        server, opened = asyncio.run(run())
+        self.assertEqual(server.connections, 2)
+        self.assertTrue(all(writer.is_closing() for writer in opened))
+
+
+class MockServiceTest(unittest.TestCase):
+    """Runs the client against the mock service over plain HTTP."""
+
+    def start(self, **settings):
+        self.service = MockRecognitionService(latency=0, jitter=0, processing_time=0.05,
+                                              seed=1, **settings)
+        self.server = MockRecognitionServer(self.service).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        return self.server.get_base_uri()
+
+    def client(self, base_uri, **settings):
+        return AsyncIdentificationClient(
+            _SUBSCRIPTION_KEY, base_uri=base_uri, polling_policy=OperationPoller.PollingPolicy(
+                initial_delay=0.02, multiplier=1, max_delay=0.02, jitter=0), **settings)
+
+    def test_requests_share_the_limiter_and_record_metrics(self):
+        rate_limiter = RateLimiter.RateLimiter(100000)
+        metrics_sink = Metrics.HistogramMetricsSink()
+        base_uri = self.start()
+
+        async def run():
+            async with self.client(base_uri, rate_limiter=rate_limiter,
+                                   metrics_sink=metrics_sink) as client:
+                profile_id = (await client.create_profile('en-us')).get_profile_id()
+                await client.enroll_profile(profile_id, make_audio(1), True)
+                results = await asyncio.gather(*(
+                    client.identify_file(make_audio(seed), [profile_id], True)
+                    for seed in range(5)))
+                return results, client._semaphores
+
+        results, semaphores = asyncio.run(run())
+        self.assertEqual(len(results), 5)
+        self.assertEqual(list(semaphores), [base_uri])
+        self.assertEqual(rate_limiter.get_stats()['acquired'],
+                         sum(self.service.get_counts().values()))
+        summaries = metrics_sink.get_summaries()
+        for name in (Metrics.CONNECT_SECONDS, Metrics.UPLOAD_BYTES, Metrics.RESPONSE_SECONDS,
+                     Metrics.PROCESSING_SECONDS, Metrics.POLL_ITERATIONS):
+            self.assertIn(name, summaries)
+        self.assertEqual(summaries[Metrics.PROCESSING_SECONDS]['count'], 6)
+
+    def test_throttled_requests_are_retried(self):
+        rate_limiter = RateLimiter.RateLimiter(100000)
+        base_uri = self.start(throttle_rate=0.5, retry_after=0.01)
+
+        async def run():
+            async with self.client(base_uri, rate_limiter=rate_limiter) as client:
+                return await asyncio.gather(
+                    *(client.create_profile('en-us') for _ in range(10)))
+
+        self.assertEqual(len(asyncio.run(run())), 10)
+        self.assertGreater(rate_limiter.get_stats()['throttled'], 0)
+        self.assertEqual(self.service.get_counts()[200], 10)
+
+    def test_failing_host_opens_the_circuit(self):
+        circuit_breaker = CircuitBreaker.CircuitBreaker(minimum_calls=3)
+        base_uri = self.start(error_rate=1.0)
+
+        async def run():
+            async with self.client(base_uri, circuit_breaker=circuit_breaker) as client:
+                for _ in range(3):
+                    with self.assertRaises(Exception):
+                        await client.create_profile('en-us')
+                with self.assertRaises(CircuitBreaker.CircuitOpenError):
+                    await client.create_profile('en-us')
+
+        asyncio.run(run())
+        self.assertEqual(sum(self.service.get_counts().values()), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import os
+import struct
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from engine.Recognition import AudioNormalizer
+
+
+def make_wav(samples, sample_rate):
+    """Returns the bytes of a 16-bit PCM WAV file of a (frames, channels) array."""
+    pcm = (samples * 32767).astype('<i2').tobytes()
+    channels = samples.shape[1]
+    return struct.pack(
+        '<4sI4s4sIHHIIHH4sI', b'RIFF', 36 + len(pcm), b'WAVE', b'fmt ', 16, 1, channels,
+        sample_rate, sample_rate * channels * 2, channels * 2, 16, b'data', len(pcm)) + pcm
+
+
+def tone(frequency, seconds, sample_rate):
+    times = np.arange(int(seconds * sample_rate)) / float(sample_rate)
+    return (0.5 * np.sin(2 * np.pi * frequency * times)).astype(np.float32)
+
+
+class NormalizeWavTest(unittest.TestCase):
+
+    def test_stereo_44100_is_converted(self):
+        samples = tone(1000, 1.0, 44100)
+        normalized = AudioNormalizer.normalize_wav(
+            make_wav(np.stack([samples, samples], axis=1), 44100))
+
+        self.assertTrue(AudioNormalizer.is_normalized(normalized))
+        audio = AudioNormalizer.parse_wav(normalized)
+        self.assertEqual(audio.get_channels(), 1)
+        self.assertAlmostEqual(audio.get_duration(), 1.0, places=2)
+        spectrum = np.abs(np.fft.rfft(audio.samples[:, 0]))
+        self.assertAlmostEqual(np.argmax(spectrum) * 16000.0 / audio.samples.shape[0], 1000,
+                               delta=2)
+
+    def test_downsampling_removes_frequencies_above_nyquist(self):
+        # 10 kHz would alias to 6 kHz at 16 kHz without the low-pass
+        resampled = AudioNormalizer.resample(tone(10000, 1.0, 48000), 48000)
+        self.assertLess(np.sqrt(np.mean(resampled[100:-100] ** 2)), 0.01)
+
+    def test_normalized_audio_is_unchanged(self):
+        data = make_wav(tone(440, 0.5, 16000)[:, None], 16000)
+        self.assertIs(AudioNormalizer.normalize_wav(data), data)
+
+
+if __name__ == '__main__':
+    unittest.main()
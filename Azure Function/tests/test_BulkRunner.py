@@ -0,0 +1,81 @@
+import itertools
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from engine.Recognition import BulkRunner
+from engine.Recognition import RecognitionTransport
+
+
+class RunBoundedTest(unittest.TestCase):
+
+    def test_concurrency_is_bounded(self):
+        lock = threading.Lock()
+        in_flight = [0, 0]
+
+        def call(item):
+            with lock:
+                in_flight[0] += 1
+                in_flight[1] = max(in_flight[1], in_flight[0])
+            time.sleep(0.01)
+            with lock:
+                in_flight[0] -= 1
+            return item * 2
+
+        outcomes = list(BulkRunner.run_bounded(call, range(40), 4))
+        self.assertEqual(sorted(result for _, result, _ in outcomes), list(range(0, 80, 2)))
+        self.assertLessEqual(in_flight[1], 4)
+
+    def test_items_are_pulled_lazily(self):
+        pulled = []
+        items = (pulled.append(item) or item for item in itertools.count())
+        outcomes = BulkRunner.run_bounded(lambda item: item, items, 3)
+        for _ in range(5):
+            next(outcomes)
+        outcomes.close()
+        self.assertLess(len(pulled), 10)
+
+    def test_errors_are_reported_per_item(self):
+        def call(item):
+            if item % 2:
+                raise ValueError(item)
+            return item
+        summary = BulkRunner.summarize(BulkRunner.run_bounded(call, range(10), 3))
+        self.assertEqual(summary['succeeded'], 5)
+        self.assertEqual(sorted(item for item, _ in summary['failures']), [1, 3, 5, 7, 9])
+
+
+class RunWithRetriesTest(unittest.TestCase):
+
+    def test_transient_failures_are_retried(self):
+        attempts = {}
+
+        def call(item):
+            attempts[item] = attempts.get(item, 0) + 1
+            if attempts[item] < 3:
+                raise ConnectionResetError('reset')
+            return item
+
+        outcomes = list(BulkRunner.run_with_retries(call, range(5), 5, 3, backoff=0.001))
+        self.assertTrue(all(error is None for _, _, error in outcomes))
+        self.assertEqual(set(attempts.values()), {3})
+
+    def test_rejections_are_not_retried(self):
+        attempts = []
+
+        def call(item):
+            attempts.append(item)
+            raise RecognitionTransport.ServiceError('Error deleting profile: bad id', 400)
+
+        outcomes = list(BulkRunner.run_with_retries(
+            call, ['a'], 1, 3, RecognitionTransport.is_retryable, backoff=0.001))
+        self.assertIsInstance(outcomes[0][2], RecognitionTransport.ServiceError)
+        self.assertEqual(attempts, ['a'])
+
+
+if __name__ == '__main__':
+    unittest.main()
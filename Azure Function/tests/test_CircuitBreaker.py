@@ -0,0 +1,92 @@
+import os
+import sys
+import threading
+import unittest
+
+_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, _ROOT)
+sys.path.insert(0, os.path.join(_ROOT, 'benchmarks'))
+
+from engine.Recognition import CircuitBreaker
+from engine.Recognition import ConnectionPool
+from engine.Recognition import Metrics
+from engine.Recognition import RateLimiter
+from engine.Recognition import RecognitionTransport
+from MockRecognitionServer import MockRecognitionServer, MockRecognitionService
+
+
+class _RecordingSink:
+
+    def __init__(self):
+        self.records = []
+
+    def record(self, name, value):
+        self.records.append((name, value))
+
+    def get_states(self):
+        return [value for name, value in self.records if name == Metrics.CIRCUIT_STATE]
+
+
+class DefaultBreakerMetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.service = MockRecognitionService(latency=0, processing_time=0, error_rate=1.0)
+        self.server = MockRecognitionServer(self.service).start()
+        RateLimiter.configure_rate_limit('circuit-test', 100000)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_state_changes_reach_every_transport_sink(self):
+        sinks = [_RecordingSink(), _RecordingSink()]
+        transports = [RecognitionTransport.RecognitionTransport(
+            'circuit-test', connection_pool=ConnectionPool.ConnectionPool(),
+            metrics_sink=sink, max_retries=0) for sink in sinks]
+        for attempt in range(20):
+            try:
+                transports[attempt % 2].send_request(
+                    'GET', self.server.get_base_uri(), '/spid/v1.0/identificationProfiles',
+                    'application/json')
+            except CircuitBreaker.CircuitOpenError:
+                break
+        else:
+            self.fail('the circuit did not open')
+        open_value = CircuitBreaker._STATE_VALUES[CircuitBreaker.STATE_OPEN]
+        for sink in sinks:
+            self.assertEqual(sink.get_states(), [open_value])
+
+
+class SlowCallTest(unittest.TestCase):
+
+    def setUp(self):
+        self.service = MockRecognitionService(latency=0, jitter=0, processing_time=0)
+        self.server = MockRecognitionServer(self.service).start()
+        RateLimiter.configure_rate_limit('circuit-test', 100000)
+        self.pool = ConnectionPool.ConnectionPool(max_connections_per_host=1)
+        self.breaker = CircuitBreaker.CircuitBreaker(slow_call_seconds=0.2, minimum_calls=1)
+        self.transport = RecognitionTransport.RecognitionTransport(
+            'circuit-test', connection_pool=self.pool, circuit_breaker=self.breaker)
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_waiting_for_a_pooled_connection_is_not_slow(self):
+        host = self.server.get_base_uri()
+        conn, _ = self.pool.acquire(host)
+        releaser = threading.Timer(0.4, self.pool.release, (host, conn))
+        releaser.start()
+        self.addCleanup(releaser.cancel)
+
+        res, _ = self.transport.send_request(
+            'GET', host, '/spid/v1.0/identificationProfiles', 'application/json')
+        self.assertEqual(res.status, 200)
+        stats = self.breaker.get_stats()
+        self.assertEqual((stats['calls'], stats['slow_calls']), (1, 0))
+        self.assertEqual(stats['state'], CircuitBreaker.STATE_CLOSED)
+
+
+if __name__ == '__main__':
+    unittest.main()
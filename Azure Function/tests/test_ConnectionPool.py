@@ -0,0 +1,86 @@
+import json
+import os
+import socket
+import sys
+import threading
+import unittest
+
+_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, _ROOT)
+sys.path.insert(0, os.path.join(_ROOT, 'benchmarks'))
+
+from engine.Recognition import ConnectionPool
+from MockRecognitionServer import MockRecognitionServer, MockRecognitionService
+
+_PROFILES_URI = '/spid/v1.0/identificationProfiles'
+
+
+class ConnectionPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.service = MockRecognitionService(latency=0, jitter=0, seed=1)
+        self.server = MockRecognitionServer(self.service).start()
+        self.host = self.server.get_base_uri()
+        self.pool = ConnectionPool.ConnectionPool(max_connections_per_host=2)
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def create_profile(self):
+        res, message = self.pool.request(
+            self.host, 'POST', _PROFILES_URI, json.dumps({'locale': 'en-us'}),
+            {'Content-Type': 'application/json'})
+        self.assertEqual(res.status, 200)
+        return json.loads(message)['identificationProfileId']
+
+    def test_connections_are_reused(self):
+        for _ in range(5):
+            self.create_profile()
+        stats = self.pool.get_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (4, 1))
+        self.assertEqual((stats['idle'], stats['open']), (1, 1))
+
+    def test_acquire_blocks_at_the_limit_until_a_release(self):
+        first, _ = self.pool.acquire(self.host)
+        self.pool.acquire(self.host)
+        acquired = []
+        waiter = threading.Thread(target=lambda: acquired.append(self.pool.acquire(self.host)))
+        waiter.start()
+        waiter.join(0.2)
+        self.assertTrue(waiter.is_alive())
+
+        self.pool.release(self.host, first)
+        waiter.join(5)
+        self.assertFalse(waiter.is_alive())
+        self.assertEqual(acquired, [(first, True)])
+
+    def test_stale_connection_is_reconnected_and_the_request_sent_once(self):
+        self.create_profile()
+        # The server closing the kept-alive socket
+        [(conn, _)] = self.pool._idle[self.host]
+        conn.sock.shutdown(socket.SHUT_RDWR)
+
+        self.create_profile()
+        self.assertEqual(self.pool.get_stats()['reconnects'], 1)
+        self.assertEqual(self.service.get_counts(), {200: 2})
+
+    def test_streamed_response_releases_its_connection_when_closed(self):
+        self.create_profile()
+        res, message = self.pool.request(self.host, 'GET', _PROFILES_URI, stream=True)
+        self.assertIsNone(message)
+        self.assertEqual(self.pool.get_stats()['idle'], 0)
+        self.assertEqual(len(json.loads(res.read().decode('utf-8'))), 1)
+        res.close()
+        self.assertEqual(self.pool.get_stats()['idle'], 1)
+
+        res, _ = self.pool.request(self.host, 'GET', _PROFILES_URI, stream=True)
+        res.close()
+        # Closed before its body was read, the connection cannot be reused
+        stats = self.pool.get_stats()
+        self.assertEqual((stats['idle'], stats['open']), (0, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
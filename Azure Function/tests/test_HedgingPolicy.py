@@ -0,0 +1,87 @@
+import os
+import sys
+import time
+import unittest
+
+_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, _ROOT)
+sys.path.insert(0, os.path.join(_ROOT, 'benchmarks'))
+
+from engine.Identification.IdentificationServiceHttpClientHelper import \
+    IdentificationServiceHttpClientHelper
+from engine.Recognition import ConnectionPool
+from engine.Recognition import HedgingPolicy
+from engine.Recognition import OperationPoller
+from engine.Recognition import RateLimiter
+from HelperLoadBenchmark import make_audio
+from MockRecognitionServer import MockRecognitionServer, MockRecognitionService
+
+
+class HedgingPolicyTest(unittest.TestCase):
+
+    def test_budget_caps_hedges(self):
+        policy = HedgingPolicy.HedgingPolicy(budget_ratio=0.25, max_burst=1)
+        hedged = 0
+        for _ in range(20):
+            policy.start_request()
+            hedged += policy.acquire_hedge()
+        self.assertEqual(hedged, 5)
+        stats = policy.get_stats()
+        self.assertEqual((stats['hedged'], stats['over_budget']), (5, 15))
+
+    def test_delay_follows_the_latencies(self):
+        policy = HedgingPolicy.HedgingPolicy(
+            percentile=0.9, initial_delay=5, min_delay=0.01, min_samples=10)
+        self.assertEqual(policy.start_request(), 5)
+        for latency in range(1, 11):
+            policy.record(latency / 10.0)
+        self.assertAlmostEqual(policy.start_request(), 0.9, delta=0.1)
+
+
+class HedgedIdentificationTest(unittest.TestCase):
+    """Every identification is slower than the hedging delay against the mock server."""
+
+    _SUBSCRIPTION_KEY = 'hedging-test'
+
+    def setUp(self):
+        RateLimiter.configure_rate_limit(self._SUBSCRIPTION_KEY, 100000)
+        self.service = MockRecognitionService(latency=0, jitter=0, processing_time=0.3)
+        self.server = MockRecognitionServer(self.service).start()
+        self.pool = ConnectionPool.ConnectionPool()
+        self.policy = HedgingPolicy.HedgingPolicy(
+            initial_delay=0.05, min_delay=0.05, budget_ratio=0.25, max_burst=1)
+        self.helper = IdentificationServiceHttpClientHelper(
+            self._SUBSCRIPTION_KEY, connection_pool=self.pool,
+            polling_policy=OperationPoller.PollingPolicy(
+                initial_delay=0.05, multiplier=1, max_delay=0.05, jitter=0),
+            base_uri=self.server.get_base_uri(), hedging_policy=self.policy)
+        self.profile_ids = [self.helper.create_profile('en-us').get_profile_id()]
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_hedges_are_capped_and_losers_abandoned(self):
+        for seed in range(8):
+            self.helper.identify_file(make_audio(seed), self.profile_ids, True)
+        stats = self.policy.get_stats()
+        # Every request earns a quarter of a hedge
+        self.assertEqual(stats['hedged'], 2)
+        self.assertEqual(stats['over_budget'], 6)
+
+        # The losing requests stop polling, so their operations are never seen finished,
+        # and give their connections back clean
+        time.sleep(0.6)
+        operations = list(self.service._operations.values())
+        self.assertEqual(len(operations), 10)
+        self.assertEqual(sum(operation['result'] is None for operation in operations), 2)
+        pool_stats = self.pool.get_stats()
+        self.assertEqual(pool_stats['idle'], pool_stats['open'])
+        self.assertEqual(self.service.get_counts().keys(), {200, 202})
+        self.helper.identify_file(make_audio(99), self.profile_ids, True)
+        self.assertEqual(self.pool.get_stats()['reconnects'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from engine.Identification.IdentificationResponse import IdentificationResponse
+from engine.Identification.IdentificationResultCache import IdentificationResultCache, \
+    TableResultCacheBackend
+
+_PROFILE_IDS = ['profile-a', 'profile-b']
+
+
+def response(profile_id):
+    return IdentificationResponse({'identifiedProfileId': profile_id, 'confidence': 'High'})
+
+
+class _RecordingTableService:
+    """Records the query filters and deleted rows of a table without any entity."""
+
+    def __init__(self):
+        self.filters = []
+        self.index_rows = []
+
+    def create_table(self, table_name):
+        pass
+
+    def query_entities(self, table_name, filter, select=None):
+        self.filters.append(filter)
+        return self.index_rows if filter.startswith("PartitionKey eq 'profile-") else []
+
+    def delete_entity(self, table_name, partition_key, row_key):
+        pass
+
+
+class IdentificationResultCacheTest(unittest.TestCase):
+
+    def test_hit_ignores_the_candidate_order(self):
+        cache = IdentificationResultCache()
+        cache.put(cache.get_key(b'audio', _PROFILE_IDS), _PROFILE_IDS, response('profile-a'))
+        hit = cache.get(cache.get_key(b'audio', list(reversed(_PROFILE_IDS))))
+        self.assertEqual(hit.get_identified_profile_id(), 'profile-a')
+        self.assertIsNone(cache.get(cache.get_key(b'other audio', _PROFILE_IDS)))
+        self.assertEqual(cache.get_stats()['hits'], 1)
+
+    def test_result_expires(self):
+        cache = IdentificationResultCache(ttl=0.05)
+        key = cache.get_key(b'audio', _PROFILE_IDS)
+        cache.put(key, _PROFILE_IDS, response('profile-a'))
+        time.sleep(0.1)
+        self.assertIsNone(cache.get(key))
+        self.assertEqual(cache.get_stats()['entries'], 0)
+
+    def test_invalidation_drops_the_results_of_the_profile(self):
+        cache = IdentificationResultCache()
+        cache.put(cache.get_key(b'audio', _PROFILE_IDS), _PROFILE_IDS, response('profile-a'))
+        cache.put(cache.get_key(b'audio', ['profile-c']), ['profile-c'], response('profile-c'))
+        cache.profile_enrolled('profile-b', 'Enrolled')
+        self.assertIsNone(cache.get(cache.get_key(b'audio', _PROFILE_IDS)))
+        self.assertIsNotNone(cache.get(cache.get_key(b'audio', ['profile-c'])))
+
+    def test_result_of_an_identification_overtaken_by_an_invalidation_is_dropped(self):
+        cache = IdentificationResultCache()
+        # The profile is enrolled while the identification is running
+        key = cache.get_key(b'audio', _PROFILE_IDS)
+        cache.invalidate_profile('profile-b')
+        cache.put(key, _PROFILE_IDS, response('profile-a'))
+        self.assertIsNone(cache.get(cache.get_key(b'audio', _PROFILE_IDS)))
+
+        key = cache.get_key(b'audio', _PROFILE_IDS)
+        cache.put(key, _PROFILE_IDS, response('profile-a'))
+        self.assertIsNotNone(cache.get(key))
+
+
+class TableResultCacheBackendTest(unittest.TestCase):
+
+    def test_quotes_are_escaped_in_filters(self):
+        table_service = _RecordingTableService()
+        table_service.index_rows = [{'RowKey': "it's"}]
+        backend = TableResultCacheBackend(table_service)
+        backend.get("o'hash", 'audio')
+        backend.invalidate_profile("o'brien")
+        self.assertEqual(table_service.filters, [
+            "PartitionKey eq 'o''hash' and RowKey eq 'audio'",
+            "PartitionKey eq 'profile-o''brien'",
+            "PartitionKey eq 'it''s'"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from engine.Identification.IdentificationResponse import IdentificationResponse
+from engine.Identification.IdentificationServiceHttpClientHelper import \
+    IdentificationServiceHttpClientHelper
+from engine.Recognition import RecognitionTransport
+
+_NO_MATCH_PROFILE_ID = '00000000-0000-0000-0000-000000000000'
+
+
+def response(profile_id, confidence):
+    return IdentificationResponse({'identifiedProfileId': profile_id, 'confidence': confidence})
+
+
+class ShardedIdentificationTest(unittest.TestCase):
+    """Identifies against 30 candidates, 3 shards of 10, with the shard requests stubbed."""
+
+    def setUp(self):
+        self.helper = IdentificationServiceHttpClientHelper(
+            'key', base_uri='http://127.0.0.1:9')
+        self.profile_ids = ['profile-{0:02d}'.format(index) for index in range(30)]
+        self.shard_results = {}
+        self.called = []
+        self.helper._identify = self.identify_shard
+
+    def identify_shard(self, body, shard, force_short_audio):
+        self.assertLessEqual(len(shard), 10)
+        self.called.append(shard[0])
+        result = self.shard_results[shard[0]]
+        if callable(result):
+            return result()
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def identify(self):
+        return self.helper.identify_file(b'audio', self.profile_ids, True)
+
+    def test_best_result_across_shards(self):
+        self.shard_results = {
+            'profile-00': response('profile-03', 'Low'),
+            'profile-10': response('profile-12', 'Normal'),
+            'profile-20': response(_NO_MATCH_PROFILE_ID, 'High')}
+        identified = self.identify()
+        self.assertEqual(identified.get_identified_profile_id(), 'profile-12')
+        self.assertEqual(sorted(self.called), ['profile-00', 'profile-10', 'profile-20'])
+
+    def test_high_confidence_match_returns_early(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def slow():
+            release.wait(10)
+            return response('profile-01', 'Normal')
+        self.shard_results = {
+            'profile-00': slow,
+            'profile-10': response('profile-15', 'High'),
+            'profile-20': slow}
+        started = time.monotonic()
+        identified = self.identify()
+        self.assertEqual(identified.get_identified_profile_id(), 'profile-15')
+        self.assertLess(time.monotonic() - started, 5)
+
+    def test_failed_shard_is_ignored_when_another_matches(self):
+        self.shard_results = {
+            'profile-00': RecognitionTransport.ServiceError('Error identifying file', 500),
+            'profile-10': response('profile-11', 'Normal'),
+            'profile-20': response(_NO_MATCH_PROFILE_ID, 'Low')}
+        self.assertEqual(self.identify().get_identified_profile_id(), 'profile-11')
+
+    def test_failed_shard_is_raised_without_a_match(self):
+        self.shard_results = {
+            'profile-00': RecognitionTransport.ServiceError('Error identifying file', 500),
+            'profile-10': response(_NO_MATCH_PROFILE_ID, 'Normal'),
+            'profile-20': response(_NO_MATCH_PROFILE_ID, 'Low')}
+        with self.assertRaises(RecognitionTransport.ServiceError):
+            self.identify()
+
+
+if __name__ == '__main__':
+    unittest.main()
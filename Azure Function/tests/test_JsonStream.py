@@ -0,0 +1,86 @@
+import io
+import os
+import sys
+import unittest
+
+_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, _ROOT)
+sys.path.insert(0, os.path.join(_ROOT, 'benchmarks'))
+
+from engine.Identification.IdentificationServiceHttpClientHelper import \
+    IdentificationServiceHttpClientHelper
+from engine.Recognition import ConnectionPool
+from engine.Recognition import JsonStream
+from engine.Recognition import RateLimiter
+from MockRecognitionServer import MockRecognitionServer, MockRecognitionService
+
+
+class IterArrayTest(unittest.TestCase):
+
+    def parse(self, text, chunk_size=1):
+        return list(JsonStream.iter_array(io.BytesIO(text.encode('utf-8')), chunk_size))
+
+    def test_elements_split_between_chunks(self):
+        text = ' [ {"a": "été", "b": [1, 2]}, 1.5e-7 , 12, "x,]" , null ] \n'
+        for chunk_size in (1, 2, 3, 7, 64):
+            self.assertEqual(self.parse(text, chunk_size),
+                             [{'a': 'été', 'b': [1, 2]}, 1.5e-7, 12, 'x,]', None])
+
+    def test_empty_array(self):
+        self.assertEqual(self.parse('[ ]'), [])
+
+    def test_reads_the_stream_to_its_end(self):
+        stream = io.BytesIO(b'[1, 2]   \n')
+        self.assertEqual(list(JsonStream.iter_array(stream, 2)), [1, 2])
+        self.assertEqual(stream.read(), b'')
+
+    def test_rejects_data_after_the_array(self):
+        with self.assertRaises(Exception):
+            self.parse('[1] 2')
+
+    def test_rejects_a_truncated_array(self):
+        with self.assertRaises(Exception):
+            self.parse('[1, 2')
+
+    def test_rejects_other_values(self):
+        with self.assertRaises(Exception):
+            self.parse('{"a": 1}')
+
+
+class StreamedListingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = MockRecognitionServer(
+            MockRecognitionService(latency=0, jitter=0, seed=1)).start()
+        RateLimiter.configure_rate_limit('test', 1000)
+        self.pool = ConnectionPool.ConnectionPool()
+        self.helper = IdentificationServiceHttpClientHelper(
+            'test', connection_pool=self.pool, base_uri=self.server.get_base_uri())
+        self.profile_ids = set(self.helper.create_profile('en-us').get_profile_id()
+                               for _ in range(5))
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_listing_reuses_the_connection(self):
+        for _ in range(3):
+            profiles = list(self.helper.iter_all_profiles())
+            self.assertEqual(set(profile.get_profile_id() for profile in profiles),
+                             self.profile_ids)
+            stats = self.pool.get_stats()
+            self.assertEqual((stats['idle'], stats['open']), (1, 1))
+        self.assertEqual(self.pool.get_stats()['misses'], 1)
+
+    def test_abandoned_listing_releases_the_connection(self):
+        profiles = self.helper.iter_all_profiles()
+        next(profiles)
+        profiles.close()
+        stats = self.pool.get_stats()
+        self.assertEqual(stats['idle'], stats['open'])
+        self.assertEqual(len(list(self.helper.iter_all_profiles())), len(self.profile_ids))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from engine.Recognition import OperationJournal
+
+
+class PurgeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.journal = OperationJournal.OperationJournal(
+            OperationJournal.SqliteOperationJournalBackend(':memory:'), owner='test')
+        self.succeeded = self.journal.record_pending('https://host/operations/1', 'enrollment')
+        self.failed = self.journal.record_pending('https://host/operations/2', 'enrollment')
+        self.pending = self.journal.record_pending('https://host/operations/3', 'enrollment')
+        self.journal.complete(self.succeeded, {'enrollmentStatus': 'Enrolled'})
+        self.journal.fail(self.failed, 'Invalid audio')
+
+    def test_recent_operations_are_kept(self):
+        self.assertEqual(self.journal.purge(), 0)
+        self.assertIsNotNone(self.journal.get(self.succeeded))
+
+    def test_only_finished_operations_are_removed(self):
+        self.assertEqual(self.journal.purge(older_than=-1), 2)
+        self.assertIsNone(self.journal.get(self.succeeded))
+        self.assertIsNone(self.journal.get(self.failed))
+        self.assertEqual([record.get_operation_id() for record in self.journal.list_pending()],
+                         [self.pending])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, _ROOT)
+sys.path.insert(0, os.path.join(_ROOT, 'benchmarks'))
+
+from engine.Recognition import ProfileBatch
+from engine.Recognition import RateLimiter
+from HelperLoadBenchmark import make_audio
+from MockRecognitionServer import MockRecognitionServer, MockRecognitionService
+
+_SUBSCRIPTION_KEY = 'profile-batch-test'
+_MISSING_PROFILE_ID = '00000000-0000-0000-0000-000000000000'
+
+
+class ParseArgsTest(unittest.TestCase):
+
+    def assert_usage_error(self, argv):
+        with contextlib.redirect_stderr(io.StringIO()):
+            with self.assertRaises(SystemExit) as context:
+                ProfileBatch.parse_args(argv)
+        self.assertEqual(context.exception.code, 2)
+
+    def test_defaults(self):
+        args = ProfileBatch.parse_args(['key', 'delete'])
+        self.assertEqual((args.service, args.concurrency, args.max_attempts, args.input),
+                         ('identification', 8, 3, None))
+
+    def test_invalid_command_lines(self):
+        self.assert_usage_error(['key', 'rename'])
+        self.assert_usage_error(['key', 'delete', '--concurrency', '0'])
+        self.assert_usage_error(['key', 'delete', '--count', '3'])
+        self.assert_usage_error(['key', 'enroll', '--input', 'manifest.csv'])
+        self.assert_usage_error(['key', 'enroll', '--checkpoint', 'checkpoint.jsonl'])
+
+
+class MainTest(unittest.TestCase):
+
+    def setUp(self):
+        RateLimiter.configure_rate_limit(_SUBSCRIPTION_KEY, 100000)
+        self.server = MockRecognitionServer(MockRecognitionService(
+            latency=0, jitter=0, processing_time=0)).start()
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.directory.cleanup()
+
+    def main(self, *argv, lines=()):
+        input_path = os.path.join(self.directory.name, 'input.txt')
+        with open(input_path, 'w') as stream:
+            stream.write(''.join(line + '\n' for line in lines))
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(io.StringIO()):
+            status = ProfileBatch.main(
+                [_SUBSCRIPTION_KEY] + list(argv) +
+                ['--base-uri', self.server.get_base_uri(), '--input', input_path,
+                 '--max-attempts', '1'])
+        return status, [json.loads(line) for line in output.getvalue().splitlines()]
+
+    def create_profiles(self, count):
+        status, results = self.main('create', '--count', str(count))
+        self.assertEqual(status, 0)
+        return [result['result']['profile_id'] for result in results]
+
+    def test_delete_of_missing_profiles_succeeds(self):
+        profile_ids = self.create_profiles(3)
+        status, results = self.main('delete', lines=profile_ids + [_MISSING_PROFILE_ID])
+        self.assertEqual(status, 0)
+        self.assertEqual(sorted(result['input'] for result in results),
+                         sorted(profile_ids + [_MISSING_PROFILE_ID]))
+
+    def test_failed_operation_exits_with_1(self):
+        profile_ids = self.create_profiles(2)
+        status, results = self.main('reset', lines=profile_ids + [_MISSING_PROFILE_ID])
+        self.assertEqual(status, 1)
+        failed = [result for result in results if not result['ok']]
+        self.assertEqual([result['input'] for result in failed], [_MISSING_PROFILE_ID])
+
+    def test_enroll_resumes_from_its_checkpoint(self):
+        [profile_id] = self.create_profiles(1)
+        audio_path = os.path.join(self.directory.name, 'audio.wav')
+        with open(audio_path, 'wb') as audio:
+            audio.write(make_audio(1))
+        manifest = ['{0},{1}'.format(profile_id, audio_path), 'new,{0}'.format(audio_path)]
+        checkpoint = os.path.join(self.directory.name, 'checkpoint.jsonl')
+
+        status, [result] = self.main('enroll', '--checkpoint', checkpoint, lines=manifest)
+        self.assertEqual(status, 0)
+        self.assertEqual(result['result']['succeeded'], 2)
+        status, [result] = self.main('enroll', '--checkpoint', checkpoint, lines=manifest)
+        self.assertEqual(status, 0)
+        self.assertEqual(result['result']['skipped'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from engine.Identification.IdentificationProfile import IdentificationProfile
+from engine.Identification.ProfileCache import ProfileCache
+
+
+class _ListingHelper:
+    """Lists the given profiles, failing after fail_after of them if set."""
+
+    def __init__(self):
+        self.profiles = []
+        self.fail_after = None
+
+    def add_profile_listener(self, listener):
+        pass
+
+    def iter_all_profiles(self):
+        for index, (profile_id, enrollment_status) in enumerate(self.profiles):
+            yield IdentificationProfile({
+                'identificationProfileId': profile_id,
+                'locale': 'en-us',
+                'enrollmentStatus': enrollment_status})
+            if index + 1 == self.fail_after:
+                raise Exception('Error getting all profiles: connection reset')
+
+
+class ProfileCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.helper = _ListingHelper()
+        self.cache = ProfileCache(self.helper)
+
+    def test_refresh_failing_partway_keeps_the_enrolled_ids_current(self):
+        # Fails once every profile was read, e.g. on the end of the response, so the next
+        # refresh finds nothing new
+        self.helper.profiles = [('a', 'Enrolled')]
+        self.helper.fail_after = 1
+        with self.assertRaises(Exception):
+            self.cache.get_enrolled_profile_ids()
+
+        self.helper.fail_after = None
+        self.cache.invalidate()
+        self.assertEqual(self.cache.get_enrolled_profile_ids(), ['a'])
+
+    def test_partial_refresh_is_retried(self):
+        self.helper.profiles = [('a', 'Enrolled'), ('b', 'Enrolling')]
+        self.helper.fail_after = 1
+        with self.assertRaises(Exception):
+            self.cache.get_enrolled_profile_ids()
+        self.helper.fail_after = None
+        self.assertEqual(self.cache.get_enrolled_profile_ids(), ['a'])
+        self.assertEqual(self.cache.get_enrollment_status('b'), 'Enrolling')
+
+    def test_listener_events_update_the_enrolled_ids(self):
+        self.helper.profiles = [('a', 'Enrolled')]
+        self.assertEqual(self.cache.get_enrolled_profile_ids(), ['a'])
+        self.cache.profile_enrolled('b', 'Enrolled')
+        self.cache.profile_reset('a')
+        self.assertEqual(self.cache.get_enrolled_profile_ids(), ['b'])
+        self.cache.profile_deleted('b')
+        self.assertEqual(self.cache.get_enrolled_profile_ids(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import os
+import queue
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from engine.Recognition import BulkRunner
+from engine.Recognition import ProfileReconciler
+
+_OLD = '2020-01-01T00:00:00.000Z'
+
+
+class _Profile:
+
+    def __init__(self, profile_id, enrollment_status='Enrolled', created=_OLD):
+        self._profile_id = profile_id
+        self._enrollment_status = enrollment_status
+        self._created = created
+
+    def get_profile_id(self):
+        return self._profile_id
+
+    def get_enrollment_status(self):
+        return self._enrollment_status
+
+    def get_created_date_time(self):
+        return self._created
+
+
+class _Helper:
+    """Stands in for a service helper holding profiles in memory."""
+
+    def __init__(self, profiles):
+        self.profiles = {profile.get_profile_id(): profile for profile in profiles}
+        self._created = 0
+
+    def iter_all_profiles(self):
+        return iter(list(self.profiles.values()))
+
+    def delete_many(self, profile_ids, concurrency, max_attempts):
+        return BulkRunner.summarize(BulkRunner.run_bounded(
+            lambda profile_id: self.profiles.pop(profile_id), profile_ids, concurrency))
+
+    def create_profile(self, locale):
+        self._created += 1
+        profile = _Profile('new-{0}'.format(self._created), 'Enrolling', None)
+        self.profiles[profile.get_profile_id()] = profile
+        return profile
+
+
+class ProfileReconcilerTest(unittest.TestCase):
+
+    def test_drift_is_repaired(self):
+        helper = _Helper([_Profile('p1'), _Profile('p2', 'Enrolling'), _Profile('orphan'),
+                          _Profile('recent', created='2999-01-01T00:00:00.000Z')])
+        enrollments = queue.Queue()
+        summary = ProfileReconciler.ProfileReconciler(
+            helper, enrollments, max_orphan_ratio=1).reconcile(
+                {'u1': 'p1', 'u2': 'p2', 'u3': 'missing', 'u4': None})
+
+        self.assertEqual(summary['deleted'], 1)
+        self.assertNotIn('orphan', helper.profiles)
+        self.assertIn('recent', helper.profiles)
+        self.assertEqual(sorted(summary['recreated']), ['u3', 'u4'])
+        queued = sorted(enrollments.get_nowait() for _ in range(enrollments.qsize()))
+        self.assertEqual(queued, sorted([('u2', 'p2')] + list(summary['recreated'].items())))
+        self.assertEqual(summary['failed'], 0)
+
+    def test_too_many_orphans_repairs_nothing(self):
+        helper = _Helper([_Profile('p{0}'.format(index)) for index in range(10)])
+        with self.assertRaises(ProfileReconciler.ReconciliationAbortedError):
+            ProfileReconciler.ProfileReconciler(helper).reconcile({'u1': 'p1'})
+        self.assertEqual(len(helper.profiles), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
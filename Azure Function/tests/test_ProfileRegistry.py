@@ -0,0 +1,72 @@
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from engine.Identification.IdentificationProfile import IdentificationProfile
+from engine.Identification.ProfileRegistry import ProfileRegistry
+
+
+def profile(profile_id, enrollment_status='Enrolled', last_action='2024-01-01T00:00:00.000Z'):
+    return IdentificationProfile({
+        'identificationProfileId': profile_id,
+        'locale': 'en-us',
+        'enrollmentStatus': enrollment_status,
+        'lastActionDateTime': last_action})
+
+
+class ProfileRegistryRefreshTest(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = ProfileRegistry()
+        self.registry.refresh([profile('a'), profile('b'), profile('c', 'Enrolling')])
+
+    def test_refresh_applies_the_diff(self):
+        counts = self.registry.refresh([
+            profile('a'),
+            profile('c', 'Enrolled', '2024-01-02T00:00:00.000Z'),
+            profile('d', 'Enrolling')])
+        self.assertEqual(counts, (1, 1, 1))
+        self.assertEqual(self.registry.get_profile_ids(), {'a', 'c', 'd'})
+        self.assertEqual(self.registry.get_profile_ids('Enrolled'), {'a', 'c'})
+        self.assertEqual(self.registry.get_profile_ids('Enrolling'), {'d'})
+        self.assertEqual(self.registry.get_profile_ids_by_last_action(), ['a', 'd', 'c'])
+
+    def test_unchanged_listing_is_no_change(self):
+        counts = self.registry.refresh([profile('a'), profile('b'), profile('c', 'Enrolling')])
+        self.assertEqual(counts, (0, 0, 0))
+
+    def test_listing_larger_than_a_batch(self):
+        ids = ['profile-{0:04d}'.format(index) for index in range(1200)]
+        self.assertEqual(self.registry.refresh(profile(i) for i in ids), (1200, 0, 3))
+        self.assertEqual(len(self.registry), 1200)
+
+    def test_lookups_are_not_blocked_while_listing(self):
+        looked_up = []
+
+        def listing():
+            yield profile('a')
+            # Another thread reading the registry while the listing is downloaded
+            reader = threading.Thread(
+                target=lambda: looked_up.append(self.registry.get_enrollment_status('c')))
+            reader.start()
+            reader.join(5)
+            yield profile('b')
+        self.registry.refresh(listing())
+        self.assertEqual(looked_up, ['Enrolling'])
+
+    def test_profile_registered_during_the_refresh_is_kept(self):
+        def listing():
+            yield profile('a')
+            writer = threading.Thread(
+                target=self.registry.set_enrollment_status, args=('e', 'Enrolling'))
+            writer.start()
+            writer.join(5)
+        self.assertEqual(self.registry.refresh(listing()), (0, 0, 2))
+        self.assertEqual(self.registry.get_profile_ids(), {'a', 'e'})
+
+
+if __name__ == '__main__':
+    unittest.main()
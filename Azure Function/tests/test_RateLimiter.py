@@ -0,0 +1,26 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from engine.Recognition import RateLimiter
+
+
+class ConfigureRateLimitTest(unittest.TestCase):
+
+    def test_existing_limiter_is_updated_in_place(self):
+        limiter = RateLimiter.get_rate_limiter('test-in-place')
+        self.assertIs(RateLimiter.configure_rate_limit('test-in-place', 1000, 50), limiter)
+        # At the default 10 per second this would wait for seconds
+        self.assertLess(sum(limiter.acquire() for _ in range(60)), 0.5)
+
+    def test_lower_burst_drops_the_extra_tokens(self):
+        limiter = RateLimiter.configure_rate_limit('test-lower-burst', 100, 100)
+        RateLimiter.configure_rate_limit('test-lower-burst', 2, 1)
+        self.assertEqual(limiter.acquire(), 0.0)
+        self.assertGreater(limiter.acquire(), 0.3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import os
+import sys
+import unittest
+
+_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, _ROOT)
+sys.path.insert(0, os.path.join(_ROOT, 'benchmarks'))
+
+from engine.Identification.IdentificationServiceHttpClientHelper import \
+    IdentificationServiceHttpClientHelper
+from engine.Recognition import ConnectionPool
+from engine.Recognition import OperationPoller
+from engine.Recognition import RateLimiter
+from engine.Recognition import RecognitionTransport
+from engine.Recognition.RegionRouter import RegionRouter
+from MockRecognitionServer import MockRecognitionServer, MockRecognitionService
+
+
+class _RegionHelper:
+    """Stands in for the helper of a region owning some profiles."""
+
+    def __init__(self, profile_ids, error=None):
+        self._profile_ids = profile_ids
+        self._error = error
+
+    def get_profile(self, profile_id):
+        if self._error is not None:
+            raise self._error
+        if profile_id not in self._profile_ids:
+            raise RecognitionTransport.ServiceError('Error getting profile: not found', 404)
+        return profile_id
+
+
+class RegionRouterTest(unittest.TestCase):
+
+    def create_router(self, helpers):
+        return RegionRouter(
+            [(name, name + '.test', 'key') for name in helpers],
+            lambda subscription_key, base_uri, metrics_sink: helpers[base_uri[:-len('.test')]])
+
+    def test_profile_found_after_not_found_regions(self):
+        router = self.create_router({
+            'west': _RegionHelper([]), 'east': _RegionHelper(['p1'])})
+        self.assertEqual(router.get_profile_region('p1'), 'east')
+        stats = router.get_stats()
+        self.assertEqual(stats['west']['error_rate'], 0.0)
+        self.assertEqual(stats['east']['profiles'], 1)
+
+    def test_profile_in_no_region(self):
+        router = self.create_router({'west': _RegionHelper([]), 'east': _RegionHelper([])})
+        with self.assertRaises(Exception):
+            router.get_profile_region('p1')
+        self.assertEqual(router.get_stats()['west']['error_rate'], 0.0)
+
+    def test_failing_region_is_penalized_and_its_error_raised(self):
+        error = ConnectionResetError('reset')
+        router = self.create_router({
+            'west': _RegionHelper(['p1'], error), 'east': _RegionHelper(['p1'])})
+        with self.assertRaises(ConnectionResetError):
+            router.get_profile_region('p1')
+        self.assertGreater(router.get_stats()['west']['error_rate'], 0.0)
+
+    def test_rejected_creation_does_not_fail_over(self):
+        helpers = {'west': _RegionHelper([]), 'east': _RegionHelper([])}
+        created = []
+
+        def create_profile(locale):
+            created.append(locale)
+            raise RecognitionTransport.ServiceError('Error creating profile: bad locale', 400)
+        for helper in helpers.values():
+            helper.create_profile = create_profile
+        with self.assertRaises(RecognitionTransport.ServiceError):
+            self.create_router(helpers).create_profile('xx-xx')
+        self.assertEqual(created, ['xx-xx'])
+
+    def test_rejected_call_is_not_penalized(self):
+        router = self.create_router({'west': _RegionHelper(['p1'])})
+
+        def reject(helper):
+            raise RecognitionTransport.ServiceError('Error enrolling: bad audio', 400)
+        with self.assertRaises(RecognitionTransport.ServiceError):
+            router.call_profile('p1', reject)
+        self.assertEqual(router.get_stats()['west']['error_rate'], 0.0)
+
+
+
+class RejectedRequestsTest(unittest.TestCase):
+    """Requests the mock service rejects with 400 through the real helpers."""
+
+    _SUBSCRIPTION_KEY = 'region-router-test'
+    _NOT_AUDIO = b'not a wav file' * 100
+
+    def setUp(self):
+        RateLimiter.configure_rate_limit(self._SUBSCRIPTION_KEY, 100000)
+        self.servers = [MockRecognitionServer(MockRecognitionService(
+            latency=0, jitter=0, processing_time=0.01)).start() for _ in range(2)]
+        self.router = RegionRouter(
+            [('region{0}'.format(index), server.get_base_uri(), self._SUBSCRIPTION_KEY)
+             for index, server in enumerate(self.servers)],
+            lambda subscription_key, base_uri, metrics_sink:
+                IdentificationServiceHttpClientHelper(
+                    subscription_key, connection_pool=ConnectionPool.ConnectionPool(),
+                    polling_policy=OperationPoller.PollingPolicy(initial_delay=0.01),
+                    base_uri=base_uri, metrics_sink=metrics_sink))
+
+    def tearDown(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+
+    def test_rejected_enrollment_and_identification_keep_the_region_healthy(self):
+        profile_id = self.router.create_profile('en-us').get_profile_id()
+        region_name = self.router.get_profile_region(profile_id)
+
+        with self.assertRaises(RecognitionTransport.ServiceError) as context:
+            self.router.call_profile(
+                profile_id, lambda helper: helper.enroll_profile(profile_id, self._NOT_AUDIO))
+        self.assertEqual(context.exception.get_status(), 400)
+        [(_, _, error)] = self.router.call_profiles(
+            [profile_id], lambda helper, ids: helper.identify_file(self._NOT_AUDIO, ids))
+        self.assertIsInstance(error, RecognitionTransport.ServiceError)
+        self.assertEqual(error.get_status(), 400)
+
+        stats = self.router.get_stats()[region_name]
+        self.assertEqual(stats['error_rate'], 0.0)
+        self.assertTrue(stats['healthy'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from engine.Recognition import AudioBody
+from engine.Recognition import AudioNormalizer
+from engine.Recognition import VoiceActivityDetector
+
+_SAMPLE_RATE = 16000
+
+
+class TrimTest(unittest.TestCase):
+
+    def test_long_silences_are_removed(self):
+        generator = np.random.RandomState(0)
+        silence = generator.normal(0, 0.001, 2 * _SAMPLE_RATE).astype(np.float32)
+        times = np.arange(_SAMPLE_RATE) / float(_SAMPLE_RATE)
+        speech = (0.3 * np.sin(2 * np.pi * 200 * times)).astype(np.float32)
+        samples = np.concatenate([silence, speech, silence, speech, silence])
+
+        trimmed, speech_seconds = VoiceActivityDetector.VoiceActivityDetector().trim(
+            samples, _SAMPLE_RATE)
+
+        self.assertAlmostEqual(speech_seconds, 2.0, delta=0.1)
+        # Both words and their padding are kept, the 2 second pauses are not
+        self.assertAlmostEqual(len(trimmed) / float(_SAMPLE_RATE), 2.8, delta=0.2)
+
+    def test_continuous_speech_is_kept(self):
+        times = np.arange(3 * _SAMPLE_RATE) / float(_SAMPLE_RATE)
+        # Syllables 4 times a second, down to a whisper between them
+        envelope = 0.01 + 0.3 * np.abs(np.sin(2 * np.pi * 2 * times))
+        samples = (envelope * np.sin(2 * np.pi * 200 * times)).astype(np.float32)
+
+        trimmed, speech_seconds = VoiceActivityDetector.VoiceActivityDetector().trim(
+            samples, _SAMPLE_RATE)
+
+        self.assertGreater(speech_seconds, 2.5)
+        self.assertEqual(len(trimmed), len(samples))
+
+    def test_silence_only(self):
+        samples = np.zeros(_SAMPLE_RATE, dtype=np.float32)
+        trimmed, speech_seconds = VoiceActivityDetector.VoiceActivityDetector().trim(
+            samples, _SAMPLE_RATE)
+        self.assertEqual(speech_seconds, 0)
+        self.assertEqual(len(trimmed), 0)
+
+
+
+class PrepareAudioTest(unittest.TestCase):
+
+    def test_audio_is_sent_unchanged_by_default(self):
+        self.assertEqual(AudioBody.prepare_audio('clip.wav'), 'clip.wav')
+
+    def test_audio_without_enough_speech_is_rejected(self):
+        silence = AudioNormalizer.encode_wav(np.zeros(_SAMPLE_RATE, dtype=np.float32),
+                                             _SAMPLE_RATE)
+        with self.assertRaises(Exception):
+            AudioBody.prepare_audio(
+                silence, True, VoiceActivityDetector.VoiceActivityDetector(), 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()